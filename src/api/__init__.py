@@ -0,0 +1,4 @@
+import time
+
+# When `import api.app` started, for the "import" phase of the startup report.
+IMPORT_STARTED = time.perf_counter()
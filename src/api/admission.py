@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+
+from fastapi import HTTPException, Request
+
+from api import metrics
+from api.setting import (
+    ADMISSION_API_KEY_PRIORITIES,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_MODEL_CONCURRENCY,
+    ADMISSION_PRIORITY_HEADER,
+    ADMISSION_QUEUE_TIMEOUT,
+)
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, highest first.
+PRIORITIES = ("high", "normal", "low")
+
+
+class Slot:
+    """An admitted call, to be released once it's done (released at most once)."""
+
+    def __init__(self, queue: "_ModelQueue | None" = None):
+        self._queue = queue
+        self._start = time.monotonic()
+
+    def release(self):
+        queue, self._queue = self._queue, None
+        if queue is not None:
+            queue.release(time.monotonic() - self._start)
+
+
+class _ModelQueue:
+    def __init__(self, model: str, limit: int, max_queue: int):
+        self.model = model
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        # (priority rank, arrival order, priority, future), the best waiter first
+        self.waiters: list[tuple[int, int, str, asyncio.Future]] = []
+        # EWMA of the time a slot is held, to estimate waits (0 until measured)
+        self.service_time = 0.0
+        # statistics
+        self.admitted = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.evicted = 0
+        self.waited = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def estimated_wait(self, position: int) -> float:
+        return self.service_time * (position // self.limit + 1)
+
+    def retry_after(self) -> int:
+        return max(1, math.ceil(self.estimated_wait(len(self.waiters))))
+
+    def release(self, held: float | None = None):
+        if held is not None:
+            self.service_time = 0.9 * self.service_time + 0.1 * held if self.service_time else held
+        self.active -= 1
+        while self.waiters:
+            *_, future = heapq.heappop(self.waiters)
+            if not future.done():
+                # the slot is handed over to the waiter
+                self.active += 1
+                future.set_result(None)
+                return
+
+    def remove(self, future: asyncio.Future):
+        self.waiters = [w for w in self.waiters if w[3] is not future]
+        heapq.heapify(self.waiters)
+
+    def collect(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": len(self.waiters),
+            "queue_depth_by_priority": {
+                priority: sum(1 for w in self.waiters if w[2] == priority) for priority in PRIORITIES
+            },
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "evicted": self.evicted,
+            "wait_avg_ms": round(self.wait_total / self.waited * 1000, 2) if self.waited else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+        }
+
+
+class AdmissionController:
+    """Per-model limit of concurrent upstream calls, with a bounded priority wait queue.
+
+    A call beyond the model's concurrency limit waits for a slot, behind the waiters of
+    higher priority classes, for at most `queue_timeout` seconds. Calls are rejected with
+    HTTP 429 and a Retry-After estimate, rather than queued, when:
+        - the queue is full, unless a waiter of a lower priority class can be evicted (and
+          rejected) to make room,
+        - the estimated wait (from the queue position and the average call duration)
+          exceeds the queue timeout.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 0,
+        max_queue: int = 100,
+        queue_timeout: float = 10.0,
+        model_limits: dict[str, int] | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.model_limits = model_limits or {}
+        self._queues: dict[str, _ModelQueue] = {}
+        self._order = itertools.count()
+
+    def _queue(self, model: str) -> _ModelQueue | None:
+        queue = self._queues.get(model)
+        if queue is None:
+            limit = self.model_limits.get(model, self.max_concurrency)
+            if limit <= 0:
+                # not limited
+                return None
+            queue = self._queues[model] = _ModelQueue(model, limit, self.max_queue)
+        return queue
+
+    def _reject(self, queue: _ModelQueue, reason: str) -> HTTPException:
+        queue.rejected += 1
+        logger.warning(f"Rejected a call to {queue.model}: {reason}")
+        return HTTPException(
+            status_code=429,
+            detail=f"Too many concurrent requests for {queue.model}, {reason}",
+            headers={"Retry-After": str(queue.retry_after())},
+        )
+
+    async def acquire(self, model: str, priority: str = "normal") -> Slot:
+        """Wait for a slot to call the model, raising HTTP 429 if the call is shed."""
+        queue = self._queue(model)
+        if queue is None:
+            return Slot()
+        if queue.active < queue.limit and not queue.waiters:
+            queue.active += 1
+            queue.admitted += 1
+            return Slot(queue)
+
+        rank = PRIORITIES.index(priority) if priority in PRIORITIES else PRIORITIES.index("normal")
+        ahead = sum(1 for w in queue.waiters if w[0] <= rank)
+        if queue.estimated_wait(ahead) > self.queue_timeout:
+            raise self._reject(queue, "estimated wait exceeds the queue timeout")
+        if len(queue.waiters) >= queue.max_queue:
+            lowest = max(queue.waiters, default=None)
+            if lowest is None or lowest[0] <= rank:
+                raise self._reject(queue, "queue is full")
+            # make room by shedding the most recent waiter of the lowest priority class
+            queue.remove(lowest[3])
+            queue.evicted += 1
+            lowest[3].set_exception(self._reject(queue, "evicted by a higher priority request"))
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(queue.waiters, (rank, next(self._order), priority, future))
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except BaseException as e:
+            if not (future.done() and not future.cancelled() and future.exception() is None):
+                queue.remove(future)
+                future.cancel()
+                if isinstance(e, asyncio.TimeoutError):
+                    queue.timeouts += 1
+                    raise self._reject(queue, "timed out in the queue")
+                raise
+            # handed a slot meanwhile
+            if not isinstance(e, asyncio.TimeoutError):
+                queue.release()
+                raise
+        finally:
+            wait = time.monotonic() - start
+            queue.waited += 1
+            queue.wait_total += wait
+            queue.wait_max = max(queue.wait_max, wait)
+        queue.admitted += 1
+        return Slot(queue)
+
+    def collect(self) -> dict:
+        return {model: queue.collect() for model, queue in self._queues.items()}
+
+
+controller = AdmissionController(
+    max_concurrency=ADMISSION_MAX_CONCURRENCY,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    model_limits=ADMISSION_MODEL_CONCURRENCY,
+)
+metrics.register("admission", controller.collect)
+
+
+def request_priority(request: Request) -> str:
+    """The priority class of a request, from its priority header or else its API key."""
+    priority = request.headers.get(ADMISSION_PRIORITY_HEADER, "").lower()
+    if priority in PRIORITIES:
+        return priority
+    if ADMISSION_API_KEY_PRIORITIES:
+        scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and credentials in ADMISSION_API_KEY_PRIORITIES:
+            return ADMISSION_API_KEY_PRIORITIES[credentials]
+    return "normal"
@@ -1,6 +1,7 @@
 import logging
 import os
-import uvicorn
+import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
@@ -8,9 +9,11 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import PlainTextResponse
 from mangum import Mangum
 
+from api import IMPORT_STARTED
 from api.setting import API_ROUTE_PREFIX, DESCRIPTION, SUMMARY, PROVIDER, TITLE, USE_MODEL_MAPPING, VERSION
 from api.modelmapper import load_model_map
-from api.routers.vertex import handle_proxy
+from api.routers import metrics
+from api.startup import run_initializers, startup_report
 
 def is_aws():
     env = os.getenv("AWS_EXECUTION_ENV")
@@ -39,12 +42,40 @@ config = {
     "version": VERSION,
 }
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Provider specific initialization runs concurrently here instead of at import time.
+    if provider == "aws":
+        from api.auth import get_api_key
+        from api.models import bedrock
+
+        await run_initializers({"api_key": get_api_key, "bedrock": bedrock.initialize})
+        await bedrock.model_catalog.start()
+    else:
+        from api.routers import vertex
+
+        vertex.open_http_client()
+        await run_initializers(
+            {"gcp_project": vertex.load_gcp_project, "gcp_token": vertex.token_provider.prefetch}
+        )
+    yield
+    if provider == "aws":
+        await bedrock.model_catalog.stop()
+        await bedrock.get_runtime().aclose()
+        await bedrock.image_fetcher.aclose()
+        bedrock.close_embedding_cache()
+        await bedrock.close_response_cache()
+    else:
+        await vertex.close_http_client()
+
+
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s",
 )
 
-app = FastAPI(**config)
+app = FastAPI(**config, lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -53,7 +84,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(metrics.router)
+
 if provider != "aws":
+    from api.routers.vertex import handle_proxy
     logging.info(f"Proxy target set to: GCP")
     @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "HEAD"])
     async def proxy(request: Request, path: str):
@@ -76,5 +110,9 @@ async def validation_exception_handler(request, exc):
 
 handler = Mangum(app)
 
+startup_report.record("import", time.perf_counter() - IMPORT_STARTED)
+
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run("app:app", host="0.0.0.0", port=int(os.getenv("PORT", 8000)), reload=True)
@@ -1,9 +1,8 @@
 import json
 import os
+import threading
 from typing import Annotated
 
-import boto3
-from botocore.exceptions import ClientError
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
@@ -12,33 +11,57 @@ from api.setting import DEFAULT_API_KEYS
 api_key_param = os.environ.get("API_KEY_PARAM_NAME")
 api_key_secret_arn = os.environ.get("API_KEY_SECRET_ARN")
 api_key_env = os.environ.get("OPENAI_API_KEY")
-if api_key_param:
-    # For backward compatibility.
-    # Please now use secrets manager instead.
-    ssm = boto3.client("ssm")
-    api_key = ssm.get_parameter(Name=api_key_param, WithDecryption=True)["Parameter"]["Value"]
-elif api_key_secret_arn:
-    sm = boto3.client("secretsmanager")
-    try:
-        response = sm.get_secret_value(SecretId=api_key_secret_arn)
-        if "SecretString" in response:
+
+_api_key: str | None = None
+_api_key_lock = threading.Lock()
+
+
+def load_api_key() -> str:
+    """Retrieve the API key from SSM, Secrets Manager or the environment."""
+    # boto3 is only imported when needed, it's not used by the GCP proxy.
+    import boto3
+    from botocore.exceptions import ClientError
+
+    if api_key_param:
+        # For backward compatibility.
+        # Please now use secrets manager instead.
+        ssm = boto3.session.Session().client("ssm")
+        return ssm.get_parameter(Name=api_key_param, WithDecryption=True)["Parameter"]["Value"]
+    elif api_key_secret_arn:
+        sm = boto3.session.Session().client("secretsmanager")
+        try:
+            response = sm.get_secret_value(SecretId=api_key_secret_arn)
             secret = json.loads(response["SecretString"])
-            api_key = secret["api_key"]
-    except ClientError:
-        raise RuntimeError("Unable to retrieve API KEY, please ensure the secret ARN is correct")
-    except KeyError:
-        raise RuntimeError('Please ensure the secret contains a "api_key" field')
-elif api_key_env != None:
-    api_key = api_key_env
-else:
+            return secret["api_key"]
+        except ClientError:
+            raise RuntimeError("Unable to retrieve API KEY, please ensure the secret ARN is correct")
+        except KeyError:
+            raise RuntimeError('Please ensure the secret contains a "api_key" field')
+    elif api_key_env != None:
+        return api_key_env
     # For local use only.
-    api_key = DEFAULT_API_KEYS
+    return DEFAULT_API_KEYS
+
+
+def get_api_key() -> str:
+    """Return the API key, it's loaded during app startup or on first use."""
+    global _api_key
+    if _api_key is None:
+        with _api_key_lock:
+            if _api_key is None:
+                _api_key = load_api_key()
+    return _api_key
+
 
-security = HTTPBearer(auto_error=api_key != "")
+# The API key is not known at import time, missing credentials are checked in api_key_auth.
+security = HTTPBearer(auto_error=False)
 
 
 def api_key_auth(
-    authorization: Annotated[HTTPAuthorizationCredentials, Depends(security)],
+    authorization: Annotated[HTTPAuthorizationCredentials | None, Depends(security)],
 ):
+    api_key = get_api_key()
+    if authorization is None and api_key != "":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authenticated")
     if authorization and authorization.credentials != api_key:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API Key")
@@ -0,0 +1,65 @@
+import logging
+import time
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+def create_client(limits: httpx.Limits, timeout: httpx.Timeout, http2: bool = False, **kwargs) -> httpx.AsyncClient:
+    """Create a pooled client, falling back to HTTP/1.1 if the optional `h2` package is missing."""
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+            http2 = False
+    return httpx.AsyncClient(limits=limits, timeout=timeout, http2=http2, **kwargs)
+
+
+class PoolStats:
+    """Connection pool statistics of an httpx client.
+
+    The time a request waits for a connection (queueing for a free connection, plus
+    connecting if a new one is opened) is measured with httpcore's trace extension:
+    pass `extensions={"trace": stats.trace()}` with each request.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def trace(self):
+        start = time.perf_counter()
+        recorded = False
+
+        async def trace(event_name: str, info: dict):
+            nonlocal recorded
+            if recorded or not event_name.endswith("send_request_headers.started"):
+                return
+            recorded = True
+            wait = time.perf_counter() - start
+            self.requests += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+        return trace
+
+    def collect(self, client: httpx.AsyncClient | None) -> dict:
+        connections = []
+        queued = 0
+        if client is not None:
+            pool = getattr(client._transport, "_pool", None)
+            connections = list(getattr(pool, "connections", []))
+            queued = sum(1 for r in getattr(pool, "_requests", []) if r.is_queued())
+        idle = sum(1 for c in connections if c.is_idle())
+        return {
+            "connections": len(connections),
+            "in_use": sum(1 for c in connections if not c.is_idle() and not c.is_closed()),
+            "idle": idle,
+            "queued_requests": queued,
+            "requests": self.requests,
+            "wait_avg_ms": self.wait_total / self.requests * 1000 if self.requests else 0.0,
+            "wait_max_ms": self.wait_max * 1000,
+        }
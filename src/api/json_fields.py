@@ -0,0 +1,107 @@
+"""Read and rewrite top-level fields of a JSON object without parsing the whole document.
+
+Request bodies can carry megabytes of base64 images, while the proxy only needs a few
+small fields such as `model` or `stream`. `scan_fields` locates the values of the
+requested top-level keys; nested values are skipped with `bytes.find` and regular
+expressions, so large strings are stepped over in C instead of being decoded.
+"""
+
+import json
+import re
+
+_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_BRACKET_OR_QUOTE = re.compile(rb'["\[\]{}]')
+_SCALAR_END = re.compile(rb"[,}\] \t\n\r]|$")
+
+
+def _skip_whitespace(body: bytes, pos: int) -> int:
+    return _WHITESPACE.match(body, pos).end()
+
+
+def _skip_string(body: bytes, pos: int) -> int:
+    """Return the position right after the string starting at `pos`."""
+    if body[pos : pos + 1] != b'"':
+        raise ValueError(f"Expected a string at position {pos}")
+    end = pos
+    while True:
+        end = body.find(b'"', end + 1)
+        if end == -1:
+            raise ValueError(f"Unterminated string at position {pos}")
+        # The quote is escaped if preceded by an odd number of backslashes.
+        escapes = end - 1
+        while body[escapes] == 0x5C:
+            escapes -= 1
+        if (end - 1 - escapes) % 2 == 0:
+            return end + 1
+
+
+def _skip_value(body: bytes, pos: int) -> int:
+    """Return the position right after the JSON value starting at `pos`."""
+    if pos >= len(body):
+        raise ValueError("Expected a value, got end of document")
+    char = body[pos : pos + 1]
+    if char == b'"':
+        return _skip_string(body, pos)
+    if char not in (b"{", b"["):
+        return _SCALAR_END.search(body, pos).start()
+
+    depth = 0
+    while True:
+        match = _BRACKET_OR_QUOTE.search(body, pos)
+        if match is None:
+            raise ValueError("Unbalanced brackets")
+        char = match.group()
+        if char == b'"':
+            pos = _skip_string(body, match.start())
+            continue
+        depth += 1 if char in (b"{", b"[") else -1
+        pos = match.end()
+        if depth == 0:
+            return pos
+
+
+def scan_fields(body: bytes, keys) -> dict[str, tuple[int, int]]:
+    """Find the (start, end) byte span of the value of each requested top-level key.
+
+    Keys that are absent are not returned. If a key is repeated, the last occurrence
+    wins, as with `json.loads`. Raises `ValueError` if the document is not a JSON object.
+    """
+    keys = set(keys)
+    spans = {}
+    pos = _skip_whitespace(body, 0)
+    if body[pos : pos + 1] != b"{":
+        raise ValueError("Expected a JSON object")
+    pos = _skip_whitespace(body, pos + 1)
+    if body[pos : pos + 1] == b"}":
+        return spans
+
+    while True:
+        key_end = _skip_string(body, pos)
+        key = json.loads(body[pos:key_end])
+        pos = _skip_whitespace(body, key_end)
+        if body[pos : pos + 1] != b":":
+            raise ValueError(f"Expected ':' at position {pos}")
+        start = _skip_whitespace(body, pos + 1)
+        end = _skip_value(body, start)
+        if key in keys:
+            spans[key] = (start, end)
+        pos = _skip_whitespace(body, end)
+        char = body[pos : pos + 1]
+        if char == b"}":
+            return spans
+        if char != b",":
+            raise ValueError(f"Expected ',' or '}}' at position {pos}")
+        pos = _skip_whitespace(body, pos + 1)
+
+
+def read_fields(body: bytes, keys) -> tuple[dict, dict[str, tuple[int, int]]]:
+    """Decode the values of the requested top-level keys, and return their spans as well."""
+    spans = scan_fields(body, keys)
+    return {key: json.loads(body[start:end]) for key, (start, end) in spans.items()}, spans
+
+
+def replace_field(body: bytes, span: tuple[int, int], value) -> bytes:
+    """Replace the value at `span` with the JSON encoding of `value`."""
+    start, end = span
+    view = memoryview(body)
+    return b"".join((view[:start], json.dumps(value).encode("utf-8"), view[end:]))
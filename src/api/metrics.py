@@ -0,0 +1,13 @@
+from typing import Callable
+
+# Named collectors returning a JSON-serializable dict of runtime statistics.
+_collectors: dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, collector: Callable[[], dict]):
+    """Register a statistics collector exposed by the metrics endpoint."""
+    _collectors[name] = collector
+
+
+def collect() -> dict:
+    return {name: collector() for name, collector in _collectors.items()}
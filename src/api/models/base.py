@@ -3,6 +3,8 @@ import uuid
 from abc import ABC, abstractmethod
 from typing import AsyncIterable
 
+from fastapi import Response
+
 from api.schema import (
     # Chat
     ChatRequest,
@@ -10,7 +12,6 @@ from api.schema import (
     ChatStreamResponse,
     # Embeddings
     EmbeddingsRequest,
-    EmbeddingsResponse,
     Error,
 )
 
@@ -66,6 +67,6 @@ class BaseEmbeddingsModel(ABC):
     """
 
     @abstractmethod
-    def embed(self, embeddings_request: EmbeddingsRequest) -> EmbeddingsResponse:
-        """Handle a basic embeddings request."""
+    async def embed(self, embeddings_request: EmbeddingsRequest) -> Response:
+        """Handle a basic embeddings request, returning a serialized EmbeddingsResponse."""
         pass
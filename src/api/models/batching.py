@@ -0,0 +1,56 @@
+import asyncio
+from typing import Awaitable, Callable, Sequence, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def split_batches(
+    items: Sequence[T],
+    max_items: int,
+    max_size: int | None = None,
+    size: Callable[[T], int] = len,
+) -> list[list[T]]:
+    """Split items, in order, into batches of at most `max_items` items and `max_size` total size.
+
+    An item larger than `max_size` on its own gets a batch of its own.
+    """
+    batches = []
+    batch = []
+    batch_size = 0
+    for item in items:
+        item_size = size(item) if max_size is not None else 0
+        if batch and (len(batch) >= max_items or (max_size is not None and batch_size + item_size > max_size)):
+            batches.append(batch)
+            batch = []
+            batch_size = 0
+        batch.append(item)
+        batch_size += item_size
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+async def fan_out(items: Sequence[T], func: Callable[[T], Awaitable[R]], concurrency: int = 10) -> list[R]:
+    """Call `func` on every item concurrently, returning the results in the order of the items.
+
+    At most `concurrency` calls run at the same time. An error cancels the remaining calls
+    and is raised (throttled calls are retried by `func`, see api.models.retry).
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def call(item: T) -> R:
+        async with semaphore:
+            return await func(item)
+
+    if len(items) == 1:
+        return [await call(items[0])]
+    tasks = [asyncio.ensure_future(call(item)) for item in items]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        # collect the outcome of the other calls so that no error goes unretrieved
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -1,20 +1,41 @@
+import asyncio
 import base64
 import json
 import logging
-import re
+import threading
 import time
-from abc import ABC
-from typing import AsyncIterable, Iterable, Literal
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import AsyncIterable, Literal
 
 import boto3
 import numpy as np
-import requests
-import tiktoken
+import orjson
 from botocore.config import Config
-from fastapi import HTTPException
+from fastapi import HTTPException, Response
 from starlette.concurrency import run_in_threadpool
 
+from api import metrics
 from api.models.base import BaseChatModel, BaseEmbeddingsModel
+from api.models.batching import fan_out, split_batches
+from api.models.catalog import ModelCatalog
+from api.models.coalescing import EmbeddingCoalescer
+from api.models.embedding_cache import EmbeddingCache, cache_key
+from api.models.images import ImageFetcher
+from api.models.regions import CircuitBreaker, MultiRegionRuntime, Region, parse_regions
+from api.models.response_cache import (
+    MemoryBackend,
+    RedisBackend,
+    ResponseCache,
+    is_deterministic,
+    replay,
+    request_key,
+)
+from api.models.retry import Retrier
+from api.models.runtime import AsyncBedrockRuntime, BedrockRuntime
+from api.models.sse import ChunkSerializer, coalesce_deltas
+from api.models.tokenizer import count_tokens, decode_batch
+from api.models.translation import translate
 from api.schema import (
     AssistantMessage,
     ChatRequest,
@@ -23,10 +44,7 @@ from api.schema import (
     ChatStreamResponse,
     Choice,
     ChoiceDelta,
-    Embedding,
     EmbeddingsRequest,
-    EmbeddingsResponse,
-    EmbeddingsUsage,
     Error,
     ErrorMessage,
     Function,
@@ -38,23 +56,123 @@ from api.schema import (
     Usage,
     UserMessage,
 )
-from api.setting import AWS_REGION, DEBUG, DEFAULT_MODEL, ENABLE_CROSS_REGION_INFERENCE
+from api.setting import (
+    AWS_REGION,
+    BEDROCK_ASYNC_TRANSPORT,
+    BEDROCK_KEEPALIVE_EXPIRY,
+    BEDROCK_MAX_CONNECTIONS,
+    BEDROCK_MAX_KEEPALIVE_CONNECTIONS,
+    BEDROCK_MAX_RETRIES,
+    BEDROCK_RATE_LIMIT_MAX_WAIT,
+    BEDROCK_REGION_FAILURE_THRESHOLD,
+    BEDROCK_REGION_RESET_TIMEOUT,
+    BEDROCK_REGION_ROUTING,
+    BEDROCK_REGION_UNSUPPORTED_TTL,
+    BEDROCK_REGIONS,
+    BEDROCK_RETRY_BASE_DELAY,
+    BEDROCK_RETRY_BUDGET_RATIO,
+    BEDROCK_RETRY_MAX_DELAY,
+    BEDROCK_RETRY_MODE,
+    DEBUG,
+    DEFAULT_MODEL,
+    EMBEDDING_BATCH_CONCURRENCY,
+    EMBEDDING_CACHE_DIR,
+    EMBEDDING_CACHE_DISK_MAX_BYTES,
+    EMBEDDING_CACHE_MAX_BYTES,
+    EMBEDDING_COALESCE_MAX_ITEMS,
+    EMBEDDING_COALESCE_WINDOW_MS,
+    ENABLE_CROSS_REGION_INFERENCE,
+    IMAGE_CACHE_DEFAULT_TTL,
+    IMAGE_CACHE_MAX_BYTES,
+    IMAGE_FETCH_MAX_BYTES,
+    IMAGE_FETCH_MAX_CONNECTIONS_PER_HOST,
+    IMAGE_FETCH_TIMEOUT,
+    MODEL_CATALOG_REFRESH_JITTER,
+    MODEL_CATALOG_TTL,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_REDIS_URL,
+    RESPONSE_CACHE_TTL,
+    SINGLE_FLIGHT,
+    STREAM_COALESCE_MAX_BYTES,
+    STREAM_COALESCE_WINDOW_MS,
+    STREAM_FAST_SERIALIZER,
+)
+from api.singleflight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-config = Config(connect_timeout=60, read_timeout=120, retries={"max_attempts": 1})
-
-bedrock_runtime = boto3.client(
-    service_name="bedrock-runtime",
-    region_name=AWS_REGION,
-    config=config,
-)
-bedrock_client = boto3.client(
-    service_name="bedrock",
-    region_name=AWS_REGION,
-    config=config,
+config = Config(
+    connect_timeout=60,
+    read_timeout=120,
+    retries={"max_attempts": 1},
+    max_pool_connections=BEDROCK_MAX_CONNECTIONS,
 )
 
+# Clients are created on first use (or during app startup) rather than at import time.
+_runtime: BedrockRuntime | None = None
+_bedrock_client = None
+_client_lock = threading.Lock()
+
+
+def _create_runtime(region: str) -> BedrockRuntime:
+    bedrock_runtime = boto3.client(
+        service_name="bedrock-runtime",
+        region_name=region,
+        config=config,
+    )
+    if BEDROCK_ASYNC_TRANSPORT:
+        return AsyncBedrockRuntime(
+            bedrock_runtime,
+            max_connections=BEDROCK_MAX_CONNECTIONS,
+            max_keepalive_connections=BEDROCK_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=BEDROCK_KEEPALIVE_EXPIRY,
+        )
+    return BedrockRuntime(bedrock_runtime)
+
+
+def get_runtime() -> BedrockRuntime:
+    """Return the Bedrock runtime used for Converse and InvokeModel calls."""
+    global _runtime
+    if _runtime is None:
+        with _client_lock:
+            if _runtime is None:
+                regions = parse_regions(BEDROCK_REGIONS, AWS_REGION)
+                if len(regions) > 1:
+                    _runtime = MultiRegionRuntime(
+                        [
+                            Region(
+                                name,
+                                _create_runtime(name),
+                                weight=weight,
+                                breaker=CircuitBreaker(
+                                    name,
+                                    failure_threshold=BEDROCK_REGION_FAILURE_THRESHOLD,
+                                    reset_timeout=BEDROCK_REGION_RESET_TIMEOUT,
+                                ),
+                            )
+                            for name, weight in regions
+                        ],
+                        routing=BEDROCK_REGION_ROUTING,
+                        unsupported_ttl=BEDROCK_REGION_UNSUPPORTED_TTL,
+                    )
+                else:
+                    _runtime = _create_runtime(regions[0][0])
+    return _runtime
+
+
+def get_bedrock_client():
+    """Return the Bedrock control plane client."""
+    global _bedrock_client
+    if _bedrock_client is None:
+        with _client_lock:
+            if _bedrock_client is None:
+                _bedrock_client = boto3.client(
+                    service_name="bedrock",
+                    region_name=AWS_REGION,
+                    config=config,
+                )
+    return _bedrock_client
+
 
 def get_inference_region_prefix():
     if AWS_REGION.startswith("ap-"):
@@ -73,8 +191,6 @@ SUPPORTED_BEDROCK_EMBEDDING_MODELS = {
     "amazon.titan-embed-text-v1": "Titan Embeddings G1 - Text",
 }
 
-ENCODER = tiktoken.get_encoding("cl100k_base")
-
 
 def list_bedrock_models() -> dict:
     """Automatically getting a list of supported models.
@@ -84,65 +200,174 @@ def list_bedrock_models() -> dict:
         - Cross-Region Inference Profiles (if enabled via Env)
     """
     model_list = {}
-    try:
-        profile_list = []
-        if ENABLE_CROSS_REGION_INFERENCE:
-            # List system defined inference profile IDs
-            response = bedrock_client.list_inference_profiles(maxResults=1000, typeEquals="SYSTEM_DEFINED")
-            profile_list = [p["inferenceProfileId"] for p in response["inferenceProfileSummaries"]]
-
-        # List foundation models, only cares about text outputs here.
-        response = bedrock_client.list_foundation_models(byOutputModality="TEXT")
-
-        for model in response["modelSummaries"]:
-            model_id = model.get("modelId", "N/A")
-            stream_supported = model.get("responseStreamingSupported", True)
-            status = model["modelLifecycle"].get("status", "ACTIVE")
-
-            # currently, use this to filter out rerank models and legacy models
-            if not stream_supported or status not in ["ACTIVE", "LEGACY"]:
-                continue
+    profile_list = []
+    bedrock_client = get_bedrock_client()
+    if ENABLE_CROSS_REGION_INFERENCE:
+        # List system defined inference profile IDs
+        response = bedrock_client.list_inference_profiles(maxResults=1000, typeEquals="SYSTEM_DEFINED")
+        profile_list = [p["inferenceProfileId"] for p in response["inferenceProfileSummaries"]]
+
+    # List foundation models, only cares about text outputs here.
+    response = bedrock_client.list_foundation_models(byOutputModality="TEXT")
+
+    for model in response["modelSummaries"]:
+        model_id = model.get("modelId", "N/A")
+        stream_supported = model.get("responseStreamingSupported", True)
+        status = model["modelLifecycle"].get("status", "ACTIVE")
+
+        # currently, use this to filter out rerank models and legacy models
+        if not stream_supported or status not in ["ACTIVE", "LEGACY"]:
+            continue
+
+        inference_types = model.get("inferenceTypesSupported", [])
+        input_modalities = model["inputModalities"]
+        # Add on-demand model list
+        if "ON_DEMAND" in inference_types:
+            model_list[model_id] = {"modalities": input_modalities}
+
+        # Add cross-region inference model list.
+        profile_id = cr_inference_prefix + "." + model_id
+        if profile_id in profile_list:
+            model_list[profile_id] = {"modalities": input_modalities}
 
-            inference_types = model.get("inferenceTypesSupported", [])
-            input_modalities = model["inputModalities"]
-            # Add on-demand model list
-            if "ON_DEMAND" in inference_types:
-                model_list[model_id] = {"modalities": input_modalities}
+    return model_list
 
-            # Add cross-region inference model list.
-            profile_id = cr_inference_prefix + "." + model_id
-            if profile_id in profile_list:
-                model_list[profile_id] = {"modalities": input_modalities}
 
-    except Exception as e:
-        logger.error(f"Unable to list models: {str(e)}")
+# The model list is cached and refreshed in the background.
+# In case stack not updated (or the listing fails), only the default model is served.
+model_catalog = ModelCatalog(
+    list_bedrock_models,
+    ttl=MODEL_CATALOG_TTL,
+    jitter=MODEL_CATALOG_REFRESH_JITTER,
+    fallback={DEFAULT_MODEL: {"modalities": ["TEXT", "IMAGE"]}},
+)
 
-    if not model_list:
-        # In case stack not updated.
-        model_list[DEFAULT_MODEL] = {"modalities": ["TEXT", "IMAGE"]}
+image_fetcher = ImageFetcher(
+    max_bytes=IMAGE_FETCH_MAX_BYTES,
+    cache_bytes=IMAGE_CACHE_MAX_BYTES,
+    timeout=IMAGE_FETCH_TIMEOUT,
+    max_connections_per_host=IMAGE_FETCH_MAX_CONNECTIONS_PER_HOST,
+    default_ttl=IMAGE_CACHE_DEFAULT_TTL,
+)
+metrics.register("images", image_fetcher.collect)
+
+retrier = Retrier(
+    mode=BEDROCK_RETRY_MODE,
+    max_retries=BEDROCK_MAX_RETRIES,
+    base_delay=BEDROCK_RETRY_BASE_DELAY,
+    max_delay=BEDROCK_RETRY_MAX_DELAY,
+    budget_ratio=BEDROCK_RETRY_BUDGET_RATIO,
+    max_wait=BEDROCK_RATE_LIMIT_MAX_WAIT,
+)
+metrics.register("retries", retrier.collect)
+metrics.register("regions", lambda: _runtime.collect() if isinstance(_runtime, MultiRegionRuntime) else {})
+
+# Created on first use, None if disabled.
+_embedding_cache: EmbeddingCache | None = None
+_embedding_cache_loaded = False
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    global _embedding_cache, _embedding_cache_loaded
+    if not _embedding_cache_loaded:
+        with _client_lock:
+            if not _embedding_cache_loaded:
+                if EMBEDDING_CACHE_MAX_BYTES > 0 or EMBEDDING_CACHE_DIR:
+                    _embedding_cache = EmbeddingCache(
+                        max_bytes=EMBEDDING_CACHE_MAX_BYTES,
+                        directory=EMBEDDING_CACHE_DIR,
+                        disk_max_bytes=EMBEDDING_CACHE_DISK_MAX_BYTES,
+                    )
+                _embedding_cache_loaded = True
+    return _embedding_cache
 
-    return model_list
+
+def close_embedding_cache():
+    if _embedding_cache is not None:
+        _embedding_cache.close()
+
+
+metrics.register("embedding_cache", lambda: _embedding_cache.collect() if _embedding_cache else {})
+
+_response_cache: ResponseCache | None = None
+_response_cache_loaded = False
+
+
+def get_response_cache() -> ResponseCache | None:
+    global _response_cache, _response_cache_loaded
+    if not _response_cache_loaded:
+        with _client_lock:
+            if not _response_cache_loaded:
+                backend = None
+                if RESPONSE_CACHE_REDIS_URL:
+                    try:
+                        backend = RedisBackend.from_url(RESPONSE_CACHE_REDIS_URL)
+                    except ImportError:
+                        logger.warning("Shared response cache disabled, the redis package is not installed")
+                if backend is None and RESPONSE_CACHE_MAX_BYTES > 0:
+                    backend = MemoryBackend(RESPONSE_CACHE_MAX_BYTES)
+                if backend is not None:
+                    _response_cache = ResponseCache(backend, ttl=RESPONSE_CACHE_TTL)
+                _response_cache_loaded = True
+    return _response_cache
+
+
+async def close_response_cache():
+    if _response_cache is not None:
+        await _response_cache.aclose()
+
+
+metrics.register("response_cache", lambda: _response_cache.collect() if _response_cache else {})
+
+# Identical concurrent calls in flight (see SINGLE_FLIGHT).
+single_flight = SingleFlight()
+metrics.register("single_flight", single_flight.collect)
+
+# None unless enabled.
+embedding_coalescer = (
+    EmbeddingCoalescer(window=EMBEDDING_COALESCE_WINDOW_MS / 1000, max_items=EMBEDDING_COALESCE_MAX_ITEMS)
+    if EMBEDDING_COALESCE_WINDOW_MS > 0
+    else None
+)
+metrics.register("embedding_coalescing", lambda: embedding_coalescer.collect() if embedding_coalescer else {})
+
+
+def initialize():
+    """Create the Bedrock clients and load the model list, called during app startup."""
+    get_runtime()
+    model_catalog.load()
 
 
-# Initialize the model list.
-bedrock_model_list = list_bedrock_models()
+@dataclass(frozen=True)
+class _PreparedRequest:
+    """A chat request translated to Converse arguments, and looked up in the response cache."""
+
+    args: dict
+    # request_key of the arguments, if the call is shared with identical concurrent ones
+    flight_key: str | None
+    # request_key to store the response under, if it's cached
+    response_key: str | None
+    cached: dict | None
 
 
 class BedrockModel(BaseChatModel):
+    # (chat request, its prepared request), kept by lookup_cache for the call that follows
+    _prepared: tuple[ChatRequest, _PreparedRequest] | None = None
+
     def list_models(self) -> list[str]:
-        """Always refresh the latest model list"""
-        global bedrock_model_list
-        bedrock_model_list = list_bedrock_models()
+        """Return the cached model list, it's refreshed in the background"""
+        bedrock_model_list = model_catalog.models
         if DEBUG:
-            logger.debug("Bedrock model list: " + json.dumps(bedrock_model_list))
+            logger.debug("Bedrock model list: " + json.dumps(dict(bedrock_model_list)))
 
         return list(bedrock_model_list.keys())
 
     def validate(self, chat_request: ChatRequest):
         """Perform basic validation on requests"""
         error = ""
+        bedrock_model_list = model_catalog.models
         if DEBUG:
-            logger.debug("Bedrock validate " + chat_request.model + " list: " + json.dumps(bedrock_model_list))
+            logger.debug("Bedrock validate " + chat_request.model + " list: " + json.dumps(dict(bedrock_model_list)))
             logger.debug(f"Checking model: {repr(chat_request.model)}")
             logger.debug(f"Available keys include: {repr('anthropic.claude-3-5-sonnet-20241022-v2:0') in bedrock_model_list}")
 
@@ -162,39 +387,111 @@ class BedrockModel(BaseChatModel):
                 detail=error,
             )
 
-    async def _invoke_bedrock(self, chat_request: ChatRequest, stream=False):
-        """Common logic for invoke bedrock models"""
+    async def lookup_cache(self, chat_request: ChatRequest, cache_control: str | None = None) -> bool:
+        """Whether the response to the request is served from the response cache.
+
+        Called before admission control, so that cache hits don't take an admission slot. The
+        translated request and the cached response are kept for the call that follows.
+        """
+        if chat_request.temperature != 0 or get_response_cache() is None:
+            return False
+        try:
+            prepared = await self._prepare(chat_request, cache_control)
+        except Exception:
+            # raised again by the call, which reports it
+            return False
+        self._prepared = (chat_request, prepared)
+        return prepared.cached is not None
+
+    async def _prepare(self, chat_request: ChatRequest, cache_control: str | None) -> _PreparedRequest:
+        """Translate the request and look it up in the response cache, if it's enabled."""
         if DEBUG:
             logger.info("Raw request: " + chat_request.model_dump_json())
 
         # convert OpenAI chat request to Bedrock SDK request
-        args = self._parse_request(chat_request)
+        args = await self._parse_request(chat_request)
         if DEBUG:
             logger.info("Bedrock request: " + json.dumps(str(args)))
 
-        try:
+        deterministic = is_deterministic(args)
+        cache = get_response_cache() if deterministic else None
+        shared = SINGLE_FLIGHT == "all" or (SINGLE_FLIGHT == "deterministic" and deterministic)
+        key = request_key(args) if cache is not None or shared else None
+        response_key = None
+        cached = None
+        if cache is not None:
+            lookup, store, max_age = cache.policy(cache_control)
+            if not lookup:
+                cache.bypassed += 1
+            else:
+                cached = await cache.get(key, max_age)
+            if store:
+                response_key = key
+        return _PreparedRequest(args, key if shared else None, response_key, cached)
+
+    async def _invoke_bedrock(self, chat_request: ChatRequest, stream=False, cache_control: str | None = None):
+        """Common logic for invoke bedrock models
+
+        Deterministic requests are served from the response cache when enabled, according
+        to the Cache-Control header of the request (see api.models.response_cache), and
+        identical concurrent requests share their upstream call if SINGLE_FLIGHT allows.
+        """
+        if self._prepared is not None and self._prepared[0] is chat_request:
+            # by lookup_cache
+            (_, prepared), self._prepared = self._prepared, None
+        else:
+            prepared = await self._prepare(chat_request, cache_control)
+        if prepared.cached is not None:
+            return {"stream": replay(prepared.cached)} if stream else prepared.cached
+        args, flight_key, response_key = prepared.args, prepared.flight_key, prepared.response_key
+        cache = get_response_cache()
+        runtime = get_runtime()
+
+        async def invoke() -> dict:
             if stream:
-                # Run the blocking boto3 call in a thread pool
-                response = await run_in_threadpool(bedrock_runtime.converse_stream, **args)
+                # Only opening the stream is retried, nothing has been sent to the client yet.
+                response = await retrier.call(args["modelId"], lambda: runtime.converse_stream(**args))
+            else:
+                response = await retrier.call(args["modelId"], lambda: runtime.converse(**args))
+            if response_key is not None:
+                if stream:
+                    response["stream"] = cache.record(response_key, response["stream"])
+                else:
+                    await cache.put(response_key, response)
+            return response
+
+        async def open_stream() -> tuple[dict, AsyncIterable[dict]]:
+            response = await invoke()
+            return {k: v for k, v in response.items() if k != "stream"}, response["stream"]
+
+        try:
+            if flight_key is None:
+                response = await invoke()
+            elif stream:
+                # identical concurrent streams are relayed from a single upstream stream
+                head, events = await single_flight.stream(flight_key, open_stream)
+                response = {**head, "stream": events}
             else:
-                # Run the blocking boto3 call in a thread pool
-                response = await run_in_threadpool(bedrock_runtime.converse, **args)
-        except bedrock_runtime.exceptions.ValidationException as e:
+                response = await single_flight.call(flight_key, invoke)
+        except runtime.exceptions.ValidationException as e:
             logger.error("Validation Error: " + str(e))
             raise HTTPException(status_code=400, detail=str(e))
-        except bedrock_runtime.exceptions.ThrottlingException as e:
+        except runtime.exceptions.ThrottlingException as e:
             logger.error("Throttling Error: " + str(e))
             raise HTTPException(status_code=429, detail=str(e))
+        except HTTPException:
+            # e.g. rejected by the rate limiter
+            raise
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=500, detail=str(e))
         return response
 
-    async def chat(self, chat_request: ChatRequest) -> ChatResponse:
+    async def chat(self, chat_request: ChatRequest, cache_control: str | None = None) -> ChatResponse:
         """Default implementation for Chat API."""
 
         message_id = self.generate_message_id()
-        response = await self._invoke_bedrock(chat_request)
+        response = await self._invoke_bedrock(chat_request, cache_control=cache_control)
 
         output_message = response["output"]["message"]
         input_tokens = response["usage"]["inputTokens"]
@@ -213,19 +510,28 @@ class BedrockModel(BaseChatModel):
             logger.info("Proxy response :" + chat_response.model_dump_json())
         return chat_response
 
-    async def _async_iterate(self, stream):
-        """Helper method to convert sync iterator to async iterator"""
-        for chunk in stream:
-            await run_in_threadpool(lambda: chunk)
-            yield chunk
-
-    async def chat_stream(self, chat_request: ChatRequest) -> AsyncIterable[bytes]:
+    async def chat_stream(self, chat_request: ChatRequest, cache_control: str | None = None) -> AsyncIterable[bytes]:
         """Default implementation for Chat Stream API"""
         try:
-            response = await self._invoke_bedrock(chat_request, stream=True)
+            response = await self._invoke_bedrock(chat_request, stream=True, cache_control=cache_control)
             message_id = self.generate_message_id()
             stream = response.get("stream")
-            async for chunk in self._async_iterate(stream):
+            include_usage = bool(chat_request.stream_options and chat_request.stream_options.include_usage)
+            window, max_bytes = self._coalescing(chat_request)
+            if window > 0:
+                stream = coalesce_deltas(stream, window / 1000, max_bytes)
+            # Frames are written directly from the events, the pydantic path below serializes
+            # the events the serializer does not support (and every event in debug mode).
+            serializer = None
+            if STREAM_FAST_SERIALIZER and not DEBUG:
+                serializer = ChunkSerializer(message_id, chat_request.model, self._convert_finish_reason, include_usage)
+            async for chunk in stream:
+                if serializer is not None:
+                    data = serializer.serialize(chunk)
+                    if data is not None:
+                        if data:
+                            yield data
+                        continue
                 args = {"model_id": chat_request.model, "message_id": message_id, "chunk": chunk}
                 stream_response = self._create_response_stream(**args)
                 if not stream_response:
@@ -234,7 +540,7 @@ class BedrockModel(BaseChatModel):
                     logger.info("Proxy response :" + stream_response.model_dump_json())
                 if stream_response.choices:
                     yield self.stream_response_to_bytes(stream_response)
-                elif chat_request.stream_options and chat_request.stream_options.include_usage:
+                elif include_usage:
                     # An empty choices for Usage as per OpenAI doc below:
                     # if you set stream_options: {"include_usage": true}.
                     # an additional chunk will be streamed before the data: [DONE] message.
@@ -249,6 +555,18 @@ class BedrockModel(BaseChatModel):
             error_event = Error(error=ErrorMessage(message=str(e)))
             yield self.stream_response_to_bytes(error_event)
 
+    @staticmethod
+    def _coalescing(chat_request: ChatRequest) -> tuple[float, int]:
+        """The text delta coalescing window (ms) and byte budget of a stream request."""
+        window, max_bytes = STREAM_COALESCE_WINDOW_MS, STREAM_COALESCE_MAX_BYTES
+        options = chat_request.stream_options
+        if options is not None:
+            if options.coalesce_ms is not None:
+                window = options.coalesce_ms
+            if options.coalesce_bytes is not None:
+                max_bytes = options.coalesce_bytes
+        return window, max_bytes
+
     def _parse_system_prompts(self, chat_request: ChatRequest) -> list[dict[str, str]]:
         """Create system prompts.
         Note that not all models support system prompts.
@@ -269,7 +587,28 @@ class BedrockModel(BaseChatModel):
 
         return system_prompts
 
-    def _parse_messages(self, chat_request: ChatRequest) -> list[dict]:
+    async def _fetch_images(self, chat_request: ChatRequest) -> dict[str, tuple[bytes, str]]:
+        """Fetch all the remote images of the request concurrently.
+
+        Data URLs are decoded later, together with the rest of the translation.
+        """
+        urls = [
+            part.image_url.url
+            for message in chat_request.messages
+            if isinstance(message, (UserMessage, AssistantMessage)) and not isinstance(message.content, str)
+            for part in message.content
+            if isinstance(part, ImageContent)
+        ]
+        if not urls:
+            return {}
+        if not self.is_supported_modality(chat_request.model, modality="IMAGE"):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Multimodal message is currently not supported by {chat_request.model}",
+            )
+        return await image_fetcher.fetch_all(url for url in urls if not url.startswith("data:"))
+
+    def _parse_messages(self, chat_request: ChatRequest, images: dict[str, tuple[bytes, str]]) -> list[dict]:
         """
         Converse API only support user and assistant messages.
 
@@ -287,7 +626,7 @@ class BedrockModel(BaseChatModel):
                 messages.append(
                     {
                         "role": message.role,
-                        "content": self._parse_content_parts(message, chat_request.model),
+                        "content": self._parse_content_parts(message, images),
                     }
                 )
             elif isinstance(message, AssistantMessage):
@@ -296,7 +635,7 @@ class BedrockModel(BaseChatModel):
                     messages.append(
                         {
                             "role": message.role,
-                            "content": self._parse_content_parts(message, chat_request.model),
+                            "content": self._parse_content_parts(message, images),
                         }
                     )
                 if message.tool_calls:
@@ -393,14 +732,23 @@ class BedrockModel(BaseChatModel):
 
         return reformatted_messages
 
-    def _parse_request(self, chat_request: ChatRequest) -> dict:
+    async def _parse_request(self, chat_request: ChatRequest) -> dict:
         """Create default converse request body.
 
+        Remote images are fetched first, then the request is translated, in a worker
+        pool if the payload is large (see api.models.translation).
+        """
+        images = await self._fetch_images(chat_request)
+        return await translate(self._build_request, chat_request, images)
+
+    def _build_request(self, chat_request: ChatRequest, images: dict[str, tuple[bytes, str]]) -> dict:
+        """Translate the chat request to a converse request body.
+
         Also perform validations to tool call etc.
 
         Ref: https://docs.aws.amazon.com/bedrock/latest/APIReference/API_runtime_Converse.html
         """
-        messages = self._parse_messages(chat_request)
+        messages = self._parse_messages(chat_request, images)
         system_prompts = self._parse_system_prompts(chat_request)
 
         # Base inference parameters.
@@ -615,37 +963,10 @@ class BedrockModel(BaseChatModel):
 
         return None
 
-    def _parse_image(self, image_url: str) -> tuple[bytes, str]:
-        """Try to get the raw data from an image url.
-
-        Ref: https://docs.aws.amazon.com/bedrock/latest/APIReference/API_runtime_ImageSource.html
-        returns a tuple of (Image Data, Content Type)
-        """
-        pattern = r"^data:(image/[a-z]*);base64,\s*"
-        content_type = re.search(pattern, image_url)
-        # if already base64 encoded.
-        # Only supports 'image/jpeg', 'image/png', 'image/gif' or 'image/webp'
-        if content_type:
-            image_data = re.sub(pattern, "", image_url)
-            return base64.b64decode(image_data), content_type.group(1)
-
-        # Send a request to the image URL
-        response = requests.get(image_url)
-        # Check if the request was successful
-        if response.status_code == 200:
-            content_type = response.headers.get("Content-Type")
-            if not content_type.startswith("image"):
-                content_type = "image/jpeg"
-            # Get the image content
-            image_content = response.content
-            return image_content, content_type
-        else:
-            raise HTTPException(status_code=500, detail="Unable to access the image url")
-
     def _parse_content_parts(
         self,
         message: UserMessage | AssistantMessage,
-        model_id: str,
+        images: dict[str, tuple[bytes, str]],
     ) -> list[dict]:
         if isinstance(message.content, str):
             return [
@@ -662,12 +983,12 @@ class BedrockModel(BaseChatModel):
                     }
                 )
             elif isinstance(part, ImageContent):
-                if not self.is_supported_modality(model_id, modality="IMAGE"):
-                    raise HTTPException(
-                        status_code=400,
-                        detail=f"Multimodal message is currently not supported by {model_id}",
-                    )
-                image_data, content_type = self._parse_image(part.image_url.url)
+                url = part.image_url.url
+                if url.startswith("data:"):
+                    image_data, content_type = image_fetcher.decode_data_url(url)
+                else:
+                    # fetched beforehand, see _fetch_images
+                    image_data, content_type = images[url]
                 content_parts.append(
                     {
                         "image": {
@@ -683,7 +1004,7 @@ class BedrockModel(BaseChatModel):
 
     @staticmethod
     def is_supported_modality(model_id: str, modality: str = "IMAGE") -> bool:
-        model = bedrock_model_list.get(model_id, {})
+        model = model_catalog.models.get(model_id, {})
         modalities = model.get("modalities", [])
         if modality in modalities:
             return True
@@ -738,112 +1059,251 @@ class BedrockModel(BaseChatModel):
 class BedrockEmbeddingsModel(BaseEmbeddingsModel, ABC):
     accept = "application/json"
     content_type = "application/json"
+    # Limits of a single InvokeModel call, inputs are split into batches accordingly.
+    max_batch_items = 1
+    max_batch_chars: int | None = None
+
+    async def _parse_texts(self, embeddings_request: EmbeddingsRequest) -> list[str]:
+        if isinstance(embeddings_request.input, str):
+            return [embeddings_request.input]
+        # may be a one-shot iterator
+        items = list(embeddings_request.input)
+        if all(isinstance(i, str) for i in items):
+            return items
+        # For encoded input
+        # The workaround is to use tiktoken to decode to get the original text.
+        # A flat list of ints is a single text, decoded after the nested token arrays.
+        batch = [list(i) for i in items if not isinstance(i, int)]
+        encodings = [i for i in items if isinstance(i, int)]
+        if encodings:
+            batch.append(encodings)
+        return await run_in_threadpool(decode_batch, batch)
+
+    def _cache_namespace(self, embeddings_request: EmbeddingsRequest) -> str:
+        """The model and the parameters that affect its embeddings, part of the cache key."""
+        return f"{embeddings_request.model}|{embeddings_request.dimensions}"
+
+    @abstractmethod
+    def _parse_results(self, response_bodies: list[dict]) -> list[tuple[list[float], int]]:
+        """Return the (embedding, input token count) of each text from the response bodies."""
+        pass
+
+    async def _fetch_results(
+        self, embeddings_request: EmbeddingsRequest, texts: list[str]
+    ) -> list[tuple[list[float], int]]:
+        """Return the (embedding, input token count) of each text, from the model."""
+        return self._parse_results(await self._invoke_batches(embeddings_request, texts))
+
+    async def _fetch_coalesced(
+        self, embeddings_request: EmbeddingsRequest, texts: list[str]
+    ) -> list[tuple[list[float], int]]:
+        """As _fetch_results, sharing upstream calls with concurrent requests if coalescing is enabled."""
+        if embedding_coalescer is None or self.max_batch_items <= 1:
+            return await self._fetch_results(embeddings_request, texts)
+        return await embedding_coalescer.fetch(
+            # requests with the same cache namespace are sent with the same arguments
+            self._cache_namespace(embeddings_request),
+            texts,
+            lambda batch: self._fetch_results(embeddings_request, batch),
+            max_items=self.max_batch_items,
+        )
 
-    def _invoke_model(self, args: dict, model_id: str):
+    async def _invoke_batches(self, embeddings_request: EmbeddingsRequest, texts: list[str]) -> list[dict]:
+        """Split the texts into batches the model accepts and invoke them concurrently.
+
+        Returns the decoded response bodies in the order of the batches.
+        """
+        batches = split_batches(texts, self.max_batch_items, self.max_batch_chars)
+
+        async def invoke(batch: list[str]) -> dict:
+            return await self._invoke_model(
+                args=self._parse_args(embeddings_request, batch), model_id=embeddings_request.model
+            )
+
+        return await fan_out(batches, invoke, concurrency=EMBEDDING_BATCH_CONCURRENCY)
+
+    async def _embed_texts(self, embeddings_request: EmbeddingsRequest) -> tuple[np.ndarray, int]:
+        """Return the embeddings of the input texts, one float32 row per text, and the input token count.
+
+        Texts found in the embedding cache are not sent upstream.
+        """
+        texts = await self._parse_texts(embeddings_request)
+        cache = get_embedding_cache()
+        if cache is None:
+            results = await self._fetch_coalesced(embeddings_request, texts)
+            return self._to_matrix(results), sum(tokens for _, tokens in results)
+
+        namespace = self._cache_namespace(embeddings_request)
+        keys = [cache_key(namespace, text) for text in texts]
+        # The disk tier reads memory-mapped pages and writes its index, off the event loop.
+        on_disk = cache.disk is not None
+        results = await run_in_threadpool(cache.get_many, keys) if on_disk else cache.get_many(keys)
+        # the same text may appear more than once
+        missing = {keys[i]: texts[i] for i, result in enumerate(results) if result is None}
+        if missing:
+            fetched = await self._fetch_coalesced(embeddings_request, list(missing.values()))
+            entries = [(key, embedding, tokens) for key, (embedding, tokens) in zip(missing, fetched)]
+            if on_disk:
+                await run_in_threadpool(cache.put_many, entries)
+            else:
+                cache.put_many(entries)
+            fetched = dict(zip(missing, fetched))
+            results = [fetched[key] if result is None else result for key, result in zip(keys, results)]
+
+        return self._to_matrix(results), sum(tokens for _, tokens in results)
+
+    @staticmethod
+    def _to_matrix(results: list[tuple[list[float] | np.ndarray, int]]) -> np.ndarray:
+        if not results:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.array([embedding for embedding, _ in results], dtype=np.float32)
+
+    async def embed(self, embeddings_request: EmbeddingsRequest) -> Response:
+        embeddings, input_tokens = await self._embed_texts(embeddings_request)
+        return self._create_response(
+            embeddings=embeddings,
+            model=embeddings_request.model,
+            input_tokens=input_tokens,
+            encoding_format=embeddings_request.encoding_format,
+        )
+
+    # Response bodies larger than this are decoded in a worker thread.
+    offload_decode_bytes = 64 * 1024
+
+    async def _invoke_model(self, args: dict, model_id: str) -> dict:
+        """Invoke the model and return the decoded response body."""
         body = json.dumps(args)
         if DEBUG:
             logger.info("Invoke Bedrock Model: " + model_id)
             logger.info("Bedrock request body: " + body)
+        runtime = get_runtime()
         try:
-            return bedrock_runtime.invoke_model(
-                body=body,
-                modelId=model_id,
-                accept=self.accept,
-                contentType=self.content_type,
+            response = await retrier.call(
+                model_id,
+                lambda: runtime.invoke_model(
+                    body=body,
+                    modelId=model_id,
+                    accept=self.accept,
+                    contentType=self.content_type,
+                ),
             )
-        except bedrock_runtime.exceptions.ValidationException as e:
+        except runtime.exceptions.ValidationException as e:
             logger.error("Validation Error: " + str(e))
             raise HTTPException(status_code=400, detail=str(e))
-        except bedrock_runtime.exceptions.ThrottlingException as e:
+        except runtime.exceptions.ThrottlingException as e:
             logger.error("Throttling Error: " + str(e))
             raise HTTPException(status_code=429, detail=str(e))
+        except HTTPException:
+            # e.g. rejected by the rate limiter
+            raise
         except Exception as e:
             logger.error(e)
             raise HTTPException(status_code=500, detail=str(e))
 
+        response_body = response["body"]
+        if len(response_body) > self.offload_decode_bytes:
+            response_body = await run_in_threadpool(orjson.loads, response_body)
+        else:
+            response_body = orjson.loads(response_body)
+        if DEBUG:
+            logger.info("Bedrock response body: " + str(response_body))
+        return response_body
+
     def _create_response(
         self,
-        embeddings: list[float],
+        embeddings: np.ndarray,
         model: str,
         input_tokens: int = 0,
         output_tokens: int = 0,
         encoding_format: Literal["float", "base64"] = "float",
-    ) -> EmbeddingsResponse:
-        data = []
-        for i, embedding in enumerate(embeddings):
-            if encoding_format == "base64":
-                arr = np.array(embedding, dtype=np.float32)
-                arr_bytes = arr.tobytes()
-                encoded_embedding = base64.b64encode(arr_bytes)
-                data.append(Embedding(index=i, embedding=encoded_embedding))
-            else:
-                data.append(Embedding(index=i, embedding=embedding))
-        response = EmbeddingsResponse(
-            data=data,
-            model=model,
-            usage=EmbeddingsUsage(
-                prompt_tokens=input_tokens,
-                total_tokens=input_tokens + output_tokens,
-            ),
-        )
+    ) -> Response:
+        """Serialize an EmbeddingsResponse from a float32 matrix (one row per input).
+
+        The JSON is written directly from the matrix, without building a pydantic model
+        per embedding: rows are serialized by orjson as float32 arrays, or base64-encoded
+        from row views of the matrix.
+        """
+        usage = {"prompt_tokens": input_tokens, "total_tokens": input_tokens + output_tokens}
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if encoding_format == "base64":
+            data = b",".join(
+                b'{"object":"embedding","embedding":"%b","index":%d}' % (base64.b64encode(row), i)
+                for i, row in enumerate(embeddings)
+            )
+            content = b"".join(
+                (
+                    b'{"object":"list","data":[',
+                    data,
+                    b'],"model":',
+                    orjson.dumps(model),
+                    b',"usage":',
+                    orjson.dumps(usage),
+                    b"}",
+                )
+            )
+        else:
+            content = orjson.dumps(
+                {
+                    "object": "list",
+                    "data": [{"object": "embedding", "embedding": row, "index": i} for i, row in enumerate(embeddings)],
+                    "model": model,
+                    "usage": usage,
+                },
+                option=orjson.OPT_SERIALIZE_NUMPY,
+            )
         if DEBUG:
-            logger.info("Proxy response :" + response.model_dump_json())
-        return response
+            logger.info("Proxy response :" + content.decode())
+        return Response(content=content, media_type="application/json")
 
 
 class CohereEmbeddingsModel(BedrockEmbeddingsModel):
-    def _parse_args(self, embeddings_request: EmbeddingsRequest) -> dict:
-        texts = []
-        if isinstance(embeddings_request.input, str):
-            texts = [embeddings_request.input]
-        elif isinstance(embeddings_request.input, list):
-            texts = embeddings_request.input
-        elif isinstance(embeddings_request.input, Iterable):
-            # For encoded input
-            # The workaround is to use tiktoken to decode to get the original text.
-            encodings = []
-            for inner in embeddings_request.input:
-                if isinstance(inner, int):
-                    # Iterable[int]
-                    encodings.append(inner)
-                else:
-                    # Iterable[Iterable[int]]
-                    text = ENCODER.decode(list(inner))
-                    texts.append(text)
-            if encodings:
-                texts.append(ENCODER.decode(encodings))
+    # Bedrock rejects more than 96 texts per call.
+    max_batch_items = 96
+    max_batch_chars = 96 * 2048
+    input_type = "search_document"
 
+    def _parse_args(self, embeddings_request: EmbeddingsRequest, texts: list[str]) -> dict:
         # Maximum of 2048 characters
         args = {
             "texts": texts,
-            "input_type": "search_document",
+            "input_type": self.input_type,
             "truncate": "END",  # "NONE|START|END"
         }
         return args
 
-    def embed(self, embeddings_request: EmbeddingsRequest) -> EmbeddingsResponse:
-        response = self._invoke_model(args=self._parse_args(embeddings_request), model_id=embeddings_request.model)
-        response_body = json.loads(response.get("body").read())
-        if DEBUG:
-            logger.info("Bedrock response body: " + str(response_body))
+    def _cache_namespace(self, embeddings_request: EmbeddingsRequest) -> str:
+        return f"{super()._cache_namespace(embeddings_request)}|{self.input_type}"
 
-        return self._create_response(
-            embeddings=response_body["embeddings"],
-            model=embeddings_request.model,
-            encoding_format=embeddings_request.encoding_format,
+    def _parse_results(self, response_bodies: list[dict]) -> list[tuple[list[float], int]]:
+        return [(embedding, 0) for body in response_bodies for embedding in body["embeddings"]]
+
+    async def _fetch_results(
+        self, embeddings_request: EmbeddingsRequest, texts: list[str]
+    ) -> list[tuple[list[float], int]]:
+        # Bedrock does not report the token usage of Cohere models, the texts are counted
+        # with tiktoken (an approximation of the Cohere tokenizer) while the model is invoked.
+        response_bodies, tokens = await asyncio.gather(
+            self._invoke_batches(embeddings_request, texts),
+            run_in_threadpool(self._count_tokens, texts),
         )
+        return [(embedding, count) for (embedding, _), count in zip(self._parse_results(response_bodies), tokens)]
+
+    @staticmethod
+    def _count_tokens(texts: list[str]) -> list[int]:
+        try:
+            return count_tokens(texts)
+        except Exception:
+            # the encoder could not be loaded, already logged
+            return [0] * len(texts)
 
 
 class TitanEmbeddingsModel(BedrockEmbeddingsModel):
-    def _parse_args(self, embeddings_request: EmbeddingsRequest) -> dict:
-        if isinstance(embeddings_request.input, str):
-            input_text = embeddings_request.input
-        elif isinstance(embeddings_request.input, list) and len(embeddings_request.input) == 1:
-            input_text = embeddings_request.input[0]
-        else:
-            raise ValueError("Amazon Titan Embeddings models support only single strings as input.")
+    # Titan takes a single input text per call.
+    max_batch_items = 1
+
+    def _parse_args(self, embeddings_request: EmbeddingsRequest, texts: list[str]) -> dict:
         args = {
-            "inputText": input_text,
+            "inputText": texts[0],
             # Note: inputImage is not supported!
         }
         if embeddings_request.model == "amazon.titan-embed-image-v1":
@@ -854,17 +1314,8 @@ class TitanEmbeddingsModel(BedrockEmbeddingsModel):
             )
         return args
 
-    def embed(self, embeddings_request: EmbeddingsRequest) -> EmbeddingsResponse:
-        response = self._invoke_model(args=self._parse_args(embeddings_request), model_id=embeddings_request.model)
-        response_body = json.loads(response.get("body").read())
-        if DEBUG:
-            logger.info("Bedrock response body: " + str(response_body))
-
-        return self._create_response(
-            embeddings=[response_body["embedding"]],
-            model=embeddings_request.model,
-            input_tokens=response_body["inputTextTokenCount"],
-        )
+    def _parse_results(self, response_bodies: list[dict]) -> list[tuple[list[float], int]]:
+        return [(body["embedding"], body["inputTextTokenCount"]) for body in response_bodies]
 
 
 def get_embeddings_model(model_id: str) -> BedrockEmbeddingsModel:
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Mapping
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """An immutable view of the model list at a point in time."""
+
+    models: Mapping[str, dict] = field(default_factory=lambda: MappingProxyType({}))
+    # Unix timestamp of the last successful refresh, 0 if never refreshed.
+    refreshed_at: float = 0.0
+
+
+class ModelCatalog:
+    """Cache of the available models, refreshed in the background.
+
+    Readers always get the current snapshot from memory. Once the snapshot is older than
+    `ttl` seconds, a refresh is scheduled in the background; a periodic refresher can also
+    be started with `start()`. If a refresh fails, the previous snapshot is kept and the
+    refresh is retried after `retry_interval` seconds at the earliest.
+    """
+
+    retry_interval = 30
+
+    def __init__(
+        self,
+        loader: Callable[[], dict],
+        ttl: float = 300,
+        jitter: float = 0.1,
+        fallback: dict | None = None,
+    ):
+        self.loader = loader
+        self.ttl = ttl
+        self.jitter = jitter
+        self.fallback = fallback or {}
+        self._snapshot = CatalogSnapshot()
+        self._attempted_at = 0.0
+        self._refreshing: asyncio.Task | None = None
+        self._refresher: asyncio.Task | None = None
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        if not self._attempted_at:
+            # Not loaded during startup, e.g. the app lifespan did not run.
+            self.load()
+        elif self.is_stale() and time.time() - self._attempted_at > min(self.ttl, self.retry_interval):
+            self._schedule_refresh()
+        return self._snapshot
+
+    @property
+    def models(self) -> Mapping[str, dict]:
+        return self.snapshot.models
+
+    @property
+    def refreshed_at(self) -> float:
+        return self._snapshot.refreshed_at
+
+    def is_stale(self) -> bool:
+        return time.time() - self._snapshot.refreshed_at > self.ttl
+
+    def _update(self, models: dict | None) -> None:
+        if models:
+            self._snapshot = CatalogSnapshot(models=MappingProxyType(dict(models)), refreshed_at=time.time())
+        elif not self._snapshot.models:
+            # Nothing loaded yet, serve the fallback until a refresh succeeds.
+            self._snapshot = CatalogSnapshot(models=MappingProxyType(dict(self.fallback)))
+
+    def load(self) -> None:
+        """Load the model list synchronously."""
+        self._attempted_at = time.time()
+        try:
+            models = self.loader()
+        except Exception as e:
+            logger.error(f"Unable to list models: {str(e)}")
+            models = None
+        self._update(models)
+
+    async def refresh(self) -> None:
+        """Reload the model list in a worker thread, keeping the current snapshot on failure."""
+        self._attempted_at = time.time()
+        try:
+            models = await run_in_threadpool(self.loader)
+        except Exception as e:
+            logger.error(f"Unable to refresh models, serving the previous list: {str(e)}")
+            models = None
+        self._update(models)
+
+    def _schedule_refresh(self) -> None:
+        if self._refreshing and not self._refreshing.done():
+            return
+        try:
+            self._refreshing = asyncio.get_running_loop().create_task(self.refresh())
+        except RuntimeError:
+            # No running event loop, the next async reader will schedule it.
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            delay = self.ttl * (1 + random.uniform(-self.jitter, self.jitter))
+            await asyncio.sleep(max(delay, 1))
+            await self.refresh()
+
+    async def start(self) -> None:
+        """Start refreshing the catalog periodically (every `ttl` seconds, with jitter)."""
+        if self._refresher is None:
+            self._refresher = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        for task in (self._refresher, self._refreshing):
+            if task and not task.done():
+                task.cancel()
+        self._refresher = None
+        self._refreshing = None
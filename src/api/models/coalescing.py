@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Generic, TypeVar
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+
+class _Batch(Generic[R]):
+    def __init__(self, fetch: Callable[[list[str]], Awaitable[list[R]]]):
+        self.fetch = fetch
+        self.texts: list[str] = []
+        self.requests = 0
+        self.future: asyncio.Future[list[R]] = asyncio.get_running_loop().create_future()
+        self.timer: asyncio.TimerHandle | None = None
+        self.task: asyncio.Task | None = None
+
+    async def run(self):
+        try:
+            results = await self.fetch(self.texts)
+        except asyncio.CancelledError:
+            self.future.cancel()
+            raise
+        except Exception as e:
+            self.future.set_exception(e)
+        else:
+            self.future.set_result(results)
+
+
+class EmbeddingCoalescer:
+    """Micro-batching of the texts of concurrent embedding requests.
+
+    Texts submitted under the same key (the model and the parameters of the upstream call)
+    within `window` seconds are sent in a single upstream call, of at most `max_items` texts,
+    and each caller gets the results of its own texts back.
+    """
+
+    def __init__(self, window: float, max_items: int):
+        self.window = window
+        self.max_items = max_items
+        self._pending: dict[str, _Batch] = {}
+        # statistics
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+
+    async def fetch(
+        self,
+        key: str,
+        texts: list[str],
+        fetch: Callable[[list[str]], Awaitable[list[R]]],
+        max_items: int | None = None,
+    ) -> list[R]:
+        """Return `fetch(texts)`, computed as part of a batch with the texts of other callers.
+
+        `fetch` of the first caller of a batch is used for the whole batch.
+        """
+        max_items = min(self.max_items, max_items or self.max_items)
+        if len(texts) >= max_items:
+            # a batch on its own
+            return await fetch(texts)
+
+        batch = self._pending.get(key)
+        if batch is not None and len(batch.texts) + len(texts) > max_items:
+            self._flush(key, batch)
+            batch = None
+        if batch is None:
+            batch = _Batch(fetch)
+            self._pending[key] = batch
+            batch.timer = asyncio.get_running_loop().call_later(self.window, self._flush, key, batch)
+        start = len(batch.texts)
+        batch.texts.extend(texts)
+        batch.requests += 1
+        if len(batch.texts) >= max_items:
+            self._flush(key, batch)
+        # a cancelled caller must not cancel the batch of the others
+        results = await asyncio.shield(batch.future)
+        return results[start : start + len(texts)]
+
+    def _flush(self, key: str, batch: _Batch):
+        if self._pending.get(key) is not batch:
+            # already sent
+            return
+        del self._pending[key]
+        batch.timer.cancel()
+        self.requests += batch.requests
+        self.batches += 1
+        self.texts += len(batch.texts)
+        batch.task = asyncio.ensure_future(batch.run())
+        # the error is raised to the callers, mark it retrieved if they were all cancelled
+        batch.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    def collect(self) -> dict:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts": self.texts,
+            "pending": len(self._pending),
+        }
@@ -0,0 +1,216 @@
+import fcntl
+import hashlib
+import logging
+import os
+import threading
+import unicodedata
+
+import numpy as np
+
+from api.lru import ByteLRUCache
+
+logger = logging.getLogger(__name__)
+
+# Approximate memory used by a cache entry besides its vector.
+ENTRY_OVERHEAD = 200
+
+
+def cache_key(namespace: str, text: str) -> bytes:
+    """Content address of an embedding: the model (and its parameters) plus the normalized text."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(namespace.encode())
+    digest.update(b"\0")
+    digest.update(unicodedata.normalize("NFC", text).encode())
+    return digest.digest()
+
+
+class DiskEmbeddingStore:
+    """Float32 vectors in memory-mapped files, surviving restarts.
+
+    Vectors of each dimension are stored in `vectors-<dimension>.f32`, used as a ring buffer
+    of at most `max_bytes` bytes: once full, the oldest vectors are overwritten. The keys
+    are recorded in an append-only `index.log` ("<key> <dimension> <row> <tokens>" lines),
+    which is compacted when the store is opened.
+
+    The directory is locked, so it can only be used by a single process at a time.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, "lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            # e.g. used by another worker
+            self._lock_file.close()
+            raise
+        # key -> (dimension, row, tokens)
+        self._index: dict[bytes, tuple[int, int, int]] = {}
+        # dimension -> key stored in each row
+        self._rows: dict[int, list[bytes | None]] = {}
+        self._next_row: dict[int, int] = {}
+        self._vectors: dict[int, np.memmap] = {}
+        self._load_index()
+        self._log = open(os.path.join(directory, "index.log"), "a")
+        # statistics
+        self.overwrites = 0
+
+    def _capacity(self, dimension: int) -> int:
+        return max(self.max_bytes // (dimension * 4), 1)
+
+    def _load_index(self):
+        path = os.path.join(self.directory, "index.log")
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        key, dimension, row, tokens = line.split()
+                        self._set(bytes.fromhex(key), int(dimension), int(row), int(tokens))
+                    except ValueError:
+                        # e.g. a line truncated by a crash
+                        continue
+        for dimension, rows in list(self._rows.items()):
+            if not os.path.exists(self._vectors_path(dimension)):
+                # vectors deleted, forget their keys
+                for key in rows:
+                    self._index.pop(key, None)
+                del self._rows[dimension]
+                self._next_row.pop(dimension, None)
+        # compact the log
+        with open(path + ".tmp", "w") as f:
+            for key, (dimension, row, tokens) in self._index.items():
+                f.write(f"{key.hex()} {dimension} {row} {tokens}\n")
+        os.replace(path + ".tmp", path)
+
+    def _set(self, key: bytes, dimension: int, row: int, tokens: int):
+        capacity = self._capacity(dimension)
+        if row >= capacity:
+            # written before the store shrank
+            return
+        rows = self._rows.setdefault(dimension, [None] * capacity)
+        previous = rows[row]
+        if previous is not None and previous != key:
+            self._index.pop(previous, None)
+        rows[row] = key
+        # The index keeps the order of the writes, which the compacted log preserves.
+        self._index.pop(key, None)
+        self._index[key] = (dimension, row, tokens)
+        self._next_row[dimension] = (row + 1) % capacity
+
+    def _vectors_path(self, dimension: int) -> str:
+        return os.path.join(self.directory, f"vectors-{dimension}.f32")
+
+    def _open_vectors(self, dimension: int) -> np.memmap:
+        vectors = self._vectors.get(dimension)
+        if vectors is None:
+            path = self._vectors_path(dimension)
+            capacity = self._capacity(dimension)
+            with open(path, "ab") as f:
+                # grows the file (sparse) to its full size, or truncates it if the store shrank
+                f.truncate(capacity * dimension * 4)
+            vectors = np.memmap(path, dtype=np.float32, mode="r+", shape=(capacity, dimension))
+            self._vectors[dimension] = vectors
+        return vectors
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def get(self, key: bytes) -> tuple[np.ndarray, int] | None:
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        dimension, row, tokens = entry
+        return np.array(self._open_vectors(dimension)[row]), tokens
+
+    def put(self, key: bytes, vector: np.ndarray, tokens: int):
+        if key in self._index:
+            return
+        dimension = len(vector)
+        vectors = self._open_vectors(dimension)
+        row = self._next_row.get(dimension, 0)
+        if self._rows.get(dimension, [None])[row] is not None:
+            self.overwrites += 1
+        vectors[row] = vector
+        self._set(key, dimension, row, tokens)
+        self._log.write(f"{key.hex()} {dimension} {row} {tokens}\n")
+
+    def flush(self):
+        self._log.flush()
+
+    def close(self):
+        self._log.close()
+        for vectors in self._vectors.values():
+            vectors.flush()
+        self._vectors.clear()
+        self._lock_file.close()
+
+
+class EmbeddingCache:
+    """Embeddings cache with an in-memory LRU bounded in bytes and an optional disk tier.
+
+    Vectors are stored as float32. Entries found on disk are promoted to memory.
+    """
+
+    def __init__(self, max_bytes: int, directory: str | None = None, disk_max_bytes: int = 0):
+        self.memory = ByteLRUCache(max_bytes)
+        self.disk: DiskEmbeddingStore | None = None
+        self._lock = threading.Lock()
+        if directory:
+            try:
+                self.disk = DiskEmbeddingStore(directory, disk_max_bytes)
+            except OSError as e:
+                # e.g. locked by another worker process, which can use a directory of its own
+                logger.warning(f"Embedding disk cache disabled, unable to open {directory}: {e}")
+        # statistics
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, key: bytes) -> tuple[np.ndarray, int] | None:
+        entry = self.memory.get(key)
+        if entry is not None:
+            return entry
+        if self.disk is not None:
+            with self._lock:
+                entry = self.disk.get(key)
+            if entry is not None:
+                self.disk_hits += 1
+                self.memory.put(key, entry, entry[0].nbytes + ENTRY_OVERHEAD)
+                return entry
+        self.misses += 1
+        return None
+
+    def get_many(self, keys: list[bytes]) -> list[tuple[np.ndarray, int] | None]:
+        return [self.get(key) for key in keys]
+
+    def put_many(self, entries: list[tuple[bytes, list[float], int]]):
+        """Store (key, embedding, token count) entries."""
+        for key, embedding, tokens in entries:
+            vector = np.asarray(embedding, dtype=np.float32)
+            self.memory.put(key, (vector, tokens), vector.nbytes + ENTRY_OVERHEAD)
+            if self.disk is not None:
+                with self._lock:
+                    self.disk.put(key, vector, tokens)
+        if self.disk is not None:
+            with self._lock:
+                self.disk.flush()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
+            self.disk = None
+
+    def collect(self) -> dict:
+        memory = self.memory.collect()
+        return {
+            "hits": memory["hits"] + self.disk_hits,
+            "memory_hits": memory["hits"],
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": memory["evictions"],
+            "memory_entries": memory["entries"],
+            "memory_bytes": memory["bytes"],
+            "disk_entries": len(self.disk) if self.disk is not None else 0,
+            "disk_overwrites": self.disk.overwrites if self.disk is not None else 0,
+        }
@@ -0,0 +1,223 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import re
+import time
+from dataclasses import dataclass, replace
+
+import httpx
+from fastapi import HTTPException
+
+from api.lru import ByteLRUCache
+
+logger = logging.getLogger(__name__)
+
+DATA_URL_PATTERN = re.compile(r"^data:(image/[a-z]*);base64,\s*")
+
+
+@dataclass(frozen=True)
+class CachedImage:
+    data: bytes
+    content_type: str
+    # Unix timestamp after which the image must be revalidated.
+    expires_at: float
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+def parse_cache_control(value: str | None) -> dict[str, str | None]:
+    directives = {}
+    for directive in (value or "").split(","):
+        name, _, arg = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = arg.strip('"') or None
+    return directives
+
+
+class ImageFetcher:
+    """Fetch the images of multimodal chat requests without blocking the event loop.
+
+    - Remote images are downloaded with a pooled async client, with timeouts, a size cap
+      and a limit of concurrent connections per host.
+    - Downloaded images are kept in an LRU cache bounded in bytes and keyed by URL. The
+      freshness lifetime follows the `Cache-Control` response header (`default_ttl` if
+      absent); stale entries with an `ETag` or `Last-Modified` are revalidated with a
+      conditional request.
+    - Concurrent fetches of the same URL share a single download.
+    - Data URLs are decoded once and memoized by the hash of the URL.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 10 * 1024 * 1024,
+        cache_bytes: int = 128 * 1024 * 1024,
+        timeout: float = 10,
+        max_connections: int = 100,
+        max_connections_per_host: int = 10,
+        default_ttl: float = 300,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self.default_ttl = default_ttl
+        self.cache = ByteLRUCache(cache_bytes)
+        self.data_urls = ByteLRUCache(cache_bytes)
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._host_limits: dict[str, asyncio.Semaphore] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        # statistics
+        self.downloads = 0
+        self.revalidations = 0
+        self.not_modified = 0
+        self.failures = 0
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections),
+                timeout=httpx.Timeout(self.timeout),
+                follow_redirects=True,
+                transport=self._transport,
+            )
+            self._host_limits = {}
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def fetch_all(self, urls) -> dict[str, tuple[bytes, str]]:
+        """Fetch the given images concurrently, returning {url: (image data, content type)}."""
+        urls = list(dict.fromkeys(urls))
+        results = await asyncio.gather(*(self.fetch(url) for url in urls))
+        return dict(zip(urls, results))
+
+    async def fetch(self, url: str) -> tuple[bytes, str]:
+        """Return (image data, content type) of an image URL or base64 data URL."""
+        if url.startswith("data:"):
+            return self.decode_data_url(url)
+
+        cached = self.cache.get(url)
+        if cached is not None and cached.expires_at > time.time():
+            return cached.data, cached.content_type
+
+        future = self._inflight.get(url)
+        if future is None:
+            future = asyncio.ensure_future(self._download(url, cached))
+            self._inflight[url] = future
+            future.add_done_callback(lambda _: self._inflight.pop(url, None))
+        image = await asyncio.shield(future)
+        return image.data, image.content_type
+
+    def decode_data_url(self, url: str) -> tuple[bytes, str]:
+        """Decode a base64 data URL, thread-safe so that it can run in a worker."""
+        key = hashlib.blake2b(url.encode(), digest_size=16).digest()
+        image = self.data_urls.get(key)
+        if image is None:
+            match = DATA_URL_PATTERN.match(url)
+            if not match:
+                raise HTTPException(status_code=400, detail="Unsupported image data url")
+            image = (base64.b64decode(url[match.end() :]), match.group(1))
+            self.data_urls.put(key, image, len(image[0]))
+        return image
+
+    def _host_limit(self, url: str) -> asyncio.Semaphore:
+        host = httpx.URL(url).host
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.max_connections_per_host)
+        return self._host_limits[host]
+
+    async def _download(self, url: str, cached: CachedImage | None) -> CachedImage:
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers["If-None-Match"] = cached.etag
+            if cached.last_modified:
+                headers["If-Modified-Since"] = cached.last_modified
+            if headers:
+                self.revalidations += 1
+
+        try:
+            client = self._get_client()
+            async with self._host_limit(url):
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 304 and cached is not None:
+                        self.not_modified += 1
+                        image = replace(cached, expires_at=self._expires_at(response.headers))
+                    elif response.status_code == 200:
+                        self.downloads += 1
+                        image = CachedImage(
+                            data=await self._read(response),
+                            content_type=self._content_type(response.headers),
+                            expires_at=self._expires_at(response.headers),
+                            etag=response.headers.get("ETag"),
+                            last_modified=response.headers.get("Last-Modified"),
+                        )
+                    else:
+                        raise HTTPException(status_code=500, detail="Unable to access the image url")
+        except httpx.HTTPError as e:
+            self.failures += 1
+            logger.error(f"Unable to fetch image {url}: {e}")
+            raise HTTPException(status_code=500, detail="Unable to access the image url")
+        except HTTPException:
+            self.failures += 1
+            raise
+
+        if self._is_cacheable(image, response.headers):
+            self.cache.put(url, image, len(image.data))
+        else:
+            self.cache.pop(url)
+        return image
+
+    async def _read(self, response: httpx.Response) -> bytes:
+        too_large = HTTPException(status_code=400, detail=f"Image exceeds the maximum size of {self.max_bytes} bytes")
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_bytes:
+            raise too_large
+        chunks = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise too_large
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    @staticmethod
+    def _content_type(headers: httpx.Headers) -> str:
+        content_type = headers.get("Content-Type", "").split(";")[0].strip()
+        if not content_type.startswith("image"):
+            content_type = "image/jpeg"
+        return content_type
+
+    def _expires_at(self, headers: httpx.Headers) -> float:
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        if "no-cache" in directives:
+            return 0.0
+        max_age = directives.get("max-age")
+        if max_age is not None and max_age.isdigit():
+            return time.time() + int(max_age)
+        return time.time() + self.default_ttl
+
+    @staticmethod
+    def _is_cacheable(image: CachedImage, headers: httpx.Headers) -> bool:
+        directives = parse_cache_control(headers.get("Cache-Control"))
+        if "no-store" in directives or "private" in directives:
+            return False
+        # A stale entry is only useful if it can be revalidated.
+        return image.expires_at > time.time() or bool(image.etag or image.last_modified)
+
+    def collect(self) -> dict:
+        return {
+            "downloads": self.downloads,
+            "revalidations": self.revalidations,
+            "not_modified": self.not_modified,
+            "failures": self.failures,
+            "cache": self.cache.collect(),
+            "data_url_cache": self.data_urls.collect(),
+        }
@@ -0,0 +1,249 @@
+import logging
+import random
+import time
+import weakref
+from typing import AsyncIterable, Iterator
+
+import httpx
+from botocore import exceptions as botocore_exceptions
+
+from api.models.retry import RETRYABLE_ERROR_CODES, error_code
+from api.models.runtime import BedrockRuntime
+
+logger = logging.getLogger(__name__)
+
+# Errors meaning the model is not served in a region (e.g. not available, or a cross-region
+# inference profile of another geography), the call is sent to another region instead.
+UNSUPPORTED_ERROR_CODES = {"ResourceNotFoundException", "AccessDeniedException"}
+
+CONNECTION_ERRORS = (httpx.TransportError, botocore_exceptions.ConnectionError, botocore_exceptions.HTTPClientError)
+
+
+def parse_regions(value: str, default: str) -> list[tuple[str, float]]:
+    """Parse a "us-west-2:3,us-east-1" list of regions with optional weights (1 by default)."""
+    regions = []
+    for item in value.split(","):
+        name, _, weight = item.strip().partition(":")
+        if name:
+            regions.append((name, float(weight) if weight else 1.0))
+    return regions or [(default, 1.0)]
+
+
+def is_unavailable(exc: BaseException) -> bool:
+    """Throttling, 5xx or connection errors: the region may serve the call later, another one now."""
+    return error_code(exc) in RETRYABLE_ERROR_CODES or isinstance(exc, CONNECTION_ERRORS)
+
+
+def is_unsupported(exc: BaseException) -> bool:
+    code = error_code(exc)
+    if code in UNSUPPORTED_ERROR_CODES:
+        return True
+    message = exc.response.get("Error", {}).get("Message", "") if code else ""
+    return code == "ValidationException" and "model identifier" in message.lower()
+
+
+class CircuitBreaker:
+    """Consecutive failures open the circuit for `reset_timeout` seconds, then a single
+    trial call is let through (half open): its success closes the circuit, its failure
+    opens it again."""
+
+    def __init__(self, name: str = "", failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+            self._trial = False
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def on_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._trial = False
+
+    def on_failure(self):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.warning(f"Circuit {self.name} opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def release(self):
+        """The call was abandoned (e.g. cancelled) without an outcome."""
+        self._trial = False
+
+
+class Region:
+    def __init__(self, name: str, runtime: BedrockRuntime, weight: float = 1.0, breaker: CircuitBreaker | None = None):
+        self.name = name
+        self.runtime = runtime
+        self.weight = weight
+        self.breaker = breaker or CircuitBreaker(name)
+        # calls (and open streams) in flight
+        self.outstanding = 0
+        # statistics
+        self.requests = 0
+        self.failures = 0
+
+    def collect(self) -> dict:
+        return {
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+            "circuit": self.breaker.state,
+        }
+
+
+def _end_call(region: Region):
+    region.outstanding -= 1
+
+
+class _TrackedStream:
+    """An open stream, counted as an outstanding call of its region until it ends, fails,
+    is closed, or is garbage collected (e.g. dropped without being iterated when the client
+    disconnected before the first event)."""
+
+    def __init__(self, region: Region, stream: AsyncIterable[dict]):
+        self._stream = stream
+        self._events = aiter(stream)
+        # ends the call at most once
+        self._end = weakref.finalize(self, _end_call, region)
+        self._end.atexit = False
+
+    def __aiter__(self) -> "_TrackedStream":
+        return self
+
+    async def __anext__(self) -> dict:
+        try:
+            return await anext(self._events)
+        except BaseException:
+            self._end()
+            raise
+
+    async def aclose(self):
+        self._end()
+        if hasattr(self._stream, "aclose"):
+            await self._stream.aclose()
+
+
+class MultiRegionRuntime(BedrockRuntime):
+    """Bedrock runtime spreading calls across the runtimes of several regions.
+
+    Each call is sent to a region picked by the routing strategy, "least-outstanding"
+    (fewest calls in flight relative to the region weight, the first region on ties) or
+    "weighted" (random, proportionally to the weights). If the region is unavailable
+    (throttling, 5xx or connection errors) or does not serve the model, the call fails over
+    to the next region. Regions whose circuit breaker is open are skipped, so are regions
+    not serving the model for `unsupported_ttl` seconds, as models may be enabled later.
+
+    As with retries, a stream fails over only while it is being opened.
+    """
+
+    def __init__(self, regions: list[Region], routing: str = "least-outstanding", unsupported_ttl: float = 3600.0):
+        super().__init__(regions[0].runtime.client)
+        self.regions = regions
+        self.routing = routing
+        self.unsupported_ttl = unsupported_ttl
+        # (region, model) pairs found not to be served, until when they are skipped
+        self.unsupported: dict[tuple[str, str], float] = {}
+        # statistics
+        self.failovers = 0
+
+    def _is_unsupported(self, region: Region, model_id: str | None) -> bool:
+        key = (region.name, model_id)
+        expiry = self.unsupported.get(key)
+        if expiry is None:
+            return False
+        if time.monotonic() < expiry:
+            return True
+        del self.unsupported[key]
+        return False
+
+    def _ranked(self, model_id: str | None) -> list[Region]:
+        regions = [r for r in self.regions if not self._is_unsupported(r, model_id)] or self.regions
+        if self.routing == "weighted":
+            first = random.choices(regions, weights=[r.weight for r in regions])[0]
+            return [first] + [r for r in regions if r is not first]
+        order = {id(r): i for i, r in enumerate(regions)}
+        return sorted(regions, key=lambda r: (r.outstanding / r.weight, order[id(r)]))
+
+    def _candidates(self, model_id: str | None) -> Iterator[Region]:
+        # lazily, as letting a call through a half open circuit is its trial call
+        ranked = self._ranked(model_id)
+        allowed = False
+        for region in ranked:
+            if region.breaker.allow():
+                allowed = True
+                yield region
+        if not allowed:
+            # every circuit is open, try the preferred region anyway
+            yield ranked[0]
+
+    async def _call(self, operation: str, kwargs: dict) -> dict:
+        model_id = kwargs.get("modelId")
+        last_error = None
+        for region in self._candidates(model_id):
+            if last_error is not None:
+                self.failovers += 1
+                logger.warning(f"Failing over {model_id} to {region.name}: {last_error}")
+            region.outstanding += 1
+            region.requests += 1
+            try:
+                response = await getattr(region.runtime, operation)(**kwargs)
+            except Exception as e:
+                region.outstanding -= 1
+                if is_unavailable(e):
+                    region.failures += 1
+                    region.breaker.on_failure()
+                    last_error = e
+                    continue
+                # the region answered
+                region.breaker.on_success()
+                if region is not self.regions[0] and is_unsupported(e):
+                    self.unsupported[(region.name, model_id)] = time.monotonic() + self.unsupported_ttl
+                    last_error = e
+                    continue
+                raise
+            except BaseException:
+                region.outstanding -= 1
+                region.breaker.release()
+                raise
+            region.breaker.on_success()
+            if operation == "converse_stream":
+                response["stream"] = _TrackedStream(region, response["stream"])
+            else:
+                region.outstanding -= 1
+            return response
+        raise last_error
+
+    async def converse(self, **kwargs) -> dict:
+        return await self._call("converse", kwargs)
+
+    async def converse_stream(self, **kwargs) -> dict:
+        return await self._call("converse_stream", kwargs)
+
+    async def invoke_model(self, **kwargs) -> dict:
+        return await self._call("invoke_model", kwargs)
+
+    async def aclose(self):
+        for region in self.regions:
+            await region.runtime.aclose()
+
+    def collect(self) -> dict:
+        return {
+            "failovers": self.failovers,
+            "regions": {region.name: region.collect() for region in self.regions},
+        }
@@ -0,0 +1,277 @@
+import hashlib
+import json
+import logging
+import math
+import time
+from typing import AsyncIterable, AsyncIterator, Protocol
+
+import orjson
+
+from api.lru import ByteLRUCache
+from api.models.images import parse_cache_control
+
+logger = logging.getLogger(__name__)
+
+# Approximate memory used by a cache entry besides its value.
+ENTRY_OVERHEAD = 200
+
+# Fields of a Converse response kept in the cache.
+CACHED_FIELDS = ("output", "stopReason", "usage")
+
+
+class CacheBackend(Protocol):
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes, ttl: float): ...
+
+
+class MemoryBackend:
+    """In-process LRU bounded in bytes, whose entries expire after their TTL."""
+
+    def __init__(self, max_bytes: int):
+        self.cache = ByteLRUCache(max_bytes)
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self.cache.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            self.cache.pop(key)
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        self.cache.put(key, (value, time.time() + ttl), len(value) + ENTRY_OVERHEAD)
+
+    def collect(self) -> dict:
+        memory = self.cache.collect()
+        return {"entries": memory["entries"], "bytes": memory["bytes"], "evictions": memory["evictions"]}
+
+
+class RedisBackend:
+    """Cache shared by the gateway instances, in Redis.
+
+    `client` is a redis-py asyncio client, or any client with the same `get`, `set(ex=)`
+    and `aclose` coroutines.
+    """
+
+    def __init__(self, client, prefix: str = "bedrock-access-gateway:chat:"):
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisBackend":
+        # optional dependency, only needed for a shared cache
+        import redis.asyncio
+
+        return cls(redis.asyncio.from_url(url))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self.client.get(self.prefix + key)
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.client.set(self.prefix + key, value, ex=max(math.ceil(ttl), 1))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def _hash_bytes(value):
+    # e.g. image data, hashed rather than encoded
+    if isinstance(value, (bytes, bytearray)):
+        return hashlib.blake2b(value, digest_size=16).hexdigest()
+    raise TypeError
+
+
+def request_key(args: dict) -> str:
+    """Hash of the model id and the canonical JSON of translated Converse arguments."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(args["modelId"].encode())
+    digest.update(b"\0")
+    digest.update(orjson.dumps(args, default=_hash_bytes, option=orjson.OPT_SORT_KEYS))
+    return digest.hexdigest()
+
+
+def is_deterministic(args: dict) -> bool:
+    return args.get("inferenceConfig", {}).get("temperature") == 0
+
+
+class ResponseCache:
+    """Exact-match cache of deterministic (temperature 0) Converse responses.
+
+    Responses are keyed by the `request_key` of the translated Converse arguments, so a
+    streaming request is served by the response of an identical non-streaming one
+    (replayed as stream events) and conversely.
+
+    The `Cache-Control` header of a request controls the lookup:
+        - "no-cache": skip the lookup, store the new response.
+        - "no-store": neither look up nor store.
+        - "max-age=<seconds>": only use a response stored at most that long ago.
+    """
+
+    def __init__(self, backend: CacheBackend, ttl: float = 3600):
+        self.backend = backend
+        self.ttl = ttl
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.stores = 0
+        self.errors = 0
+
+    @staticmethod
+    def policy(cache_control: str | None) -> tuple[bool, bool, float | None]:
+        """(look up, store, max age) of a request, from its Cache-Control header."""
+        directives = parse_cache_control(cache_control)
+        if "no-store" in directives:
+            return False, False, None
+        if "no-cache" in directives:
+            return False, True, None
+        try:
+            max_age = float(directives["max-age"])
+        except (KeyError, TypeError, ValueError):
+            max_age = None
+        return True, True, max_age
+
+    async def get(self, key: str, max_age: float | None = None) -> dict | None:
+        try:
+            data = await self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache lookup failed: {e}")
+            data = None
+        if data is not None:
+            entry = orjson.loads(data)
+            if max_age is None or time.time() - entry["stored_at"] <= max_age:
+                self.hits += 1
+                return entry["response"]
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, response: dict):
+        try:
+            data = orjson.dumps({"stored_at": time.time(), "response": {f: response[f] for f in CACHED_FIELDS}})
+        except (KeyError, TypeError):
+            # e.g. redacted reasoning content (bytes)
+            return
+        try:
+            await self.backend.set(key, data, self.ttl)
+            self.stores += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache store failed: {e}")
+
+    async def record(self, key: str, stream: AsyncIterable[dict]) -> AsyncIterator[dict]:
+        """Relay a ConverseStream, storing the response it assembles to once complete."""
+        recorder = StreamRecorder()
+        async for event in stream:
+            recorder.add(event)
+            yield event
+        response = recorder.response()
+        if response is not None:
+            await self.put(key, response)
+
+    async def aclose(self):
+        if hasattr(self.backend, "aclose"):
+            await self.backend.aclose()
+
+    def collect(self) -> dict:
+        lookups = self.hits + self.misses
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "bypassed": self.bypassed,
+            "stores": self.stores,
+            "errors": self.errors,
+        }
+        if hasattr(self.backend, "collect"):
+            stats.update(self.backend.collect())
+        return stats
+
+
+class StreamRecorder:
+    """Assembles the events of a ConverseStream into the equivalent Converse response."""
+
+    def __init__(self):
+        # content block index -> (kind, tool use or reasoning fields, parts of the text or tool input)
+        self.blocks: dict[int, tuple[str, dict, list[str]]] = {}
+        self.stop_reason = None
+        self.usage = None
+        # e.g. redacted reasoning content, which is not cached
+        self.uncacheable = False
+
+    def add(self, event: dict):
+        if "contentBlockStart" in event:
+            start = event["contentBlockStart"]
+            if "toolUse" in start["start"]:
+                tool = start["start"]["toolUse"]
+                fields = {"toolUseId": tool["toolUseId"], "name": tool["name"]}
+                self.blocks[start["contentBlockIndex"]] = ("toolUse", fields, [])
+        elif "contentBlockDelta" in event:
+            index = event["contentBlockDelta"]["contentBlockIndex"]
+            delta = event["contentBlockDelta"]["delta"]
+            if "text" in delta:
+                self.blocks.setdefault(index, ("text", {}, []))[2].append(delta["text"])
+            elif "reasoningContent" in delta:
+                reasoning = delta["reasoningContent"]
+                if "redactedContent" in reasoning:
+                    self.uncacheable = True
+                _, fields, parts = self.blocks.setdefault(index, ("reasoningContent", {}, []))
+                parts.append(reasoning.get("text", ""))
+                if "signature" in reasoning:
+                    fields["signature"] = reasoning["signature"]
+            elif "toolUse" in delta and index in self.blocks:
+                self.blocks[index][2].append(delta["toolUse"]["input"])
+        elif "messageStop" in event:
+            self.stop_reason = event["messageStop"]["stopReason"]
+        elif "metadata" in event and "usage" in event["metadata"]:
+            self.usage = event["metadata"]["usage"]
+
+    def response(self) -> dict | None:
+        """The Converse response, or None if the stream was incomplete (or is not cacheable)."""
+        if self.stop_reason is None or self.usage is None or self.uncacheable:
+            return None
+        content = []
+        for index in sorted(self.blocks):
+            kind, fields, parts = self.blocks[index]
+            if kind == "toolUse":
+                try:
+                    content.append({"toolUse": {**fields, "input": json.loads("".join(parts) or "{}")}})
+                except ValueError:
+                    return None
+            elif kind == "reasoningContent":
+                content.append({"reasoningContent": {"reasoningText": {"text": "".join(parts), **fields}}})
+            else:
+                content.append({"text": "".join(parts)})
+        return {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": self.stop_reason,
+            "usage": self.usage,
+        }
+
+
+async def replay(response: dict) -> AsyncIterator[dict]:
+    """The ConverseStream events of a (cached) Converse response."""
+    yield {"messageStart": {"role": "assistant"}}
+    for index, block in enumerate(response["output"]["message"]["content"]):
+        if "toolUse" in block:
+            tool = block["toolUse"]
+            yield {
+                "contentBlockStart": {
+                    "start": {"toolUse": {"toolUseId": tool["toolUseId"], "name": tool["name"]}},
+                    "contentBlockIndex": index,
+                }
+            }
+            delta = {"toolUse": {"input": json.dumps(tool["input"])}}
+        elif "reasoningContent" in block:
+            delta = {"reasoningContent": block["reasoningContent"]["reasoningText"]}
+        elif "text" in block:
+            delta = {"text": block["text"]}
+        else:
+            continue
+        yield {"contentBlockDelta": {"delta": delta, "contentBlockIndex": index}}
+        yield {"contentBlockStop": {"contentBlockIndex": index}}
+    yield {"messageStop": {"stopReason": response["stopReason"]}}
+    yield {"metadata": {"usage": response["usage"], "metrics": {"latencyMs": 0}}}
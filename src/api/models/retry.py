@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import math
+import random
+import time
+from typing import Awaitable, Callable, TypeVar
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+THROTTLING_ERROR_CODES = {"ThrottlingException", "TooManyRequestsException", "ModelNotReadyException"}
+RETRYABLE_ERROR_CODES = THROTTLING_ERROR_CODES | {"ServiceUnavailableException", "InternalServerException"}
+
+
+def error_code(exc: BaseException) -> str | None:
+    """The error code of a botocore ClientError."""
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code")
+    return None
+
+
+class AdaptiveRateLimiter:
+    """Client-side token bucket whose rate is learnt from throttling responses.
+
+    The bucket only starts limiting after the first throttle, at the send rate measured
+    until then. Every throttle cuts the rate by `beta`, every success raises it by about
+    one request per second per second (AIMD), so the callers of a throttled model are
+    spread out instead of all retrying at once.
+    """
+
+    # Window of the send rate measurement, in seconds.
+    measure_interval = 0.5
+
+    def __init__(self, min_rate: float = 0.5, beta: float = 0.7):
+        self.min_rate = min_rate
+        self.beta = beta
+        self.enabled = False
+        self.rate = 0.0
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.measured_rate = 0.0
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+    def _measure(self, now: float):
+        self._window_count += 1
+        elapsed = now - self._window_start
+        if elapsed >= self.measure_interval:
+            current = self._window_count / elapsed
+            self.measured_rate = current if self.measured_rate == 0 else 0.8 * self.measured_rate + 0.2 * current
+            self._window_start = now
+            self._window_count = 0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.tokens + (now - self.last_refill) * self.rate, max(self.rate, 1.0))
+        self.last_refill = now
+
+    def delay(self) -> float:
+        """Take a token for a request, returning how long the request must wait for it."""
+        now = time.monotonic()
+        self._measure(now)
+        if not self.enabled:
+            return 0.0
+        self._refill(now)
+        self.tokens -= 1
+        # the token is reserved, a negative balance queues the following requests behind it
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def refund(self):
+        """Give back the token of a request which won't be sent (e.g. rejected or cancelled)."""
+        if self.enabled:
+            self.tokens = min(self.tokens + 1, max(self.rate, 1.0))
+
+    def on_throttle(self):
+        if self.enabled:
+            self.rate = max(self.rate * self.beta, self.min_rate)
+        else:
+            self.enabled = True
+            # the send rate until now, from the current window if none was measured yet
+            elapsed = time.monotonic() - self._window_start
+            current = self._window_count / elapsed if elapsed > 0 else 0.0
+            self.rate = max(max(self.measured_rate, current) * self.beta, self.min_rate)
+            self.tokens = 0.0
+            self.last_refill = time.monotonic()
+        self.tokens = min(self.tokens, max(self.rate, 1.0))
+
+    def on_success(self):
+        if self.enabled:
+            self.rate += 1 / max(self.rate, 1.0)
+
+
+class RetryBudget:
+    """Limits retries to a ratio of the requests.
+
+    Every request deposits `ratio` and every retry withdraws one, from a balance starting
+    at `reserve` retries and capped at `max_balance`.
+    """
+
+    def __init__(self, ratio: float = 0.1, reserve: float = 10, max_balance: float = 100):
+        self.ratio = ratio
+        self.max_balance = max(max_balance, reserve)
+        self.balance = float(reserve)
+
+    def deposit(self):
+        self.balance = min(self.balance + self.ratio, self.max_balance)
+
+    def withdraw(self) -> bool:
+        if self.balance < 1:
+            return False
+        self.balance -= 1
+        return True
+
+
+class ModelRetryState:
+    def __init__(self, budget_ratio: float, min_rate: float):
+        self.limiter = AdaptiveRateLimiter(min_rate=min_rate)
+        self.budget = RetryBudget(ratio=budget_ratio)
+        # statistics
+        self.requests = 0
+        self.retries = 0
+        self.throttles = 0
+        self.budget_exhausted = 0
+        self.rate_limited = 0
+        self.rate_limit_rejected = 0
+
+    def collect(self) -> dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttles": self.throttles,
+            "budget_exhausted": self.budget_exhausted,
+            "rate_limited": self.rate_limited,
+            "rate_limit_rejected": self.rate_limit_rejected,
+            "rate_limit": round(self.limiter.rate, 2) if self.limiter.enabled else None,
+        }
+
+
+class Retrier:
+    """Gateway-side retries of throttled or unavailable Bedrock calls, per model.
+
+    Modes:
+        - "adaptive": exponential backoff with full jitter, retry budget and adaptive rate limiting.
+        - "standard": backoff and retry budget only.
+        - "off": single attempt.
+
+    Only the call is retried: a stream is never retried once it has been returned, as its
+    first bytes may already have been sent to the client.
+
+    A call which would wait more than `max_wait` seconds for the rate limiter is rejected
+    with HTTP 429 and a Retry-After estimate instead of being queued behind the others.
+    """
+
+    def __init__(
+        self,
+        mode: str = "adaptive",
+        max_retries: int = 3,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        budget_ratio: float = 0.1,
+        min_rate: float = 0.5,
+        max_wait: float = 10.0,
+    ):
+        self.mode = mode
+        self.max_retries = max_retries if mode != "off" else 0
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.budget_ratio = budget_ratio
+        self.min_rate = min_rate
+        self.max_wait = max_wait
+        self.models: dict[str, ModelRetryState] = {}
+
+    def _state(self, model_id: str) -> ModelRetryState:
+        state = self.models.get(model_id)
+        if state is None:
+            state = self.models[model_id] = ModelRetryState(self.budget_ratio, self.min_rate)
+        return state
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    async def _wait_for_token(self, model_id: str, state: ModelRetryState):
+        delay = state.limiter.delay()
+        if delay <= 0:
+            return
+        if delay > self.max_wait:
+            state.limiter.refund()
+            state.rate_limit_rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Too many requests for {model_id}, rate limited for {delay:.0f}s",
+                headers={"Retry-After": str(math.ceil(delay))},
+            )
+        state.rate_limited += 1
+        try:
+            await asyncio.sleep(delay)
+        except BaseException:
+            # e.g. the client disconnected, don't keep the following requests waiting for it
+            state.limiter.refund()
+            raise
+
+    async def call(self, model_id: str, func: Callable[[], Awaitable[T]]) -> T:
+        state = self._state(model_id)
+        state.requests += 1
+        state.budget.deposit()
+        attempt = 0
+        while True:
+            if self.mode == "adaptive":
+                await self._wait_for_token(model_id, state)
+            try:
+                result = await func()
+            except Exception as e:
+                code = error_code(e)
+                if code in THROTTLING_ERROR_CODES:
+                    state.throttles += 1
+                    if self.mode == "adaptive":
+                        state.limiter.on_throttle()
+                if code not in RETRYABLE_ERROR_CODES or attempt >= self.max_retries:
+                    raise
+                if not state.budget.withdraw():
+                    state.budget_exhausted += 1
+                    raise
+                delay = self.backoff(attempt)
+                attempt += 1
+                state.retries += 1
+                logger.warning(
+                    f"{code} from {model_id}, retrying in {delay:.2f}s (attempt {attempt}/{self.max_retries})"
+                )
+                await asyncio.sleep(delay)
+            else:
+                state.limiter.on_success()
+                return result
+
+    def collect(self) -> dict:
+        return {model_id: state.collect() for model_id, state in self.models.items()}
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+from typing import AsyncIterator
+
+import httpx
+from botocore.awsrequest import create_request_object
+from botocore.eventstream import EventStreamBuffer, EventStreamError
+from botocore.parsers import EventStreamJSONParser
+from starlette.concurrency import run_in_threadpool
+
+from api.models.stream import pump_stream
+
+logger = logging.getLogger(__name__)
+
+
+class BedrockRuntime:
+    """Async facade over the Bedrock runtime operations used by the gateway.
+
+    The default implementation runs the blocking boto3 client calls in a thread pool and
+    pumps event streams from a background thread.
+
+    All methods return the same structures as boto3, except that:
+        - `converse_stream()["stream"]` is an async iterable of events.
+        - `invoke_model()["body"]` is the fully read response body (bytes).
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    @property
+    def exceptions(self):
+        return self.client.exceptions
+
+    async def converse(self, **kwargs) -> dict:
+        return await run_in_threadpool(self.client.converse, **kwargs)
+
+    async def converse_stream(self, **kwargs) -> dict:
+        response = await run_in_threadpool(self.client.converse_stream, **kwargs)
+        response["stream"] = pump_stream(response["stream"])
+        return response
+
+    async def invoke_model(self, **kwargs) -> dict:
+        def invoke():
+            response = self.client.invoke_model(**kwargs)
+            response["body"] = response["body"].read()
+            return response
+
+        return await run_in_threadpool(invoke)
+
+    async def aclose(self):
+        pass
+
+
+class AsyncBedrockRuntime(BedrockRuntime):
+    """Bedrock runtime transport based on httpx.
+
+    Requests are serialized and SigV4-signed with the boto3 client's own serializer, signer
+    and credentials, then sent with a pooled `httpx.AsyncClient` on the running event loop.
+    Responses and errors are parsed with botocore, so callers see the same results and
+    exception classes as with the boto3 client.
+    """
+
+    # httpcore scans every pooled connection for every queued request, which gets
+    # expensive with hundreds of connections, so the pool is split into shards.
+    connections_per_shard = 4
+
+    def __init__(
+        self,
+        client,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 100,
+        keepalive_expiry: float = 60.0,
+        timeout: httpx.Timeout | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        super().__init__(client)
+        self.shards = max(1, -(-max_connections // self.connections_per_shard))
+        self.limits = httpx.Limits(
+            max_connections=-(-max_connections // self.shards),
+            max_keepalive_connections=-(-max_keepalive_connections // self.shards),
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.timeout = timeout or httpx.Timeout(connect=60.0, read=120.0, write=120.0, pool=60.0)
+        self.transport = transport
+        self._clients: list[httpx.AsyncClient] = []
+        self._next = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._closing: set[asyncio.Task] = set()
+
+    def _get_http(self) -> httpx.AsyncClient:
+        # The clients are bound to the event loop they were created on.
+        loop = asyncio.get_running_loop()
+        if not self._clients or self._loop is not loop:
+            if self._clients:
+                self._close_later(self._clients, self._loop)
+            ssl_context = httpx.create_ssl_context()
+            self._clients = [
+                httpx.AsyncClient(
+                    limits=self.limits, timeout=self.timeout, verify=ssl_context, transport=self.transport
+                )
+                for _ in range(self.shards)
+            ]
+            self._loop = loop
+        self._next = (self._next + 1) % self.shards
+        return self._clients[self._next]
+
+    def _close_later(self, clients: list[httpx.AsyncClient], loop: asyncio.AbstractEventLoop):
+        """Close the clients of a previous event loop, on that loop if it still runs, else on this one."""
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close(clients), loop)
+        else:
+            task = asyncio.get_running_loop().create_task(self._close(clients))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(clients: list[httpx.AsyncClient]):
+        for http in clients:
+            try:
+                await http.aclose()
+            except Exception as e:
+                logger.debug("Failed to close an httpx client: " + str(e))
+
+    async def _build_request(self, operation_name: str, params: dict) -> httpx.Request:
+        operation_model = self.client.meta.service_model.operation_model(operation_name)
+        request_dict = self.client._convert_to_request_dict(
+            api_params=params,
+            operation_model=operation_model,
+            endpoint_url=self.client.meta.endpoint_url,
+            context={"client_region": self.client.meta.region_name, "client_config": self.client.meta.config},
+        )
+        request = create_request_object(request_dict)
+
+        credentials = self.client._request_signer._credentials
+        if getattr(credentials, "refresh_needed", None) and credentials.refresh_needed():
+            # Refreshing credentials may call STS or the container metadata endpoint.
+            await run_in_threadpool(credentials.get_frozen_credentials)
+        self.client._request_signer.sign(operation_name, request)
+
+        prepared = request.prepare()
+        return httpx.Request(
+            method=prepared.method,
+            url=prepared.url,
+            headers=dict(prepared.headers.items()),
+            content=prepared.body,
+        )
+
+    def _raise_error(self, operation_name: str, response: httpx.Response, body: bytes):
+        operation_model = self.client.meta.service_model.operation_model(operation_name)
+        parsed = self.client._response_parser.parse(
+            {"status_code": response.status_code, "headers": response.headers, "body": body},
+            operation_model.output_shape,
+        )
+        error_info = parsed.get("Error", {})
+        error_class = self.client.exceptions.from_code(error_info.get("QueryErrorCode") or error_info.get("Code"))
+        raise error_class(parsed, operation_name)
+
+    async def _call(self, operation_name: str, params: dict) -> dict:
+        request = await self._build_request(operation_name, params)
+        response = await self._get_http().send(request)
+        if response.status_code >= 300:
+            self._raise_error(operation_name, response, response.content)
+        operation_model = self.client.meta.service_model.operation_model(operation_name)
+        return self.client._response_parser.parse(
+            {"status_code": response.status_code, "headers": response.headers, "body": response.content},
+            operation_model.output_shape,
+        )
+
+    async def converse(self, **kwargs) -> dict:
+        return await self._call("Converse", kwargs)
+
+    async def invoke_model(self, **kwargs) -> dict:
+        return await self._call("InvokeModel", kwargs)
+
+    async def converse_stream(self, **kwargs) -> dict:
+        request = await self._build_request("ConverseStream", kwargs)
+        response = await self._get_http().send(request, stream=True)
+        if response.status_code >= 300:
+            try:
+                body = await response.aread()
+            finally:
+                await response.aclose()
+            self._raise_error("ConverseStream", response, body)
+        return {
+            "ResponseMetadata": {"HTTPStatusCode": response.status_code, "HTTPHeaders": dict(response.headers)},
+            "stream": self._iter_events(response),
+        }
+
+    async def _iter_events(self, response: httpx.Response) -> AsyncIterator[dict]:
+        """Decode the binary event stream, as botocore's EventStream does."""
+        event_shape = self.client.meta.service_model.operation_model("ConverseStream").get_event_stream_output()
+        parser = EventStreamJSONParser()
+        buffer = EventStreamBuffer()
+        try:
+            async for data in response.aiter_raw():
+                buffer.add_data(data)
+                for event in buffer:
+                    response_dict = event.to_response_dict()
+                    parsed = parser.parse(response_dict, event_shape)
+                    if response_dict["status_code"] != 200:
+                        raise EventStreamError(parsed, "ConverseStream")
+                    if parsed:
+                        yield parsed
+        finally:
+            await response.aclose()
+
+    async def aclose(self):
+        clients, self._clients = self._clients, []
+        await self._close(clients)
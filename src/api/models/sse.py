@@ -0,0 +1,208 @@
+import asyncio
+import time
+from collections import deque
+from typing import AsyncIterable, AsyncIterator, Callable
+
+import orjson
+
+_CHUNK_SUFFIX = b'}],"object":"chat.completion.chunk","usage":null}\n\n'
+# Events read ahead of the client by `coalesce_deltas` before the upstream stream is paused.
+_MAX_UNSENT = 64
+
+
+class ChunkSerializer:
+    """Writes OpenAI `chat.completion.chunk` SSE frames straight from Bedrock ConverseStream events.
+
+    The id, created and model fields are rendered once per stream into byte templates, and
+    only the variable part of each event (text deltas, tool call arguments) is escaped with
+    orjson. The frames are byte for byte those of the pydantic path (ChatStreamResponse
+    serialized by `stream_response_to_bytes`), except that `created` is the stream's start.
+    """
+
+    def __init__(
+        self,
+        message_id: str,
+        model: str,
+        convert_finish_reason: Callable[[str | None], str | None],
+        include_usage: bool = False,
+        created: int | None = None,
+    ):
+        self.convert_finish_reason = convert_finish_reason
+        self.include_usage = include_usage
+        head = orjson.dumps(
+            {
+                "id": message_id,
+                "created": int(time.time()) if created is None else created,
+                "model": model,
+                "system_fingerprint": "fp",
+            }
+        )[:-1]
+        self._choice_prefix = b"data: " + head + b',"choices":[{"index":0,"finish_reason":'
+        self._delta_prefix = self._choice_prefix + b'null,"logprobs":null,"delta":'
+        self._usage_prefix = b"data: " + head + b',"choices":[],"object":"chat.completion.chunk","usage":'
+
+    def _delta(self, delta: bytes) -> bytes:
+        return self._delta_prefix + delta + _CHUNK_SUFFIX
+
+    def text(self, text: str) -> bytes:
+        return self._delta_prefix + b'{"content":' + orjson.dumps(text) + b"}" + _CHUNK_SUFFIX
+
+    def serialize(self, chunk: dict) -> bytes | None:
+        """Return the frame of a stream event, b"" if nothing is sent for it, or None if the
+        event is not supported (to be serialized by the pydantic path)."""
+        if len(chunk) != 1:
+            return None
+        if "contentBlockDelta" in chunk:
+            event = chunk["contentBlockDelta"]
+            delta = event["delta"]
+            if "text" in delta:
+                return self.text(delta["text"])
+            if "reasoningContent" in delta:
+                # ignore "signature" in the delta.
+                if "text" not in delta["reasoningContent"]:
+                    return b""
+                return self._delta(b'{"reasoning_content":' + orjson.dumps(delta["reasoningContent"]["text"]) + b"}")
+            if "toolUse" in delta:
+                # first index is content
+                index = event["contentBlockIndex"] - 1
+                arguments = orjson.dumps(delta["toolUse"]["input"])
+                return self._delta(b'{"tool_calls":[{"index":%d,"function":{"arguments":%b}}]}' % (index, arguments))
+            return None
+        if "contentBlockStart" in chunk:
+            event = chunk["contentBlockStart"]
+            if "toolUse" not in event["start"]:
+                return b""
+            tool = event["start"]["toolUse"]
+            tool_call = orjson.dumps(
+                {
+                    "index": event["contentBlockIndex"] - 1,
+                    "id": tool["toolUseId"],
+                    "type": "function",
+                    "function": {"name": tool["name"], "arguments": ""},
+                }
+            )
+            return self._delta(b'{"tool_calls":[' + tool_call + b"]}")
+        if "contentBlockStop" in chunk:
+            return b""
+        if "messageStart" in chunk:
+            if chunk["messageStart"]["role"] != "assistant":
+                return None
+            return self._delta(b'{"role":"assistant","content":""}')
+        if "messageStop" in chunk:
+            finish_reason = orjson.dumps(self.convert_finish_reason(chunk["messageStop"]["stopReason"]))
+            return self._choice_prefix + finish_reason + b',"logprobs":null,"delta":{}' + _CHUNK_SUFFIX
+        if "metadata" in chunk:
+            usage = chunk["metadata"].get("usage")
+            if usage is None or not self.include_usage:
+                return b""
+            return self._usage_prefix + b'{"prompt_tokens":%d,"completion_tokens":%d,"total_tokens":%d}}\n\n' % (
+                usage["inputTokens"],
+                usage["outputTokens"],
+                usage["totalTokens"],
+            )
+        return None
+
+
+def _text_delta(event: dict) -> tuple[str, int, str] | None:
+    """The (kind, content block index, text) of a text or reasoning text delta event."""
+    if len(event) != 1 or "contentBlockDelta" not in event:
+        return None
+    delta = event["contentBlockDelta"]["delta"]
+    if "text" in delta:
+        return "text", event["contentBlockDelta"]["contentBlockIndex"], delta["text"]
+    if "reasoningContent" in delta and "text" in delta["reasoningContent"]:
+        return "reasoning", event["contentBlockDelta"]["contentBlockIndex"], delta["reasoningContent"]["text"]
+    return None
+
+
+def _merged_delta(kind: str, index: int, texts: list[str]) -> dict:
+    text = "".join(texts)
+    delta = {"text": text} if kind == "text" else {"reasoningContent": {"text": text}}
+    return {"contentBlockDelta": {"delta": delta, "contentBlockIndex": index}}
+
+
+async def coalesce_deltas(events: AsyncIterable[dict], window: float, max_bytes: int = 512) -> AsyncIterator[dict]:
+    """Merge consecutive text (or reasoning text) deltas of a ConverseStream into single events.
+
+    Buffered text is sent once it reaches `max_bytes` (UTF-8) or `window` seconds after its
+    first delta, whichever comes first, so that a stream makes fewer and larger writes.
+    Any other event (tool calls, block and message stops, metadata) flushes the buffer and
+    is sent immediately.
+
+    The events are read by a task, which only wakes the consumer when there is something
+    to send, so merged deltas cost no more than a plain relay.
+    """
+    loop = asyncio.get_running_loop()
+    # events to send, and the future the consumer waits on for more
+    ready: deque[dict] = deque()
+    waiter: asyncio.Future | None = None
+    # future the reader waits on while too many events are unsent (slow client)
+    drained: asyncio.Future | None = None
+    buffer: list[str] = []
+    size = 0
+    key = None
+    timer: asyncio.TimerHandle | None = None
+    finished = False
+    error: BaseException | None = None
+
+    def wake(future: asyncio.Future | None):
+        if future is not None and not future.done():
+            future.set_result(None)
+
+    def flush():
+        nonlocal buffer, size, timer
+        if timer is not None:
+            timer.cancel()
+            timer = None
+        if buffer:
+            ready.append(_merged_delta(*key, buffer))
+            buffer, size = [], 0
+            wake(waiter)
+
+    async def read():
+        nonlocal key, size, timer, finished, error, drained
+        try:
+            async for event in events:
+                delta = _text_delta(event)
+                if delta is None:
+                    flush()
+                    ready.append(event)
+                    wake(waiter)
+                else:
+                    kind, index, text = delta
+                    if buffer and key != (kind, index):
+                        flush()
+                    if not buffer:
+                        key = (kind, index)
+                        timer = loop.call_later(window, flush)
+                    buffer.append(text)
+                    size += len(text.encode())
+                    if size >= max_bytes:
+                        flush()
+                if len(ready) >= _MAX_UNSENT:
+                    drained = loop.create_future()
+                    await drained
+        except Exception as e:
+            error = e
+        finally:
+            # send the text received before the end (or an error)
+            flush()
+            finished = True
+            wake(waiter)
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            while ready:
+                yield ready.popleft()
+            wake(drained)
+            if finished:
+                break
+            waiter = loop.create_future()
+            await waiter
+        if error is not None:
+            raise error
+    finally:
+        reader.cancel()
+        if timer is not None:
+            timer.cancel()
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Iterable
+
+from api.setting import (
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MODEL_CONCURRENCY,
+    STREAM_PUMP_QUEUE_SIZE,
+    STREAM_PUMP_STALL_TIMEOUT,
+    STREAM_PUMP_WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Dedicated pool so that long-lived stream readers never compete with
+# Starlette's default thread limiter used by run_in_threadpool. A stream admitted by
+# admission control holds a worker while it is read, hence at least as many workers.
+_executor = ThreadPoolExecutor(
+    max_workers=max(STREAM_PUMP_WORKERS, ADMISSION_MAX_CONCURRENCY, *ADMISSION_MODEL_CONCURRENCY.values()),
+    thread_name_prefix="stream-pump",
+)
+
+_DONE = object()
+
+
+class _StreamError:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+async def pump_stream(
+    stream: Iterable, queue_size: int = STREAM_PUMP_QUEUE_SIZE, stall_timeout: float = STREAM_PUMP_STALL_TIMEOUT
+) -> AsyncIterator:
+    """Iterate a blocking stream (e.g. a botocore EventStream) without blocking the event loop.
+
+    A worker thread reads the stream and hands items over through a queue holding at most
+    `queue_size` items, so a slow client applies backpressure to the upstream read.
+    If the consumer stops early (e.g. the client disconnected), the reader is stopped and
+    the underlying stream is closed. So is it if the consumer doesn't take an item for
+    `stall_timeout` seconds while the queue is full, the consumer then gets a TimeoutError
+    after the buffered items.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    slots = threading.Semaphore(queue_size)
+    stopped = threading.Event()
+
+    def put(item) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            # Event loop already closed, nobody is listening anymore.
+            stopped.set()
+
+    def close_stream() -> None:
+        close = getattr(stream, "close", None)
+        if close:
+            try:
+                close()
+            except Exception as e:
+                logger.debug("Failed to close stream: " + str(e))
+
+    def read() -> None:
+        try:
+            for item in stream:
+                if not slots.acquire(timeout=stall_timeout):
+                    close_stream()
+                    put(_StreamError(TimeoutError(f"Stream not consumed for {stall_timeout} seconds")))
+                    return
+                if stopped.is_set():
+                    return
+                put(item)
+            put(_DONE)
+        except Exception as e:
+            if not stopped.is_set():
+                put(_StreamError(e))
+
+    reader = loop.run_in_executor(_executor, read)
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, _StreamError):
+                raise item.exc
+            slots.release()
+            yield item
+    finally:
+        if not reader.done():
+            stopped.set()
+            # Wake up the reader if it is waiting for a free slot.
+            slots.release()
+            close_stream()
@@ -0,0 +1,42 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from api.models.batching import fan_out, split_batches
+
+
+@pytest.mark.asyncio
+async def test_fan_out_preserves_order_and_limits_concurrency():
+    active = 0
+    max_active = 0
+
+    async def func(i):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.001 * (10 - i))
+        active -= 1
+        return i * 2
+
+    assert await fan_out(list(range(10)), func, concurrency=3) == [i * 2 for i in range(10)]
+    assert max_active == 3
+
+
+@pytest.mark.asyncio
+async def test_fan_out_raises_errors_and_cancels_the_other_calls():
+    async def invalid(i):
+        if i == 0:
+            raise HTTPException(status_code=400, detail="bad")
+        await asyncio.sleep(10)
+
+    with pytest.raises(HTTPException) as e:
+        await asyncio.wait_for(fan_out([0, 1], invalid), 1)
+    assert e.value.status_code == 400
+
+
+def test_split_batches_by_count_and_size():
+    assert split_batches([1, 2, 3, 4, 5], max_items=2) == [[1, 2], [3, 4], [5]]
+    texts = ["aaaa", "bb", "cc", "dddddddd", "e"]
+    assert split_batches(texts, max_items=10, max_size=5) == [["aaaa"], ["bb", "cc"], ["dddddddd"], ["e"]]
+    assert split_batches([], max_items=2) == []
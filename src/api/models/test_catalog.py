@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from api.models.catalog import ModelCatalog
+
+
+class Loader:
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def test_load_uses_fallback_on_failure():
+    catalog = ModelCatalog(Loader([RuntimeError("denied")]), fallback={"default": {"modalities": ["TEXT"]}})
+    catalog.load()
+    assert list(catalog.models) == ["default"]
+    assert catalog.refreshed_at == 0
+
+
+def test_snapshot_is_immutable():
+    catalog = ModelCatalog(Loader([{"a": {"modalities": ["TEXT"]}}]))
+    catalog.load()
+    with pytest.raises(TypeError):
+        catalog.snapshot.models["b"] = {}
+    assert catalog.refreshed_at > 0
+
+
+@pytest.mark.asyncio
+async def test_reads_are_served_from_memory_until_stale():
+    loader = Loader([{"a": {}}, {"a": {}, "b": {}}])
+    catalog = ModelCatalog(loader, ttl=60)
+    catalog.load()
+    for _ in range(10):
+        assert list(catalog.models) == ["a"]
+    await asyncio.sleep(0)
+    assert loader.calls == 1
+
+    # Once stale, readers get the old snapshot while it refreshes in the background.
+    catalog.ttl = 0
+    assert list(catalog.models) == ["a"]
+    await asyncio.sleep(0.1)
+    assert list(catalog.models) == ["a", "b"]
+    assert loader.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_failure_keeps_previous_snapshot():
+    catalog = ModelCatalog(Loader([{"a": {}}, RuntimeError("throttled")]))
+    catalog.load()
+    refreshed_at = catalog.refreshed_at
+    await catalog.refresh()
+    assert list(catalog.models) == ["a"]
+    assert catalog.refreshed_at == refreshed_at
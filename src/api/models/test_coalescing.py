@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from api.models.coalescing import EmbeddingCoalescer
+
+
+class Upstream:
+    def __init__(self, error: Exception | None = None, delay: float = 0):
+        self.calls = []
+        self.error = error
+        self.delay = delay
+
+    async def fetch(self, texts: list[str]) -> list[str]:
+        self.calls.append(list(texts))
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [text.upper() for text in texts]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_a_call():
+    coalescer = EmbeddingCoalescer(window=0.01, max_items=96)
+    upstream = Upstream()
+    results = await asyncio.gather(
+        coalescer.fetch("m", ["a", "b"], upstream.fetch),
+        coalescer.fetch("m", ["c"], upstream.fetch),
+        coalescer.fetch("m", ["d", "e"], upstream.fetch),
+    )
+    assert results == [["A", "B"], ["C"], ["D", "E"]]
+    assert upstream.calls == [["a", "b", "c", "d", "e"]]
+    assert coalescer.collect() == {"requests": 3, "batches": 1, "texts": 5, "pending": 0}
+
+
+@pytest.mark.asyncio
+async def test_batches_are_limited_and_keyed():
+    coalescer = EmbeddingCoalescer(window=10, max_items=96)
+    upstream = Upstream()
+    # a full batch is sent without waiting for the window
+    results = await asyncio.wait_for(
+        asyncio.gather(
+            coalescer.fetch("m", ["a", "b"], upstream.fetch, max_items=3),
+            coalescer.fetch("m", ["c", "d"], upstream.fetch, max_items=3),
+            coalescer.fetch("m", ["e"], upstream.fetch, max_items=3),
+            coalescer.fetch("m", ["f", "g", "h"], upstream.fetch, max_items=3),
+        ),
+        timeout=1,
+    )
+    assert results == [["A", "B"], ["C", "D"], ["E"], ["F", "G", "H"]]
+    assert sorted(upstream.calls) == [["a", "b"], ["c", "d", "e"], ["f", "g", "h"]]
+
+    coalescer.window = 0.01
+    upstream.calls.clear()
+    await asyncio.gather(coalescer.fetch("x", ["a"], upstream.fetch), coalescer.fetch("y", ["b"], upstream.fetch))
+    assert sorted(upstream.calls) == [["a"], ["b"]]
+
+
+@pytest.mark.asyncio
+async def test_errors_reach_every_caller():
+    coalescer = EmbeddingCoalescer(window=0.01, max_items=96)
+    upstream = Upstream(error=ValueError("boom"))
+    results = await asyncio.gather(
+        coalescer.fetch("m", ["a"], upstream.fetch),
+        coalescer.fetch("m", ["b"], upstream.fetch),
+        return_exceptions=True,
+    )
+    assert [str(r) for r in results] == ["boom", "boom"]
+    assert len(upstream.calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_batch():
+    coalescer = EmbeddingCoalescer(window=0.01, max_items=96)
+    upstream = Upstream(delay=0.02)
+    first = asyncio.ensure_future(coalescer.fetch("m", ["a"], upstream.fetch))
+    second = asyncio.ensure_future(coalescer.fetch("m", ["b"], upstream.fetch))
+    await asyncio.sleep(0.015)
+    first.cancel()
+    assert await second == ["B"]
+    assert first.cancelled()
@@ -0,0 +1,53 @@
+import os
+
+import numpy as np
+import pytest
+
+from api.models.embedding_cache import DiskEmbeddingStore, EmbeddingCache, cache_key
+
+
+def test_cache_key_normalizes_text():
+    assert cache_key("m", "café") == cache_key("m", "café")
+    assert cache_key("m", "a") != cache_key("n", "a")
+
+
+def test_memory_cache_evicts_by_bytes():
+    cache = EmbeddingCache(max_bytes=2 * (4 * 4 + 200))
+    for i in range(3):
+        cache.put_many([(bytes([i]), [float(i)] * 4, i)])
+    assert cache.get(bytes([0])) is None
+    vector, tokens = cache.get(bytes([2]))
+    assert vector.tolist() == [2.0] * 4 and tokens == 2
+    stats = cache.collect()
+    assert stats["evictions"] == 1 and stats["hits"] == 1 and stats["misses"] == 1
+
+
+def test_disk_store_ring_buffer_and_reload(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), max_bytes=2 * 3 * 4)
+    for i in range(3):
+        store.put(bytes([i]), np.full(3, i, dtype=np.float32), i)
+    # the oldest vector was overwritten
+    assert store.get(bytes([0])) is None
+    assert store.overwrites == 1
+    store.close()
+
+    store = DiskEmbeddingStore(str(tmp_path), max_bytes=2 * 3 * 4)
+    assert len(store) == 2
+    vector, tokens = store.get(bytes([2]))
+    assert vector.tolist() == [2.0] * 3 and tokens == 2
+    # writes continue after the last written row
+    store.put(bytes([3]), np.full(3, 3, dtype=np.float32), 3)
+    assert store.get(bytes([1])) is None and store.get(bytes([2])) is not None
+    store.close()
+
+
+def test_disk_store_is_locked(tmp_path):
+    store = DiskEmbeddingStore(str(tmp_path), max_bytes=1024)
+    open_files = len(os.listdir("/proc/self/fd"))
+    with pytest.raises(OSError):
+        DiskEmbeddingStore(str(tmp_path), max_bytes=1024)
+    # the lock file of the failed attempt is closed
+    assert len(os.listdir("/proc/self/fd")) == open_files
+    # the cache falls back to memory only
+    assert EmbeddingCache(max_bytes=1024, directory=str(tmp_path)).disk is None
+    store.close()
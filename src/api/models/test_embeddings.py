@@ -0,0 +1,266 @@
+import asyncio
+import base64
+import json
+import threading
+from unittest.mock import patch
+
+import boto3
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+from api.models import bedrock, tokenizer
+from api.models.coalescing import EmbeddingCoalescer
+from api.models.embedding_cache import EmbeddingCache
+from api.models.retry import Retrier
+from api.schema import Embedding, EmbeddingsRequest, EmbeddingsResponse, EmbeddingsUsage
+
+
+@pytest.fixture(autouse=True)
+def embedding_cache():
+    """No embedding cache unless a test sets one."""
+    cache = {"cache": None}
+    with patch.object(bedrock, "get_embedding_cache", side_effect=lambda: cache["cache"]):
+        yield cache
+
+
+class FakeEncoder:
+    """One token per character, token ids are code points."""
+
+    def decode(self, tokens):
+        return "".join(map(chr, tokens))
+
+    def decode_batch(self, batch, num_threads=8):
+        return [self.decode(tokens) for tokens in batch]
+
+    def encode_ordinary(self, text):
+        return list(map(ord, text))
+
+    def encode_ordinary_batch(self, texts, num_threads=8):
+        return [self.encode_ordinary(text) for text in texts]
+
+
+@pytest.fixture(autouse=True)
+def encoder():
+    with patch.object(tokenizer, "_encoder", FakeEncoder()):
+        yield
+
+
+@pytest.fixture(autouse=True)
+def retrier():
+    with patch.object(bedrock, "retrier", Retrier(base_delay=0)):
+        yield
+
+
+def parse(response) -> EmbeddingsResponse:
+    return EmbeddingsResponse.model_validate_json(response.body)
+
+
+class FakeRuntime:
+    def __init__(self, body: dict | None = None, error: Exception | None = None):
+        self.exceptions = boto3.client("bedrock-runtime", region_name="us-west-2").exceptions
+        self.body = json.dumps(body).encode()
+        self.error = error
+        self.calls = []
+
+    async def invoke_model(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.error:
+            raise self.error
+        return {"body": self.body}
+
+
+@pytest.mark.asyncio
+async def test_cohere_embed_is_async():
+    runtime = FakeRuntime({"embeddings": [[0.1, 0.2], [0.3, 0.4]]})
+    request = EmbeddingsRequest(model="cohere.embed-multilingual-v3", input=["a", "b"])
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        response = parse(await bedrock.get_embeddings_model(request.model).embed(request))
+    assert [d.embedding for d in response.data] == [[0.1, 0.2], [0.3, 0.4]]
+    assert json.loads(runtime.calls[0]["body"])["texts"] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_cohere_reports_prompt_tokens():
+    runtime = FakeRuntime({"embeddings": [[0.1], [0.2]]})
+    request = EmbeddingsRequest(model="cohere.embed-english-v3", input=["abc", "de"])
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        response = parse(await bedrock.get_embeddings_model(request.model).embed(request))
+    assert response.usage.prompt_tokens == 5
+    assert response.usage.total_tokens == 5
+
+
+@pytest.mark.asyncio
+async def test_token_inputs_are_decoded():
+    runtime = FakeRuntime({"embeddings": [[0.1], [0.2], [0.3]]})
+    model = bedrock.get_embeddings_model("cohere.embed-english-v3")
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        await model.embed(EmbeddingsRequest(model="cohere.embed-english-v3", input=[[104, 105], [111, 107], 97, 98]))
+        await model.embed(EmbeddingsRequest(model="cohere.embed-english-v3", input=[120, 121]))
+    assert json.loads(runtime.calls[0]["body"])["texts"] == ["hi", "ok", "ab"]
+    assert json.loads(runtime.calls[1]["body"])["texts"] == ["xy"]
+
+
+@pytest.mark.asyncio
+async def test_large_bodies_are_decoded(monkeypatch):
+    monkeypatch.setattr(bedrock.BedrockEmbeddingsModel, "offload_decode_bytes", 10)
+    runtime = FakeRuntime({"embedding": [0.5] * 100, "inputTextTokenCount": 3})
+    request = EmbeddingsRequest(model="amazon.titan-embed-text-v2:0", input="a")
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        response = parse(await bedrock.get_embeddings_model(request.model).embed(request))
+    assert response.data[0].embedding == [0.5] * 100
+    assert response.usage.prompt_tokens == 3
+
+
+@pytest.mark.asyncio
+async def test_base64_response_matches_pydantic_serialization():
+    runtime = FakeRuntime({"embeddings": [[0.1, -2.5], [3.0, 1e-7]]})
+    request = EmbeddingsRequest(model="cohere.embed-english-v3", input=["a", "b"], encoding_format="base64")
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        response = await bedrock.get_embeddings_model(request.model).embed(request)
+    expected = EmbeddingsResponse(
+        data=[
+            Embedding(embedding=base64.b64encode(np.array(e, dtype=np.float32).tobytes()), index=i)
+            for i, e in enumerate([[0.1, -2.5], [3.0, 1e-7]])
+        ],
+        model=request.model,
+        usage=EmbeddingsUsage(prompt_tokens=2, total_tokens=2),
+    )
+    assert response.media_type == "application/json"
+    assert json.loads(response.body) == json.loads(expected.model_dump_json())
+
+
+@pytest.mark.asyncio
+async def test_throttling_maps_to_429():
+    exceptions = FakeRuntime().exceptions
+    error = exceptions.ThrottlingException({"Error": {"Code": "ThrottlingException", "Message": "slow"}}, "InvokeModel")
+    request = EmbeddingsRequest(model="cohere.embed-english-v3", input="a")
+    with patch.object(bedrock, "get_runtime", return_value=FakeRuntime(error=error)):
+        with pytest.raises(HTTPException) as e:
+            await bedrock.get_embeddings_model(request.model).embed(request)
+    assert e.value.status_code == 429
+    assert bedrock.retrier.collect()["cohere.embed-english-v3"]["throttles"] == 4
+
+
+@pytest.mark.asyncio
+async def test_titan_fans_out_list_inputs():
+    class TitanRuntime(FakeRuntime):
+        async def invoke_model(self, **kwargs):
+            text = json.loads(kwargs["body"])["inputText"]
+            self.calls.append(text)
+            return {"body": json.dumps({"embedding": [float(len(text))], "inputTextTokenCount": len(text)}).encode()}
+
+    runtime = TitanRuntime()
+    request = EmbeddingsRequest(model="amazon.titan-embed-text-v2:0", input=["a", "bbb", "cc"])
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        response = parse(await bedrock.get_embeddings_model(request.model).embed(request))
+    assert sorted(runtime.calls) == ["a", "bbb", "cc"]
+    assert [(d.index, d.embedding) for d in response.data] == [(0, [1.0]), (1, [3.0]), (2, [2.0])]
+    assert response.usage.prompt_tokens == 6
+
+
+@pytest.mark.asyncio
+async def test_cohere_splits_large_inputs_in_order():
+    class CohereRuntime(FakeRuntime):
+        async def invoke_model(self, **kwargs):
+            texts = json.loads(kwargs["body"])["texts"]
+            self.calls.append(len(texts))
+            return {"body": json.dumps({"embeddings": [[float(t)] for t in texts]}).encode()}
+
+    runtime = CohereRuntime()
+    request = EmbeddingsRequest(model="cohere.embed-english-v3", input=[str(i) for i in range(200)])
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        response = parse(await bedrock.get_embeddings_model(request.model).embed(request))
+    assert runtime.calls == [96, 96, 8]
+    assert [d.embedding for d in response.data] == [[float(i)] for i in range(200)]
+    assert [d.index for d in response.data] == list(range(200))
+
+
+class CountingCohereRuntime(FakeRuntime):
+    async def invoke_model(self, **kwargs):
+        texts = json.loads(kwargs["body"])["texts"]
+        self.calls.append(texts)
+        return {"body": json.dumps({"embeddings": [[float(len(t)), 0.5] for t in texts]}).encode()}
+
+
+@pytest.mark.asyncio
+async def test_cache_sends_only_misses_upstream(embedding_cache):
+    cache = embedding_cache["cache"] = EmbeddingCache(max_bytes=1024 * 1024)
+    runtime = CountingCohereRuntime()
+    model = bedrock.get_embeddings_model("cohere.embed-english-v3")
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        await model.embed(EmbeddingsRequest(model="cohere.embed-english-v3", input=["a", "bb"]))
+        request = EmbeddingsRequest(model="cohere.embed-english-v3", input=["ccc", "bb", "a", "ccc"])
+        response = parse(await model.embed(request))
+        # another model does not share the entries
+        await model.embed(EmbeddingsRequest(model="cohere.embed-multilingual-v3", input=["a"]))
+    assert runtime.calls == [["a", "bb"], ["ccc"], ["a"]]
+    assert [d.embedding for d in response.data] == [[3.0, 0.5], [2.0, 0.5], [1.0, 0.5], [3.0, 0.5]]
+    stats = cache.collect()
+    assert stats["hits"] == 2 and stats["misses"] == 5
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_survives_restart(embedding_cache, tmp_path):
+    request = EmbeddingsRequest(model="cohere.embed-english-v3", input=["a", "bb"])
+    model = bedrock.get_embeddings_model(request.model)
+    runtime = CountingCohereRuntime()
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        embedding_cache["cache"] = EmbeddingCache(max_bytes=1024, directory=str(tmp_path), disk_max_bytes=4096)
+        first = parse(await model.embed(request))
+        embedding_cache["cache"].close()
+
+        cache = embedding_cache["cache"] = EmbeddingCache(max_bytes=1024, directory=str(tmp_path), disk_max_bytes=4096)
+        second = parse(await model.embed(request))
+        cache.close()
+    assert len(runtime.calls) == 1
+    assert first.data == second.data
+    assert cache.collect()["disk_hits"] == 2
+
+
+@pytest.mark.asyncio
+async def test_disk_cache_is_used_off_the_event_loop(embedding_cache, tmp_path):
+    cache = embedding_cache["cache"] = EmbeddingCache(max_bytes=1024, directory=str(tmp_path), disk_max_bytes=4096)
+    threads = []
+    get_many, put_many = cache.get_many, cache.put_many
+
+    def record(func):
+        def wrapper(*args):
+            threads.append(threading.current_thread())
+            return func(*args)
+
+        return wrapper
+
+    request = EmbeddingsRequest(model="cohere.embed-english-v3", input=["a", "bb"])
+    model = bedrock.get_embeddings_model(request.model)
+    with (
+        patch.object(bedrock, "get_runtime", return_value=CountingCohereRuntime()),
+        patch.object(cache, "get_many", record(get_many)),
+        patch.object(cache, "put_many", record(put_many)),
+    ):
+        await model.embed(request)
+    cache.close()
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_coalesced(monkeypatch):
+    monkeypatch.setattr(bedrock, "embedding_coalescer", EmbeddingCoalescer(window=0.01, max_items=96))
+    runtime = CountingCohereRuntime()
+    model = bedrock.get_embeddings_model("cohere.embed-english-v3")
+    with patch.object(bedrock, "get_runtime", return_value=runtime):
+        responses = await asyncio.gather(
+            model.embed(EmbeddingsRequest(model="cohere.embed-english-v3", input=["a", "bb"])),
+            model.embed(EmbeddingsRequest(model="cohere.embed-english-v3", input="ccc")),
+            # a different model is not batched with the others
+            model.embed(EmbeddingsRequest(model="cohere.embed-multilingual-v3", input="dddd")),
+        )
+    assert sorted(runtime.calls) == [["a", "bb", "ccc"], ["dddd"]]
+    responses = [parse(response) for response in responses]
+    assert [[d.embedding for d in response.data] for response in responses] == [
+        [[1.0, 0.5], [2.0, 0.5]],
+        [[3.0, 0.5]],
+        [[4.0, 0.5]],
+    ]
+    assert [response.usage.prompt_tokens for response in responses] == [3, 3, 4]
@@ -0,0 +1,113 @@
+import asyncio
+import base64
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from api.models.images import ImageFetcher
+
+PNG = b"\x89PNG" + b"0" * 100
+
+
+def make_fetcher(handler, **kwargs):
+    return ImageFetcher(transport=httpx.MockTransport(handler), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_fetch_caches_by_url():
+    calls = []
+
+    def handler(request):
+        calls.append(request.url)
+        return httpx.Response(200, headers={"Content-Type": "image/png"}, content=PNG)
+
+    fetcher = make_fetcher(handler)
+    assert await fetcher.fetch("https://img/a.png") == (PNG, "image/png")
+    assert await fetcher.fetch("https://img/a.png") == (PNG, "image/png")
+    await fetcher.aclose()
+    assert len(calls) == 1
+    assert fetcher.collect()["cache"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_downloads_concurrently_once_per_url():
+    active = 0
+    max_active = 0
+
+    async def handler(request):
+        nonlocal active, max_active
+        active += 1
+        max_active = max(max_active, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        return httpx.Response(200, headers={"Content-Type": "image/png"}, content=request.url.path.encode())
+
+    fetcher = make_fetcher(handler)
+    urls = ["https://img/a", "https://img/b", "https://img/a", "https://other/c"]
+    images = await fetcher.fetch_all(urls)
+    await fetcher.aclose()
+    assert images["https://img/b"] == (b"/b", "image/png")
+    assert len(images) == 3
+    assert max_active == 3
+    assert fetcher.downloads == 3
+
+
+@pytest.mark.asyncio
+async def test_stale_entries_are_revalidated_with_etag():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("If-None-Match"))
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304, headers={"Cache-Control": "max-age=0"})
+        return httpx.Response(200, headers={"ETag": '"v1"', "Cache-Control": "no-cache"}, content=PNG)
+
+    fetcher = make_fetcher(handler)
+    first = await fetcher.fetch("https://img/a")
+    second = await fetcher.fetch("https://img/a")
+    await fetcher.aclose()
+    assert seen == [None, '"v1"']
+    # content type defaults to jpeg if the server does not send an image type.
+    assert first == second == (PNG, "image/jpeg")
+    assert fetcher.not_modified == 1
+
+
+@pytest.mark.asyncio
+async def test_no_store_is_not_cached():
+    fetcher = make_fetcher(lambda request: httpx.Response(200, headers={"Cache-Control": "no-store"}, content=PNG))
+    await fetcher.fetch("https://img/a")
+    await fetcher.aclose()
+    assert len(fetcher.cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_size_cap_and_errors():
+    def handler(request):
+        if request.url.path == "/missing":
+            return httpx.Response(404)
+        if request.url.path == "/down":
+            raise httpx.ConnectError("down")
+        return httpx.Response(200, content=PNG)
+
+    fetcher = make_fetcher(handler, max_bytes=10)
+    with pytest.raises(HTTPException) as e:
+        await fetcher.fetch("https://img/big")
+    assert e.value.status_code == 400
+    for path in ("/missing", "/down"):
+        with pytest.raises(HTTPException) as e:
+            await fetcher.fetch(f"https://img{path}")
+        assert e.value.status_code == 500
+    await fetcher.aclose()
+    assert fetcher.failures == 3
+
+
+@pytest.mark.asyncio
+async def test_data_urls_are_memoized():
+    fetcher = ImageFetcher()
+    url = "data:image/png;base64," + base64.b64encode(PNG).decode()
+    first = await fetcher.fetch(url)
+    assert first == (PNG, "image/png")
+    assert await fetcher.fetch(url) is first
+    with pytest.raises(HTTPException):
+        await fetcher.fetch("data:text/plain;base64,AAAA")
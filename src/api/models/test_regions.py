@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+from botocore.exceptions import ClientError
+
+from api.models.regions import CircuitBreaker, MultiRegionRuntime, Region, parse_regions
+
+
+def client_error(code: str, message: str = "") -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, "Converse")
+
+
+class FakeRuntime:
+    client = None
+
+    def __init__(self, name: str, error: Exception | None = None, delay: float = 0):
+        self.name = name
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    async def converse(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {"region": self.name}
+
+    async def converse_stream(self, **kwargs):
+        async def stream():
+            yield {"region": self.name}
+
+        return {"stream": stream()}
+
+
+def multi_region(*runtimes: FakeRuntime, **kwargs) -> MultiRegionRuntime:
+    return MultiRegionRuntime(
+        [Region(r.name, r, breaker=CircuitBreaker(r.name, failure_threshold=2, reset_timeout=0.05)) for r in runtimes],
+        **kwargs,
+    )
+
+
+def test_parse_regions():
+    assert parse_regions("us-west-2:3, us-east-1", "eu-west-1") == [("us-west-2", 3.0), ("us-east-1", 1.0)]
+    assert parse_regions("", "eu-west-1") == [("eu-west-1", 1.0)]
+
+
+@pytest.mark.asyncio
+async def test_least_outstanding_spreads_calls():
+    west, east = FakeRuntime("us-west-2", delay=0.01), FakeRuntime("us-east-1", delay=0.01)
+    runtime = multi_region(west, east)
+    results = await asyncio.gather(*(runtime.converse(modelId="m") for _ in range(4)))
+    assert sorted(r["region"] for r in results) == ["us-east-1", "us-east-1", "us-west-2", "us-west-2"]
+    # the first region is preferred when idle
+    assert (await runtime.converse(modelId="m"))["region"] == "us-west-2"
+    assert runtime.collect()["regions"]["us-west-2"]["outstanding"] == 0
+
+
+@pytest.mark.asyncio
+async def test_failover_and_circuit_breaker():
+    west, east = FakeRuntime("us-west-2", error=client_error("ThrottlingException")), FakeRuntime("us-east-1")
+    runtime = multi_region(west, east)
+    for _ in range(3):
+        assert (await runtime.converse(modelId="m"))["region"] == "us-east-1"
+    # the circuit opened after 2 failures, the third call skipped the region
+    assert west.calls == 2
+    assert runtime.collect()["regions"]["us-west-2"]["circuit"] == "open"
+    assert runtime.failovers == 2
+
+    await asyncio.sleep(0.06)
+    west.error = None
+    assert (await runtime.converse(modelId="m"))["region"] == "us-west-2"
+    assert runtime.regions[0].breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_all_regions_unavailable_raises():
+    error = client_error("ServiceUnavailableException")
+    runtime = multi_region(FakeRuntime("us-west-2", error=error), FakeRuntime("us-east-1", error=error))
+    with pytest.raises(ClientError):
+        await runtime.converse(modelId="m")
+
+
+@pytest.mark.asyncio
+async def test_models_not_served_in_a_region():
+    west = FakeRuntime("us-west-2", delay=0.01)
+    invalid = client_error("ValidationException", "The provided model identifier is invalid.")
+    east = FakeRuntime("us-east-1", error=invalid)
+    runtime = multi_region(west, east)
+    results = await asyncio.gather(*(runtime.converse(modelId="m") for _ in range(3)))
+    assert [r["region"] for r in results] == ["us-west-2"] * 3
+    assert list(runtime.unsupported) == [("us-east-1", "m")]
+    assert east.calls == 1
+
+    # other errors are the caller's
+    west.error = client_error("ValidationException", "messages: field required")
+    with pytest.raises(ClientError):
+        await runtime.converse(modelId="m")
+
+
+@pytest.mark.asyncio
+async def test_regions_not_serving_a_model_are_tried_again_later():
+    invalid = client_error("ValidationException", "The provided model identifier is invalid.")
+    west, east = FakeRuntime("us-west-2", delay=0.01), FakeRuntime("us-east-1", error=invalid)
+    runtime = multi_region(west, east, unsupported_ttl=0.05)
+    await asyncio.gather(*(runtime.converse(modelId="m") for _ in range(2)))
+    await asyncio.gather(*(runtime.converse(modelId="m") for _ in range(2)))
+    assert east.calls == 1
+
+    # the model was enabled in the region meanwhile
+    await asyncio.sleep(0.06)
+    east.error = None
+    results = await asyncio.gather(*(runtime.converse(modelId="m") for _ in range(2)))
+    assert sorted(r["region"] for r in results) == ["us-east-1", "us-west-2"]
+    assert not runtime.unsupported
+
+
+@pytest.mark.asyncio
+async def test_open_streams_are_outstanding():
+    runtime = multi_region(FakeRuntime("us-west-2"), FakeRuntime("us-east-1"))
+    first = await runtime.converse_stream(modelId="m")
+    second = await runtime.converse_stream(modelId="m")
+    assert [r.outstanding for r in runtime.regions] == [1, 1]
+    assert [event async for event in first["stream"]] == [{"region": "us-west-2"}]
+    assert [event async for event in second["stream"]] == [{"region": "us-east-1"}]
+    assert [r.outstanding for r in runtime.regions] == [0, 0]
+
+
+@pytest.mark.asyncio
+async def test_streams_never_iterated_are_not_outstanding():
+    runtime = multi_region(FakeRuntime("us-west-2"), FakeRuntime("us-east-1"))
+    first = await runtime.converse_stream(modelId="m")
+    second = await runtime.converse_stream(modelId="m")
+    assert [r.outstanding for r in runtime.regions] == [1, 1]
+    # e.g. the client disconnected before the first event
+    await first["stream"].aclose()
+    await first["stream"].aclose()
+    del second
+    assert [r.outstanding for r in runtime.regions] == [0, 0]
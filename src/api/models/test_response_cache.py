@@ -0,0 +1,265 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import boto3
+import pytest
+
+from api.models import bedrock
+from api.models.response_cache import (
+    MemoryBackend,
+    RedisBackend,
+    ResponseCache,
+    StreamRecorder,
+    replay,
+    request_key,
+)
+from api.models.retry import Retrier
+from api.schema import ChatRequest
+from api.singleflight import SingleFlight
+
+RESPONSE = {
+    "output": {
+        "message": {
+            "role": "assistant",
+            "content": [
+                {"reasoningContent": {"reasoningText": {"text": "think", "signature": "sig"}}},
+                {"text": "Hello"},
+                {"toolUse": {"toolUseId": "t1", "name": "f", "input": {"a": 1}}},
+            ],
+        }
+    },
+    "stopReason": "tool_use",
+    "usage": {"inputTokens": 3, "outputTokens": 4, "totalTokens": 7},
+}
+
+
+class FakeRedis:
+    """Stand-in for a redis-py asyncio client."""
+
+    def __init__(self):
+        self.data = {}
+        self.closed = False
+
+    async def get(self, key):
+        return self.data.get(key, (None, None))[0]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = (value, ex)
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeRuntime:
+    def __init__(self):
+        self.exceptions = boto3.client("bedrock-runtime", region_name="us-west-2").exceptions
+        self.calls = []
+
+    async def converse(self, **kwargs):
+        self.calls.append("converse")
+        await asyncio.sleep(0.01)
+        return {**RESPONSE, "metrics": {"latencyMs": 10}, "ResponseMetadata": {}}
+
+    async def converse_stream(self, **kwargs):
+        self.calls.append("converse_stream")
+        await asyncio.sleep(0.01)
+        return {"stream": replay(RESPONSE)}
+
+
+@pytest.fixture
+def cache():
+    cache = ResponseCache(MemoryBackend(1024 * 1024))
+    runtime = FakeRuntime()
+    with (
+        patch.object(bedrock, "get_response_cache", return_value=cache),
+        patch.object(bedrock, "get_runtime", return_value=runtime),
+        patch.object(bedrock, "retrier", Retrier(base_delay=0)),
+    ):
+        cache.runtime = runtime
+        yield cache
+
+
+@pytest.fixture
+def runtime():
+    """No response cache, identical concurrent deterministic requests are shared."""
+    runtime = FakeRuntime()
+    with (
+        patch.object(bedrock, "get_response_cache", return_value=None),
+        patch.object(bedrock, "get_runtime", return_value=runtime),
+        patch.object(bedrock, "retrier", Retrier(base_delay=0)),
+        patch.object(bedrock, "single_flight", SingleFlight()),
+        patch.object(bedrock, "SINGLE_FLIGHT", "deterministic"),
+    ):
+        yield runtime
+
+
+def request(temperature: float = 0, stream: bool = False, content: str = "Hi") -> ChatRequest:
+    return ChatRequest(
+        model="anthropic.claude-3-5-sonnet-20241022-v2:0",
+        messages=[{"role": "user", "content": content}],
+        temperature=temperature,
+        stream=stream,
+    )
+
+
+async def stream_frames(model: bedrock.BedrockModel, chat_request: ChatRequest, cache_control=None) -> list[dict]:
+    frames = [frame async for frame in model.chat_stream(chat_request, cache_control)]
+    return [json.loads(frame[6:]) for frame in frames[:-1]]
+
+
+def test_key_is_canonical():
+    args = {"modelId": "m", "inferenceConfig": {"temperature": 0, "topP": 1}, "image": b"\x00\x01"}
+    same = {"image": b"\x00\x01", "inferenceConfig": {"topP": 1, "temperature": 0}, "modelId": "m"}
+    assert request_key(args) == request_key(same)
+    assert request_key(args) != request_key({**args, "image": b"\x00\x02"})
+    assert request_key(args) != request_key({**args, "modelId": "n"})
+
+
+def test_policy_follows_cache_control():
+    assert ResponseCache.policy(None) == (True, True, None)
+    assert ResponseCache.policy("no-cache") == (False, True, None)
+    assert ResponseCache.policy("max-age=60, no-store") == (False, False, None)
+    assert ResponseCache.policy("max-age=60") == (True, True, 60)
+
+
+@pytest.mark.asyncio
+async def test_memory_entries_expire():
+    backend = MemoryBackend(1024)
+    await backend.set("k", b"v", ttl=60)
+    assert await backend.get("k") == b"v"
+    await backend.set("k", b"v", ttl=0)
+    assert await backend.get("k") is None
+    assert backend.collect()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_max_age_rejects_older_entries():
+    cache = ResponseCache(MemoryBackend(1024 * 1024))
+    await cache.put("k", RESPONSE)
+    assert await cache.get("k", max_age=60) == RESPONSE
+    with patch("time.time", return_value=2**40):
+        assert await cache.get("k", max_age=60) is None
+
+
+@pytest.mark.asyncio
+async def test_recorded_stream_replays_as_the_response():
+    recorder = StreamRecorder()
+    async for event in replay(RESPONSE):
+        recorder.add(event)
+    assert recorder.response() == RESPONSE
+
+
+@pytest.mark.asyncio
+async def test_incomplete_stream_is_not_stored():
+    cache = ResponseCache(MemoryBackend(1024 * 1024))
+    events = [event async for event in replay(RESPONSE)][:-1]
+
+    async def stream():
+        for event in events:
+            yield event
+
+    assert [event async for event in cache.record("k", stream())] == events
+    assert cache.stores == 0
+
+
+@pytest.mark.asyncio
+async def test_redis_backend_shares_entries():
+    client = FakeRedis()
+    writer, reader = ResponseCache(RedisBackend(client), ttl=10.5), ResponseCache(RedisBackend(client))
+    await writer.put("k", RESPONSE)
+    assert await reader.get("k") == RESPONSE
+    assert list(client.data.values())[0][1] == 11
+    await writer.aclose()
+    assert client.closed
+
+
+@pytest.mark.asyncio
+async def test_deterministic_chat_is_served_from_cache(cache):
+    model = bedrock.BedrockModel()
+    first = await model.chat(request())
+    second = await model.chat(request())
+    assert cache.runtime.calls == ["converse"]
+    assert second.choices == first.choices
+    assert second.usage == first.usage
+    assert (cache.hits, cache.misses, cache.stores) == (1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_other_requests_are_not_cached(cache):
+    model = bedrock.BedrockModel()
+    await model.chat(request(temperature=0.7))
+    await model.chat(request(temperature=0.7))
+    await model.chat(request(content="Hello"))
+    assert cache.runtime.calls == ["converse"] * 3
+
+
+@pytest.mark.asyncio
+async def test_cache_control_bypasses_the_cache(cache):
+    model = bedrock.BedrockModel()
+    await model.chat(request(), "no-store")
+    await model.chat(request(), "no-cache")
+    await model.chat(request())
+    assert cache.runtime.calls == ["converse", "converse"]
+    assert (cache.bypassed, cache.stores, cache.hits) == (2, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_cached_response_is_replayed_as_stream(cache):
+    model = bedrock.BedrockModel()
+    streamed = await stream_frames(model, request(stream=True))
+    await model.chat(request())
+    replayed = await stream_frames(model, request(stream=True))
+    # the streamed response was stored, and is also used by the non-stream request
+    assert cache.runtime.calls == ["converse_stream"]
+    for frame in streamed + replayed:
+        frame.pop("id"), frame.pop("created")
+    assert replayed == streamed
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_chats_share_one_call(runtime):
+    model = bedrock.BedrockModel()
+    responses = await asyncio.gather(*(model.chat(request()) for _ in range(3)))
+    assert runtime.calls == ["converse"]
+    assert len({response.id for response in responses}) == 3
+    assert all(response.choices == responses[0].choices for response in responses)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_streams_share_one_stream(runtime):
+    model = bedrock.BedrockModel()
+    streams = await asyncio.gather(*(stream_frames(model, request(stream=True)) for _ in range(3)))
+    assert runtime.calls == ["converse_stream"]
+    # each stream has its own id
+    assert len({frames[0]["id"] for frames in streams}) == 3
+    for frames in streams:
+        stream_id = frames[0]["id"]
+        for frame in frames:
+            assert frame.pop("id") == stream_id
+            frame.pop("created")
+    assert streams[1] == streams[0] == streams[2]
+
+
+@pytest.mark.asyncio
+async def test_sampled_requests_are_shared_only_in_all_mode(runtime):
+    model = bedrock.BedrockModel()
+    await asyncio.gather(*(model.chat(request(temperature=0.7)) for _ in range(2)))
+    assert runtime.calls == ["converse"] * 2
+    with patch.object(bedrock, "SINGLE_FLIGHT", "all"):
+        await asyncio.gather(*(model.chat(request(temperature=0.7)) for _ in range(2)))
+    assert runtime.calls == ["converse"] * 3
+
+
+@pytest.mark.asyncio
+async def test_lookup_keeps_the_translation_for_the_call(cache):
+    model = bedrock.BedrockModel()
+    await model.chat(request())
+    chat_request = request()
+    with patch.object(bedrock.BedrockModel, "_parse_request", wraps=model._parse_request) as parse:
+        assert await model.lookup_cache(chat_request)
+        await model.chat(chat_request)
+    assert parse.call_count == 1
+    assert not await model.lookup_cache(request(temperature=0.7))
+    assert not await model.lookup_cache(request(), "no-cache")
+    assert cache.runtime.calls == ["converse"]
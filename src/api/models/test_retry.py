@@ -0,0 +1,145 @@
+import asyncio
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi import HTTPException
+
+from api.models.retry import AdaptiveRateLimiter, Retrier, RetryBudget
+
+
+def client_error(code: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": code}}, "Converse")
+
+
+class Upstream:
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return "ok"
+
+
+@pytest.mark.asyncio
+async def test_throttles_are_retried():
+    retrier = Retrier(base_delay=0)
+    upstream = Upstream(client_error("ThrottlingException"), client_error("ServiceUnavailableException"))
+    assert await retrier.call("m", upstream) == "ok"
+    assert upstream.calls == 3
+    stats = retrier.collect()["m"]
+    assert stats["retries"] == 2 and stats["throttles"] == 1
+    assert stats["rate_limit"] is not None
+
+
+@pytest.mark.asyncio
+async def test_other_errors_and_exhausted_retries_are_raised():
+    retrier = Retrier(max_retries=2, base_delay=0)
+    upstream = Upstream(client_error("ValidationException"))
+    with pytest.raises(ClientError):
+        await retrier.call("m", upstream)
+    assert upstream.calls == 1
+
+    upstream = Upstream(*[client_error("ThrottlingException")] * 5)
+    with pytest.raises(ClientError):
+        await retrier.call("m", upstream)
+    assert upstream.calls == 3
+
+
+@pytest.mark.asyncio
+async def test_off_mode_does_not_retry():
+    retrier = Retrier(mode="off")
+    upstream = Upstream(client_error("ThrottlingException"))
+    with pytest.raises(ClientError):
+        await retrier.call("m", upstream)
+    assert upstream.calls == 1
+    assert retrier.collect()["m"]["rate_limit"] is None
+
+
+@pytest.mark.asyncio
+async def test_retry_budget_limits_retries():
+    retrier = Retrier(mode="standard", base_delay=0, budget_ratio=0.1)
+    state = retrier._state("m")
+    state.budget.balance = 1
+    with pytest.raises(ClientError):
+        await retrier.call("m", Upstream(*[client_error("ThrottlingException")] * 5))
+    assert state.retries == 1 and state.budget_exhausted == 1
+
+
+def test_retry_budget_ratio():
+    budget = RetryBudget(ratio=0.1, reserve=0, max_balance=5)
+    for _ in range(20):
+        budget.deposit()
+    assert [budget.withdraw() for _ in range(3)] == [True, True, False]
+    for _ in range(100):
+        budget.deposit()
+    assert budget.balance == 5
+
+
+def test_rate_limiter_learns_from_throttles():
+    limiter = AdaptiveRateLimiter(min_rate=1, beta=0.5)
+    # not limiting before the first throttle
+    assert [limiter.delay() for _ in range(100)] == [0.0] * 100
+    limiter.measured_rate = 40
+    limiter._window_count = 0
+    limiter.on_throttle()
+    assert limiter.rate == 20
+    limiter.on_throttle()
+    assert limiter.rate == 10
+    # the bucket is empty, requests are spread at the rate
+    delays = [limiter.delay() for _ in range(3)]
+    assert delays[0] == pytest.approx(0.1, abs=0.01)
+    assert delays[2] == pytest.approx(0.3, abs=0.01)
+    limiter.on_success()
+    assert limiter.rate == pytest.approx(10.1)
+    for _ in range(10):
+        limiter.on_throttle()
+    assert limiter.rate == 1
+
+
+def throttled_retrier(max_wait: float) -> Retrier:
+    """A retrier whose rate limiter lets a single call through per second."""
+    retrier = Retrier(base_delay=0, max_wait=max_wait)
+    limiter = retrier._state("m").limiter
+    limiter.enabled = True
+    limiter.rate = 1.0
+    limiter.tokens = 0.0
+    limiter.last_refill = time.monotonic()
+    return retrier
+
+
+@pytest.mark.asyncio
+async def test_long_rate_limiter_waits_are_rejected():
+    retrier = throttled_retrier(max_wait=1.5)
+    limiter = retrier._state("m").limiter
+    # waits about 1s for the token
+    first = asyncio.ensure_future(retrier.call("m", Upstream()))
+    await asyncio.sleep(0)
+    upstream = Upstream()
+    with pytest.raises(HTTPException) as e:
+        await retrier.call("m", upstream)
+    assert e.value.status_code == 429
+    assert e.value.headers["Retry-After"] == "2"
+    assert upstream.calls == 0
+    # the token of the rejected call was given back
+    assert limiter.tokens == pytest.approx(-1, abs=0.01)
+    assert retrier.collect()["m"]["rate_limit_rejected"] == 1
+    first.cancel()
+    await asyncio.gather(first, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waits_give_their_token_back():
+    retrier = throttled_retrier(max_wait=10)
+    limiter = retrier._state("m").limiter
+    waiting = [asyncio.ensure_future(retrier.call("m", Upstream())) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert limiter.tokens == pytest.approx(-3, abs=0.01)
+    for task in waiting:
+        task.cancel()
+    await asyncio.gather(*waiting, return_exceptions=True)
+    # the next call doesn't wait behind the cancelled ones
+    assert limiter.delay() == pytest.approx(1, abs=0.01)
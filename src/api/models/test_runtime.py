@@ -0,0 +1,144 @@
+import asyncio
+import binascii
+import json
+import struct
+
+import boto3
+import httpx
+import pytest
+
+from api.models.runtime import AsyncBedrockRuntime
+
+
+def encode_event(event_type: str, payload: dict) -> bytes:
+    """Encode a message in the AWS binary event stream format."""
+    headers = b""
+    for name, value in ((":event-type", event_type), (":message-type", "event"), (":content-type", "application/json")):
+        headers += struct.pack("!B", len(name)) + name.encode() + struct.pack("!BH", 7, len(value)) + value.encode()
+    body = json.dumps(payload).encode()
+    total_length = 12 + len(headers) + len(body) + 4
+    prelude = struct.pack("!II", total_length, len(headers))
+    prelude += struct.pack("!I", binascii.crc32(prelude) & 0xFFFFFFFF)
+    message = prelude + headers + body
+    return message + struct.pack("!I", binascii.crc32(message) & 0xFFFFFFFF)
+
+
+@pytest.fixture
+def client():
+    return boto3.client(
+        "bedrock-runtime",
+        region_name="us-west-2",
+        aws_access_key_id="AKID",
+        aws_secret_access_key="SECRET",
+    )
+
+
+def make_runtime(client, handler):
+    return AsyncBedrockRuntime(client, transport=httpx.MockTransport(handler))
+
+
+@pytest.mark.asyncio
+async def test_converse_signs_and_parses(client):
+    seen = {}
+
+    def handler(request: httpx.Request):
+        seen["url"] = str(request.url)
+        seen["auth"] = request.headers["authorization"]
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(
+            200,
+            json={
+                "output": {"message": {"role": "assistant", "content": [{"text": "hi"}]}},
+                "stopReason": "end_turn",
+                "usage": {"inputTokens": 1, "outputTokens": 2, "totalTokens": 3},
+                "metrics": {"latencyMs": 10},
+            },
+        )
+
+    runtime = make_runtime(client, handler)
+    response = await runtime.converse(
+        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
+        messages=[
+            {
+                "role": "user",
+                "content": [{"text": "hello"}, {"image": {"format": "png", "source": {"bytes": b"\x89PNG"}}}],
+            }
+        ],
+    )
+    await runtime.aclose()
+
+    assert seen["url"].endswith("/model/anthropic.claude-3-sonnet-20240229-v1%3A0/converse")
+    assert seen["auth"].startswith("AWS4-HMAC-SHA256 Credential=AKID/")
+    # blobs are base64 encoded as boto3 would do.
+    assert seen["body"]["messages"][0]["content"][1]["image"]["source"]["bytes"] == "iVBORw=="
+    assert response["output"]["message"]["content"] == [{"text": "hi"}]
+    assert response["usage"]["outputTokens"] == 2
+
+
+@pytest.mark.asyncio
+async def test_converse_raises_modeled_exceptions(client):
+    def handler(request: httpx.Request):
+        return httpx.Response(
+            429,
+            headers={"x-amzn-ErrorType": "ThrottlingException"},
+            json={"message": "Too many requests"},
+        )
+
+    runtime = make_runtime(client, handler)
+    with pytest.raises(client.exceptions.ThrottlingException):
+        await runtime.converse(modelId="m", messages=[{"role": "user", "content": [{"text": "hello"}]}])
+    await runtime.aclose()
+
+
+@pytest.mark.asyncio
+async def test_converse_stream_decodes_events(client):
+    events = [
+        encode_event("messageStart", {"role": "assistant"}),
+        encode_event("contentBlockDelta", {"contentBlockIndex": 0, "delta": {"text": "Hel"}}),
+        encode_event("contentBlockDelta", {"contentBlockIndex": 0, "delta": {"text": "lo"}}),
+        encode_event("messageStop", {"stopReason": "end_turn"}),
+    ]
+    data = b"".join(events)
+
+    class ChunkedStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            # split the payload at arbitrary boundaries
+            for i in range(0, len(data), 7):
+                yield data[i : i + 7]
+
+    def handler(request: httpx.Request):
+        return httpx.Response(200, stream=ChunkedStream())
+
+    runtime = make_runtime(client, handler)
+    response = await runtime.converse_stream(modelId="m", messages=[{"role": "user", "content": [{"text": "hello"}]}])
+    chunks = [chunk async for chunk in response["stream"]]
+    await runtime.aclose()
+
+    assert chunks[0] == {"messageStart": {"role": "assistant"}}
+    assert chunks[1]["contentBlockDelta"]["delta"] == {"text": "Hel"}
+    assert chunks[3] == {"messageStop": {"stopReason": "end_turn"}}
+
+
+def test_botocore_private_apis_are_available(client):
+    # AsyncBedrockRuntime relies on these, check them when upgrading botocore.
+    assert callable(client._convert_to_request_dict)
+    assert client._request_signer._credentials is not None
+    assert callable(client._response_parser.parse)
+
+
+def test_clients_of_a_previous_event_loop_are_closed(client):
+    runtime = make_runtime(client, lambda request: httpx.Response(200, json={}))
+
+    async def get_clients():
+        runtime._get_http()
+        return runtime._clients
+
+    first = asyncio.run(get_clients())
+
+    async def switch_loop():
+        runtime._get_http()
+        await asyncio.gather(*runtime._closing)
+        await runtime.aclose()
+
+    asyncio.run(switch_loop())
+    assert all(http.is_closed for http in first)
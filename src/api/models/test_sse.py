@@ -0,0 +1,131 @@
+import asyncio
+import json
+from unittest.mock import patch
+
+import pytest
+
+from api.models.bedrock import BedrockModel
+from api.models.sse import ChunkSerializer, coalesce_deltas
+from api.schema import ChatRequest
+
+EVENTS = [
+    {"messageStart": {"role": "assistant"}},
+    {"contentBlockDelta": {"delta": {"text": 'Hé "x"\n</\u001f'}, "contentBlockIndex": 0}},
+    {"contentBlockDelta": {"delta": {"reasoningContent": {"text": "hmm"}}, "contentBlockIndex": 0}},
+    {"contentBlockDelta": {"delta": {"reasoningContent": {"signature": "sig"}}, "contentBlockIndex": 0}},
+    {"contentBlockStop": {"contentBlockIndex": 0}},
+    {"contentBlockStart": {"start": {"toolUse": {"toolUseId": "t1", "name": "f"}}, "contentBlockIndex": 1}},
+    {"contentBlockDelta": {"delta": {"toolUse": {"input": '{"a": 1}'}}, "contentBlockIndex": 1}},
+    {"messageStop": {"stopReason": "tool_use"}},
+    {"messageStop": {"stopReason": "end_turn"}},
+    {"metadata": {"usage": {"inputTokens": 1, "outputTokens": 2, "totalTokens": 3}, "metrics": {"latencyMs": 5}}},
+]
+
+
+def pydantic_frame(model: BedrockModel, chunk: dict, include_usage: bool) -> bytes:
+    with patch("time.time", return_value=1700000000):
+        stream_response = model._create_response_stream(model_id="model-x", message_id="chatcmpl-1", chunk=chunk)
+        if not stream_response or not (stream_response.choices or include_usage):
+            return b""
+        return model.stream_response_to_bytes(stream_response)
+
+
+@pytest.mark.parametrize("include_usage", [False, True])
+@pytest.mark.parametrize("chunk", EVENTS)
+def test_frames_match_the_pydantic_path(chunk, include_usage):
+    model = BedrockModel()
+    serializer = ChunkSerializer("chatcmpl-1", "model-x", model._convert_finish_reason, include_usage, 1700000000)
+    assert serializer.serialize(chunk) == pydantic_frame(model, chunk, include_usage)
+
+
+def test_frames_are_valid_json():
+    serializer = ChunkSerializer('chat"1', "model-x", lambda reason: reason, created=1)
+    frame = serializer.text("a\\b")
+    assert frame.startswith(b"data: ") and frame.endswith(b"\n\n")
+    data = json.loads(frame[6:])
+    assert data["id"] == 'chat"1'
+    assert data["choices"][0]["delta"] == {"content": "a\\b"}
+
+
+def test_unsupported_events_fall_back():
+    serializer = ChunkSerializer("chatcmpl-1", "model-x", lambda reason: reason)
+    assert serializer.serialize({"unknownEvent": {}}) is None
+    assert serializer.serialize({"messageStart": {"role": "user"}}) is None
+    assert serializer.serialize({"messageStop": {"stopReason": "end_turn"}, "metadata": {}}) is None
+
+
+def text(value: str, index: int = 0) -> dict:
+    return {"contentBlockDelta": {"delta": {"text": value}, "contentBlockIndex": index}}
+
+
+async def events(*items):
+    for item in items:
+        if isinstance(item, float):
+            await asyncio.sleep(item)
+        else:
+            yield item
+
+
+async def collect(stream) -> list[dict]:
+    return [event async for event in stream]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_merges_text_until_another_event():
+    stop = {"contentBlockStop": {"contentBlockIndex": 0}}
+    tool = {"contentBlockDelta": {"delta": {"toolUse": {"input": "{"}}, "contentBlockIndex": 1}}
+    merged = await collect(coalesce_deltas(events(text("a"), text("b"), stop, text("c"), tool, text("d")), 10))
+    assert merged == [text("ab"), stop, text("c"), tool, text("d")]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_separates_kinds_and_blocks():
+    reasoning = {"contentBlockDelta": {"delta": {"reasoningContent": {"text": "r"}}, "contentBlockIndex": 0}}
+    merged = await collect(coalesce_deltas(events(reasoning, reasoning, text("a"), text("b", 1)), 10))
+    assert merged == [
+        {"contentBlockDelta": {"delta": {"reasoningContent": {"text": "rr"}}, "contentBlockIndex": 0}},
+        text("a"),
+        text("b", 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flushes_on_byte_budget():
+    merged = await collect(coalesce_deltas(events(text("é"), text("a"), text("bc"), text("d")), 10, max_bytes=3))
+    assert merged == [text("éa"), text("bcd")]
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flushes_on_window_while_waiting():
+    received = []
+
+    async def consume():
+        async for event in coalesce_deltas(events(text("a"), text("b"), 0.2, text("c")), 0.02):
+            received.append((event, asyncio.get_running_loop().time()))
+
+    start = asyncio.get_running_loop().time()
+    await consume()
+    assert [event for event, _ in received] == [text("ab"), text("c")]
+    # the first frame did not wait for the next event
+    assert received[0][1] - start < 0.15
+
+
+@pytest.mark.asyncio
+async def test_coalesce_flushes_then_propagates_errors():
+    async def failing():
+        yield text("a")
+        await asyncio.sleep(0)
+        raise RuntimeError("stream broken")
+
+    merged = []
+    with pytest.raises(RuntimeError):
+        async for event in coalesce_deltas(failing(), 10):
+            merged.append(event)
+    assert merged == [text("a")]
+
+
+def test_coalescing_is_configurable_per_request():
+    request = ChatRequest(messages=[], stream=True, stream_options={"coalesce_ms": 5, "coalesce_bytes": 64})
+    assert BedrockModel._coalescing(request) == (5, 64)
+    with patch("api.models.bedrock.STREAM_COALESCE_WINDOW_MS", 20):
+        assert BedrockModel._coalescing(ChatRequest(messages=[], stream=True)) == (20, 512)
@@ -0,0 +1,94 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.models.stream import pump_stream
+
+
+class FakeEventStream:
+    def __init__(self, items, delay=0.0, error=None):
+        self.items = items
+        self.delay = delay
+        self.error = error
+        self.produced = 0
+        self.closed = False
+        self.threads = set()
+
+    def __iter__(self):
+        for item in self.items:
+            if self.closed:
+                return
+            self.threads.add(threading.get_ident())
+            time.sleep(self.delay)
+            self.produced += 1
+            yield item
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.mark.asyncio
+async def test_pump_stream_preserves_order_off_loop():
+    stream = FakeEventStream(list(range(20)))
+    result = [item async for item in pump_stream(stream)]
+    assert result == list(range(20))
+    assert threading.get_ident() not in stream.threads
+
+
+@pytest.mark.asyncio
+async def test_pump_stream_propagates_errors():
+    stream = FakeEventStream([1, 2], error=ValueError("boom"))
+    result = []
+    with pytest.raises(ValueError, match="boom"):
+        async for item in pump_stream(stream):
+            result.append(item)
+    assert result == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_pump_stream_does_not_block_event_loop():
+    stream = FakeEventStream([1, 2, 3], delay=0.1)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    result = [item async for item in pump_stream(stream)]
+    task.cancel()
+    assert result == [1, 2, 3]
+    assert ticks > 10
+
+
+@pytest.mark.asyncio
+async def test_pump_stream_backpressure_and_close():
+    stream = FakeEventStream(list(range(100)))
+    gen = pump_stream(stream, queue_size=2)
+    assert await gen.__anext__() == 0
+    await asyncio.sleep(0.1)
+    # The reader may only run a bounded number of items ahead of the consumer.
+    assert stream.produced <= 5
+    await gen.aclose()
+    assert stream.closed
+
+
+@pytest.mark.asyncio
+async def test_pump_stream_closes_stalled_streams():
+    stream = FakeEventStream(list(range(100)))
+    gen = pump_stream(stream, queue_size=2, stall_timeout=0.05)
+    assert await gen.__anext__() == 0
+    # the client stops reading, the reader gives up instead of holding its worker
+    await asyncio.sleep(0.2)
+    assert stream.closed
+    result = []
+    with pytest.raises(TimeoutError):
+        async for item in gen:
+            result.append(item)
+    assert result == [1, 2]
@@ -0,0 +1,45 @@
+from unittest.mock import patch
+
+import pytest
+
+from api.models import tokenizer
+
+
+@pytest.fixture(autouse=True)
+def unloaded():
+    with patch.object(tokenizer, "_encoder", None), patch.object(tokenizer, "_load_error", None):
+        yield
+
+
+def test_encoder_is_loaded_once():
+    with patch("tiktoken.get_encoding", return_value="encoder") as get_encoding:
+        assert tokenizer.get_encoder() == "encoder"
+        assert tokenizer.get_encoder() == "encoder"
+    get_encoding.assert_called_once_with("cl100k_base")
+
+
+def test_load_failure_is_retried_after_an_interval():
+    with patch("tiktoken.get_encoding", side_effect=OSError("offline")) as get_encoding:
+        for _ in range(2):
+            with pytest.raises(OSError):
+                tokenizer.count_tokens(["a"])
+        get_encoding.assert_called_once()
+        with patch.object(tokenizer, "TOKENIZER_RETRY_INTERVAL", 0):
+            with pytest.raises(OSError):
+                tokenizer.count_tokens(["a"])
+    assert get_encoding.call_count == 2
+    with patch("tiktoken.get_encoding", return_value="encoder"), patch.object(tokenizer, "TOKENIZER_RETRY_INTERVAL", 0):
+        assert tokenizer.get_encoder() == "encoder"
+
+
+def test_batches_use_the_batch_apis():
+    class Encoder:
+        def decode_batch(self, batch, num_threads):
+            return [f"{len(tokens)}@{num_threads}" for tokens in batch]
+
+        def encode_ordinary_batch(self, texts, num_threads):
+            return [[0] * len(text) for text in texts]
+
+    with patch.object(tokenizer, "_encoder", Encoder()), patch.object(tokenizer, "TOKENIZER_THREADS", 3):
+        assert tokenizer.decode_batch([[1, 2], [3]]) == ["2@3", "1@3"]
+        assert tokenizer.count_tokens(["abc", "", "de"]) == [3, 0, 2]
@@ -0,0 +1,39 @@
+import threading
+
+import pytest
+
+from api.models import translation
+from api.schema import ChatRequest
+
+
+def make_request(text: str, tool_arguments: str = "{}") -> ChatRequest:
+    return ChatRequest(
+        model="m",
+        messages=[
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": text}, {"type": "image_url", "image_url": {"url": "data:x"}}],
+            },
+            {
+                "role": "assistant",
+                "content": "ok",
+                "tool_calls": [{"id": "1", "type": "function", "function": {"name": "f", "arguments": tool_arguments}}],
+            },
+        ],
+    )
+
+
+def test_estimate_size():
+    assert translation.estimate_size(make_request("abcd", '{"a": 1}')) == 4 + 6 + 2 + 8
+
+
+@pytest.mark.asyncio
+async def test_translate_offloads_large_payloads():
+    def build(chat_request, suffix):
+        return threading.current_thread().name + suffix
+
+    inline = await translation.translate(build, make_request("small"), "!", threshold=1000)
+    offloaded = await translation.translate(build, make_request("x" * 1000), "!", threshold=1000)
+    assert inline == threading.current_thread().name + "!"
+    assert offloaded.startswith("translation")
+    assert translation.stats.offloaded >= 1
@@ -0,0 +1,52 @@
+import logging
+import threading
+import time
+
+from api.setting import TOKENIZER_RETRY_INTERVAL, TOKENIZER_THREADS
+
+logger = logging.getLogger(__name__)
+
+_encoder = None
+_load_error: Exception | None = None
+_failed_at = 0.0
+_lock = threading.Lock()
+
+
+def get_encoder():
+    """Return the shared tiktoken cl100k_base encoder, loaded on first use.
+
+    Loading may download the BPE ranks, so a failure is remembered rather than retried
+    on every request: it is raised again until TOKENIZER_RETRY_INTERVAL has passed.
+    """
+    global _encoder, _load_error, _failed_at
+    if _encoder is None:
+        with _lock:
+            if _encoder is None:
+                if _load_error is not None and time.monotonic() - _failed_at < TOKENIZER_RETRY_INTERVAL:
+                    raise _load_error
+                try:
+                    import tiktoken
+
+                    _encoder = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    logger.error(f"Unable to load the tiktoken encoder: {e}")
+                    _load_error = e
+                    _failed_at = time.monotonic()
+                    raise
+    return _encoder
+
+
+def decode_batch(batch: list[list[int]]) -> list[str]:
+    """Decode token arrays back to text, in parallel for more than one array."""
+    encoder = get_encoder()
+    if len(batch) == 1:
+        return [encoder.decode(batch[0])]
+    return encoder.decode_batch(batch, num_threads=TOKENIZER_THREADS)
+
+
+def count_tokens(texts: list[str]) -> list[int]:
+    """Return the number of tokens of each text, tokenized in parallel."""
+    encoder = get_encoder()
+    if len(texts) == 1:
+        return [len(encoder.encode_ordinary(texts[0]))]
+    return list(map(len, encoder.encode_ordinary_batch(texts, num_threads=TOKENIZER_THREADS)))
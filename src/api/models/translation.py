@@ -0,0 +1,99 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+from api import metrics
+from api.schema import AssistantMessage, ChatRequest, ImageContent, TextContent
+from api.setting import TRANSLATION_EXECUTOR, TRANSLATION_OFFLOAD_THRESHOLD, TRANSLATION_WORKERS
+
+T = TypeVar("T")
+
+# Created on first use, so that no worker is started for small payloads only.
+_executor: Executor | None = None
+_executor_lock = threading.Lock()
+
+
+class TranslationStats:
+    def __init__(self):
+        self.inline = 0
+        self.offloaded = 0
+        self.time_total = 0.0
+        self.time_max = 0.0
+
+    def record(self, offloaded: bool, seconds: float):
+        if offloaded:
+            self.offloaded += 1
+        else:
+            self.inline += 1
+        self.time_total += seconds
+        self.time_max = max(self.time_max, seconds)
+
+    def collect(self) -> dict:
+        count = self.inline + self.offloaded
+        return {
+            "executor": TRANSLATION_EXECUTOR,
+            "inline": self.inline,
+            "offloaded": self.offloaded,
+            "time_avg_ms": self.time_total / count * 1000 if count else 0.0,
+            "time_max_ms": self.time_max * 1000,
+        }
+
+
+stats = TranslationStats()
+metrics.register("translation", stats.collect)
+
+
+def get_executor() -> Executor | None:
+    """Return the translation worker pool, None if offloading is disabled."""
+    global _executor
+    if TRANSLATION_EXECUTOR == "none":
+        return None
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                if TRANSLATION_EXECUTOR == "process":
+                    _executor = ProcessPoolExecutor(max_workers=TRANSLATION_WORKERS)
+                else:
+                    _executor = ThreadPoolExecutor(max_workers=TRANSLATION_WORKERS, thread_name_prefix="translation")
+    return _executor
+
+
+def estimate_size(chat_request: ChatRequest) -> int:
+    """Approximate size of the request payload in characters, cheap to compute."""
+    size = 0
+    for message in chat_request.messages:
+        content = getattr(message, "content", None)
+        if isinstance(content, str):
+            size += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if isinstance(part, TextContent):
+                    size += len(part.text)
+                elif isinstance(part, ImageContent):
+                    size += len(part.image_url.url)
+        if isinstance(message, AssistantMessage) and message.tool_calls:
+            size += sum(len(tool_call.function.arguments) for tool_call in message.tool_calls)
+    return size
+
+
+async def translate(func: Callable[..., T], chat_request: ChatRequest, *args, threshold: int | None = None) -> T:
+    """Run `func(chat_request, *args)`, in the worker pool if the payload is large.
+
+    Small requests are translated inline since handing them over to a worker costs more
+    than translating them. With the "thread" executor the translation still holds the GIL,
+    but the event loop gets to run between the interpreter's thread switches instead of
+    stalling for the whole translation; the "process" executor avoids the GIL at the cost
+    of pickling the request and the result.
+    """
+    threshold = TRANSLATION_OFFLOAD_THRESHOLD if threshold is None else threshold
+    executor = get_executor()
+    offload = executor is not None and estimate_size(chat_request) >= threshold
+    start = time.perf_counter()
+    try:
+        if offload:
+            return await asyncio.get_running_loop().run_in_executor(executor, func, chat_request, *args)
+        return func(chat_request, *args)
+    finally:
+        stats.record(offload, time.perf_counter() - start)
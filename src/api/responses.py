@@ -0,0 +1,45 @@
+import inspect
+import logging
+from typing import Awaitable, Callable
+
+from starlette import responses
+from starlette.types import Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+
+class StreamingResponse(responses.StreamingResponse):
+    """A StreamingResponse releasing its resources (upstream connections, admission slots...)
+    once the response is over.
+
+    Cleanups in the `finally` of the body generator don't run if the body is never iterated,
+    e.g. when the client disconnects before the first chunk is sent. The callbacks registered
+    with `call_on_close` run once the response is sent, or failed to be, in every case, after
+    the body iterator is closed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.close_callbacks: list[Callable[[], Awaitable[None] | None]] = []
+
+    def call_on_close(self, callback: Callable[[], Awaitable[None] | None]):
+        self.close_callbacks.append(callback)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.close()
+
+    async def close(self):
+        """Close the body iterator and run the close callbacks (each at most once)."""
+        callbacks, self.close_callbacks = self.close_callbacks, []
+        if hasattr(self.body_iterator, "aclose"):
+            callbacks.insert(0, self.body_iterator.aclose)
+        for callback in callbacks:
+            try:
+                result = callback()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Failed to release a streaming response resource: {e}")
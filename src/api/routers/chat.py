@@ -1,10 +1,12 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Body, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Body, Depends, Request
+from fastapi.responses import ORJSONResponse
 
+from api import admission
 from api.auth import api_key_auth
 from api.models.bedrock import BedrockModel
+from api.responses import StreamingResponse
 from api.schema import ChatRequest, ChatResponse, ChatStreamResponse, Error
 from api.modelmapper import get_model
 
@@ -21,6 +23,7 @@ router = APIRouter(
     "/completions", response_model=ChatResponse | ChatStreamResponse | Error, response_model_exclude_unset=True
 )
 async def chat_completions(
+    request: Request,
     chat_request: Annotated[
         ChatRequest,
         Body(
@@ -49,6 +52,25 @@ async def chat_completions(
     # Exception will be raised if model not supported.
     model.validate(chat_request)
 
+    # Bypasses the response cache with "no-cache" or "no-store".
+    cache_control = request.headers.get("cache-control")
+    if await model.lookup_cache(chat_request, cache_control):
+        # served from the cache, without taking an admission slot
+        slot = admission.Slot()
+    else:
+        # Raises 429 (with Retry-After) if the call is shed.
+        slot = await admission.controller.acquire(chat_request.model, admission.request_priority(request))
     if chat_request.stream:
-        return StreamingResponse(content=model.chat_stream(chat_request), media_type="text/event-stream")
-    return await model.chat(chat_request)
+        response = StreamingResponse(
+            content=model.chat_stream(chat_request, cache_control), media_type="text/event-stream"
+        )
+        # The slot is held until the response ends, even if the client disconnects before the first chunk.
+        response.call_on_close(slot.release)
+        return response
+    try:
+        chat_response = await model.chat(chat_request, cache_control)
+    finally:
+        slot.release()
+    # Rendered here rather than by FastAPI, which would validate the response again against
+    # response_model (kept for the OpenAPI schema) and encode it with the stdlib encoder.
+    return ORJSONResponse(chat_response.model_dump(exclude_unset=True))
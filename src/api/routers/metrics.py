@@ -0,0 +1,15 @@
+from fastapi import APIRouter, Depends
+
+from api import metrics
+from api.auth import api_key_auth
+
+router = APIRouter(
+    prefix="/metrics",
+    dependencies=[Depends(api_key_auth)],
+)
+
+
+@router.get("")
+async def get_metrics():
+    """Runtime statistics of the gateway, such as connection pool usage."""
+    return metrics.collect()
@@ -1,9 +1,9 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends, HTTPException, Path
+from fastapi import APIRouter, Depends, HTTPException, Path, Response
 
 from api.auth import api_key_auth
-from api.models.bedrock import BedrockModel
+from api.models.bedrock import BedrockModel, model_catalog
 from api.schema import Model, Models
 
 router = APIRouter(
@@ -21,7 +21,9 @@ async def validate_model_id(model_id: str):
 
 
 @router.get("", response_model=Models)
-async def list_models():
+async def list_models(response: Response):
+    # Let clients know how fresh the cached model list is.
+    response.headers["X-Models-Refreshed-At"] = str(int(model_catalog.refreshed_at))
     model_list = [Model(id=model_id) for model_id in chat_model.list_models()]
     return Models(data=model_list)
 
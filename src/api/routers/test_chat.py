@@ -0,0 +1,111 @@
+import asyncio
+import json
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.testclient import TestClient
+
+from api import admission
+from api.admission import AdmissionController
+from api.auth import api_key_auth
+from api.models.bedrock import BedrockModel
+from api.routers import chat
+
+app = FastAPI()
+app.include_router(chat.router)
+app.dependency_overrides[api_key_auth] = lambda: None
+
+RESPONSES = {
+    "text": ([{"reasoningContent": {"reasoningText": {"text": "hmm"}}}, {"text": 'Hé "x"\n'}], "end_turn"),
+    "tool_calls": ([{"toolUse": {"toolUseId": f"t{i}", "name": "f", "input": {"n": i}}} for i in range(3)], "tool_use"),
+}
+
+
+@pytest.fixture
+def client():
+    with patch.object(BedrockModel, "validate"), patch.object(chat, "USE_MODEL_MAPPING", False):
+        yield TestClient(app)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("name", RESPONSES)
+async def test_chat_response_renders_as_before(client, name):
+    content, finish_reason = RESPONSES[name]
+    chat_response = BedrockModel()._create_response("model-x", "chatcmpl-1", content, finish_reason, 3, 4)
+    route = next(r for r in chat.router.routes if r.path == "/chat/completions")
+    # FastAPI's own rendering of the route's return value
+    expected = JSONResponse(
+        await serialize_response(
+            field=route.response_field, response_content=chat_response, exclude_unset=True, is_coroutine=True
+        )
+    ).body
+
+    with patch.object(BedrockModel, "chat", AsyncMock(return_value=chat_response)):
+        response = client.post("/chat/completions", json={"model": "model-x", "messages": []})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/json"
+    assert response.content == expected
+
+
+def test_openapi_schema_documents_the_response_model(client):
+    schema = client.get("/openapi.json").json()
+    response = schema["paths"]["/chat/completions"]["post"]["responses"]["200"]["content"]["application/json"]
+    refs = {item["$ref"].rsplit("/", 1)[-1] for item in response["schema"]["anyOf"]}
+    assert refs == {"ChatResponse", "ChatStreamResponse", "Error"}
+
+
+@pytest.mark.asyncio
+async def test_stream_releases_the_admission_slot_on_early_disconnect():
+    controller = AdmissionController(max_concurrency=1)
+    started = []
+
+    async def chat_stream(self, chat_request, cache_control=None):
+        started.append(True)
+        yield b"data: [DONE]\n\n"
+
+    body = json.dumps({"model": "model-x", "messages": [], "stream": True}).encode()
+    messages = [{"type": "http.request", "body": body, "more_body": False}, {"type": "http.disconnect"}]
+
+    async def receive():
+        return messages.pop(0) if len(messages) > 1 else messages[0]
+
+    async def slow_send(message):
+        # the client is gone before the response starts
+        await asyncio.sleep(1)
+
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": "/chat/completions",
+        "headers": [(b"content-type", b"application/json")],
+        "query_string": b"",
+    }
+    with (
+        patch.object(BedrockModel, "validate"),
+        patch.object(BedrockModel, "chat_stream", chat_stream),
+        patch.object(chat, "USE_MODEL_MAPPING", False),
+        patch.object(admission, "controller", controller),
+    ):
+        await app(scope, receive, slow_send)
+    assert not started
+    assert controller.collect()["model-x"]["active"] == 0
+
+
+def test_cache_hits_do_not_take_an_admission_slot(client):
+    controller = AdmissionController(max_concurrency=1, max_queue=0)
+    chat_response = BedrockModel()._create_response("model-x", "chatcmpl-1", [{"text": "hi"}], "end_turn", 3, 4)
+    body = {"model": "model-x", "messages": [], "temperature": 0}
+    with (
+        patch.object(admission, "controller", controller),
+        patch.object(BedrockModel, "chat", AsyncMock(return_value=chat_response)),
+        patch.object(BedrockModel, "lookup_cache", AsyncMock(return_value=True)),
+    ):
+        # every slot of the model is taken
+        slot = asyncio.run(controller.acquire("model-x"))
+        assert client.post("/chat/completions", json=body).status_code == 200
+        with patch.object(BedrockModel, "lookup_cache", AsyncMock(return_value=False)):
+            assert client.post("/chat/completions", json=body).status_code == 429
+        slot.release()
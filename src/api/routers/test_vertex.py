@@ -1,6 +1,8 @@
+import asyncio
+import httpx
 import pytest
 import json
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, AsyncMock, MagicMock
 from fastapi import Request
 from starlette.datastructures import Headers, QueryParams
 from fastapi import Response
@@ -72,8 +74,9 @@ def test_get_proxy_target_raw_predict(monkeypatch):
     result = vertex.get_proxy_target(model, path)
     assert ":rawPredict" in result
 
+@pytest.mark.asyncio
 @patch("api.routers.vertex.get_access_token", return_value="dummy-token")
-def test_get_header_removes_hop_headers(mock_token, dummy_request):
+async def test_get_header_removes_hop_headers(mock_token, dummy_request):
     req = dummy_request(headers={
         "Host": "example.com",
         "Content-Length": "123",
@@ -85,7 +88,7 @@ def test_get_header_removes_hop_headers(mock_token, dummy_request):
     model = "test-model"
     path = "/v1/chat/completions"
     with patch("api.routers.vertex.get_proxy_target", return_value="http://target"):
-        target_url, headers = vertex.get_header(model, req, path)
+        target_url, headers = await vertex.get_headers(model, req, path)
     assert target_url == "http://target"
     assert "Host" not in headers
     assert "Content-Length" not in headers
@@ -96,8 +99,8 @@ def test_get_header_removes_hop_headers(mock_token, dummy_request):
     assert headers["x-custom"] == "foo"
 
 @pytest.mark.asyncio
-@patch("api.routers.vertex.httpx.AsyncClient")
-@patch("api.routers.vertex.get_header")
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
 @patch("api.routers.vertex.get_model", return_value="test-model")
 async def test_handle_proxy_basic(mock_get_model, mock_get_header, mock_async_client, dummy_request):
     req = dummy_request(body=json.dumps({"model": "foo"}).encode())
@@ -106,7 +109,7 @@ async def test_handle_proxy_basic(mock_get_model, mock_get_header, mock_async_cl
     mock_response.content = b'{"candidates":[{"content":{"parts":[{"text":"hi"}]}, "finishReason":"STOP"}]}'
     mock_response.status_code = 200
     mock_response.headers = {"content-type": "application/json"}
-    mock_async_client.return_value.__aenter__.return_value.request.return_value = mock_response
+    mock_async_client.return_value.request = AsyncMock(return_value=mock_response)
 
     vertex.USE_MODEL_MAPPING = True
     vertex.known_chat_models.append("test-model")
@@ -116,8 +119,8 @@ async def test_handle_proxy_basic(mock_get_model, mock_get_header, mock_async_cl
     assert result.headers["content-type"] == "application/json"
 
 @pytest.mark.asyncio
-@patch("api.routers.vertex.httpx.AsyncClient")
-@patch("api.routers.vertex.get_header")
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
 @patch("api.routers.vertex.get_model", return_value="test-model")
 async def test_handle_proxy_known_chat_model(
     mock_get_model, mock_get_header, mock_async_client, dummy_request
@@ -128,7 +131,7 @@ async def test_handle_proxy_known_chat_model(
     mock_response.content = b'{"candidates":[{"content":{"parts":[{"text":"hi"}]}, "finishReason":"STOP"}]}'
     mock_response.status_code = 200
     mock_response.headers = {"content-type": "application/json"}
-    mock_async_client.return_value.__aenter__.return_value.request.return_value = mock_response
+    mock_async_client.return_value.request = AsyncMock(return_value=mock_response)
 
     vertex.USE_MODEL_MAPPING = True
     if "test-model" not in vertex.known_chat_models:
@@ -141,8 +144,8 @@ async def test_handle_proxy_known_chat_model(
     assert result.headers["content-type"] == "application/json"
 
 @pytest.mark.asyncio
-@patch("api.routers.vertex.httpx.AsyncClient")
-@patch("api.routers.vertex.get_header")
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
 @patch("api.routers.vertex.get_model", return_value="anthropic-model")
 async def test_handle_proxy_anthropic_conversion(
     mock_get_model, mock_get_header, mock_async_client, dummy_request
@@ -161,7 +164,7 @@ async def test_handle_proxy_anthropic_conversion(
     mock_response.content = anthropic_resp
     mock_response.status_code = 200
     mock_response.headers = {"content-type": "application/json"}
-    mock_async_client.return_value.__aenter__.return_value.request.return_value = mock_response
+    mock_async_client.return_value.request = AsyncMock(return_value=mock_response)
 
     vertex.USE_MODEL_MAPPING = True
     # Ensure model is not in known_chat_models to trigger conversion
@@ -174,23 +177,20 @@ async def test_handle_proxy_anthropic_conversion(
     assert data["choices"][0]["message"]["content"] == "Hello!"
 
 @pytest.mark.asyncio
-@patch("api.routers.vertex.httpx.AsyncClient", side_effect=Exception("network error"))
-@patch("api.routers.vertex.get_header")
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
 @patch("api.routers.vertex.get_model", return_value="test-model")
 async def test_handle_proxy_httpx_exception(
     mock_get_model, mock_get_header, mock_async_client, dummy_request
 ):
     req = dummy_request(body=json.dumps({"model": "foo"}).encode())
     mock_get_header.return_value = ("http://target", {"Authorization": "Bearer token"})
+    mock_async_client.return_value.request = AsyncMock(side_effect=httpx.ConnectError("network error"))
     vertex.USE_MODEL_MAPPING = True
     if "test-model" not in vertex.known_chat_models:
         vertex.known_chat_models.append("test-model")
-    # Patch httpx.RequestError to be raised
-    with patch("api.routers.vertex.httpx.RequestError", Exception):
-        result = await vertex.handle_proxy(req, "/v1/chat/completions")
-        assert isinstance(result, Response)
-        assert result.status_code == 502
-        assert b"Upstream request failed" in result.body
+    result = await vertex.handle_proxy(req, "/v1/chat/completions")
+    assert isinstance(result, Response)
     # Assert that the status code is 502 (Bad Gateway) due to upstream failure
     assert result.status_code == 502
 
@@ -220,3 +220,331 @@ def test_get_chat_completion_model_name_unknown_model():
     # Should return the input unchanged
     assert result == model_alias
 
+
+@pytest.mark.asyncio
+async def test_http_client_is_shared():
+    client = vertex.get_http_client()
+    assert vertex.get_http_client() is client
+    await vertex.close_http_client()
+    assert vertex.get_http_client() is not client
+    await vertex.close_http_client()
+
+@pytest.mark.asyncio
+async def test_pool_stats_records_wait_time():
+    stats = vertex.PoolStats()
+    trace = stats.trace()
+    await trace("connection.connect_tcp.started", {})
+    await trace("http11.send_request_headers.started", {})
+    await trace("http11.send_request_headers.started", {})
+    result = stats.collect(None)
+    assert result["requests"] == 1
+    assert result["wait_max_ms"] >= 0
+    assert result["connections"] == 0
+
+def test_get_proxy_target_stream_raw_predict(monkeypatch):
+    monkeypatch.delenv("PROXY_TARGET", raising=False)
+    result = vertex.get_proxy_target("publishers/anthropic/models/claude", "/v1/chat/completions", stream=True)
+    assert result.endswith("/publishers/anthropic/models/claude:streamRawPredict")
+
+def test_to_vertex_anthropic_stream():
+    result = vertex.to_vertex_anthropic({"messages": [{"role": "user", "content": "hi"}]}, stream=True)
+    assert result["stream"] is True
+
+def anthropic_sse(events):
+    return "".join(f"event: {e['type']}\ndata: {json.dumps(e)}\n\n" for e in events).encode()
+
+ANTHROPIC_EVENTS = [
+    {"type": "message_start", "message": {"id": "msg_1", "usage": {"input_tokens": 5}}},
+    {"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+    {"type": "ping"},
+    {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "Hel"}},
+    {"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": "lo"}},
+    {"type": "content_block_stop", "index": 0},
+    {"type": "message_delta", "delta": {"stop_reason": "end_turn"}, "usage": {"output_tokens": 2}},
+    {"type": "message_stop"},
+]
+
+def parse_sse(body):
+    frames = [line[6:] for line in body.decode().split("\n") if line.startswith("data: ")]
+    assert frames[-1] == "[DONE]"
+    return [json.loads(frame) for frame in frames[:-1]]
+
+@pytest.mark.asyncio
+async def test_from_anthropic_stream_to_openai():
+    async def lines():
+        for line in anthropic_sse(ANTHROPIC_EVENTS).decode().splitlines():
+            yield line
+
+    body = b"".join([chunk async for chunk in vertex.from_anthropic_stream_to_openai(lines(), "claude", include_usage=True)])
+    chunks = parse_sse(body)
+    assert chunks[0]["choices"][0]["delta"] == {"role": "assistant", "content": ""}
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks[:-1]) == "Hello"
+    assert chunks[-2]["choices"][0]["finish_reason"] == "stop"
+    assert chunks[-1]["usage"] == {"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}
+    assert all(c["object"] == "chat.completion.chunk" and c["model"] == "claude" for c in chunks)
+
+def streaming_client(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+async def send_response(response):
+    """Send a response to a client, returning the body it receives."""
+    body = []
+
+    async def receive():
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        body.append(message.get("body", b""))
+
+    await response({"type": "http"}, receive, send)
+    return b"".join(body)
+
+@pytest.mark.asyncio
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", return_value="anthropic-model")
+async def test_handle_proxy_streams_anthropic(mock_get_model, mock_get_header, mock_client, dummy_request):
+    closed = []
+
+    class ChunkedStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            data = anthropic_sse(ANTHROPIC_EVENTS)
+            for i in range(0, len(data), 16):
+                yield data[i : i + 16]
+
+        async def aclose(self):
+            closed.append(True)
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=ChunkedStream())
+
+    mock_client.return_value = streaming_client(handler)
+    mock_get_header.return_value = ("http://target", {})
+    req = dummy_request(body=json.dumps({"model": "foo", "stream": True, "messages": [{"role": "user", "content": "hi"}]}).encode())
+    if "anthropic-model" in vertex.known_chat_models:
+        vertex.known_chat_models.remove("anthropic-model")
+
+    result = await vertex.handle_proxy(req, "/v1/chat/completions")
+    assert mock_get_header.call_args.args[-1] is True
+    assert result.media_type == "text/event-stream"
+    body = await send_response(result)
+    chunks = parse_sse(body)
+    assert "".join(c["choices"][0]["delta"].get("content", "") for c in chunks) == "Hello"
+    assert closed
+
+@pytest.mark.asyncio
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", return_value="test-model")
+async def test_handle_proxy_streams_raw_bytes(mock_get_model, mock_get_header, mock_client, dummy_request):
+    upstream = b'data: {"choices":[{"delta":{"content":"hi"}}]}\n\ndata: [DONE]\n\n'
+    mock_client.return_value = streaming_client(
+        lambda request: httpx.Response(200, headers={"content-type": "text/event-stream", "content-length": "1"}, content=upstream)
+    )
+    mock_get_header.return_value = ("http://target", {})
+    req = dummy_request(body=json.dumps({"model": "foo", "stream": True}).encode())
+    if "test-model" not in vertex.known_chat_models:
+        vertex.known_chat_models.append("test-model")
+
+    result = await vertex.handle_proxy(req, "/v1/chat/completions")
+    assert "content-length" not in result.headers
+    assert b"".join([chunk async for chunk in result.body_iterator]) == upstream
+
+async def disconnect_before_first_chunk(response):
+    """Send a response to a client which is gone before the response starts."""
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def slow_send(message):
+        await asyncio.sleep(1)
+
+    await response({"type": "http"}, receive, slow_send)
+
+@pytest.mark.asyncio
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", return_value="test-model")
+async def test_handle_proxy_stream_releases_upstream_on_early_disconnect(mock_get_model, mock_get_header, mock_client, dummy_request):
+    closed = []
+
+    class Stream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            yield b"data: [DONE]\n\n"
+
+        async def aclose(self):
+            closed.append(True)
+
+    mock_client.return_value = streaming_client(
+        lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=Stream())
+    )
+    mock_get_header.return_value = ("http://target", {})
+    req = dummy_request(body=json.dumps({"model": "foo", "stream": True}).encode())
+    if "test-model" not in vertex.known_chat_models:
+        vertex.known_chat_models.append("test-model")
+
+    from api.admission import AdmissionController
+
+    controller = AdmissionController(max_concurrency=1)
+    with patch("api.admission.controller", controller):
+        result = await vertex.handle_proxy(req, "/v1/chat/completions")
+    assert not closed
+    assert controller.collect()["test-model"]["active"] == 1
+    await disconnect_before_first_chunk(result)
+    assert closed
+    assert controller.collect()["test-model"]["active"] == 0
+
+@pytest.mark.asyncio
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", return_value="test-model")
+async def test_handle_proxy_stream_error_is_not_streamed(mock_get_model, mock_get_header, mock_client, dummy_request):
+    mock_client.return_value = streaming_client(
+        lambda request: httpx.Response(429, json={"error": {"message": "quota"}})
+    )
+    mock_get_header.return_value = ("http://target", {})
+    req = dummy_request(body=json.dumps({"model": "foo", "stream": True}).encode())
+    if "test-model" not in vertex.known_chat_models:
+        vertex.known_chat_models.append("test-model")
+
+    result = await vertex.handle_proxy(req, "/v1/chat/completions")
+    assert result.status_code == 429
+    assert b"quota" in result.body
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("use_mapping", [False, True])
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", side_effect=lambda provider, model: model)
+async def test_handle_proxy_forwards_body_bytes(mock_get_model, mock_get_header, mock_client, use_mapping, dummy_request, monkeypatch):
+    sent = []
+
+    def handler(request):
+        sent.append(request.content)
+        return httpx.Response(200, json={})
+
+    mock_client.return_value = streaming_client(handler)
+    mock_get_header.return_value = ("http://target", {})
+    monkeypatch.setattr(vertex, "USE_MODEL_MAPPING", use_mapping)
+    model = "publishers/google/models/gemini-2.0-flash"
+    if model not in vertex.known_chat_models:
+        vertex.known_chat_models.append(model)
+    body = b'{"messages": [{"role": "user", "content": "hi \\u00e9"}],\n "model": "%s"}' % model.encode()
+
+    await vertex.handle_proxy(dummy_request(body=body), "/v1/chat/completions")
+    if use_mapping:
+        # only the model value is rewritten
+        assert sent[0] == body.replace(model.encode(), b"google/gemini-2.0-flash")
+    else:
+        assert sent[0] == body
+
+@pytest.mark.asyncio
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", return_value="test-model")
+async def test_handle_proxy_sheds_over_the_model_limit(mock_get_model, mock_get_header, mock_client, dummy_request):
+    from api.admission import AdmissionController
+
+    mock_get_header.return_value = ("http://target", {})
+    controller = AdmissionController(max_concurrency=1, max_queue=0)
+    with patch("api.admission.controller", controller):
+        slot = await controller.acquire("test-model")
+        result = await vertex.handle_proxy(dummy_request(body=b'{"model": "foo"}'), "/v1/chat/completions")
+        slot.release()
+    assert result.status_code == 429
+    assert "retry-after" in result.headers
+    mock_client.assert_not_called()
+    assert controller.collect()["test-model"]["active"] == 0
+
+@pytest.mark.asyncio
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", return_value="test-model")
+async def test_handle_proxy_shares_identical_streams(mock_get_model, mock_get_header, mock_client, dummy_request, monkeypatch):
+    from api.singleflight import SingleFlight
+
+    sent = []
+
+    class SlowStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            for content in ["Hel", "lo"]:
+                await asyncio.sleep(0.01)
+                yield b'data: {"id":"upstream-1","choices":[{"delta":{"content":"%s"}}]}\n\n' % content.encode()
+            yield b"data: [DONE]\n\n"
+
+    def handler(request):
+        sent.append(request.content)
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=SlowStream())
+
+    mock_client.return_value = streaming_client(handler)
+    mock_get_header.return_value = ("http://target", {})
+    monkeypatch.setattr(vertex, "SINGLE_FLIGHT", "deterministic")
+    monkeypatch.setattr(vertex, "single_flight", SingleFlight())
+    if "test-model" not in vertex.known_chat_models:
+        vertex.known_chat_models.append("test-model")
+    body = json.dumps({"model": "foo", "stream": True, "temperature": 0}).encode()
+
+    async def consume():
+        result = await vertex.handle_proxy(dummy_request(body=body), "/v1/chat/completions")
+        return parse_sse(b"".join([chunk async for chunk in result.body_iterator]))
+
+    streams = await asyncio.gather(consume(), consume())
+    assert len(sent) == 1
+    ids = [{chunk["id"] for chunk in chunks} for chunks in streams]
+    assert len(ids[0]) == len(ids[1]) == 1 and ids[0] != ids[1]
+    assert "upstream-1" not in ids[0] | ids[1]
+    for chunks in streams:
+        assert "".join(c["choices"][0]["delta"]["content"] for c in chunks) == "Hello"
+
+@pytest.mark.asyncio
+async def test_with_own_ids_only_replaces_the_id_field():
+    async def lines():
+        yield 'data: {"choices":[{"delta":{"role":"assistant"}}]}'
+        yield ""
+        yield 'data: {"id":"up-1","choices":[{"delta":{"content":"my id is up-1"}}]}'
+        yield ""
+        yield 'data: {"id":"up-1","choices":[{"delta":{"content":"!"}}]}'
+        yield ""
+        yield "data: [DONE]"
+
+    chunks = parse_sse(b"".join([line async for line in vertex.with_own_ids(lines())]))
+    assert "id" not in chunks[0]
+    assert chunks[1]["id"] == chunks[2]["id"] != "up-1"
+    assert chunks[1]["id"].startswith("chatcmpl-")
+    assert chunks[1]["choices"][0]["delta"]["content"] == "my id is up-1"
+
+@pytest.mark.asyncio
+@patch("api.routers.vertex.get_http_client")
+@patch("api.routers.vertex.get_headers")
+@patch("api.routers.vertex.get_model", return_value="test-model")
+async def test_handle_proxy_shared_stream_is_cancelled_on_early_disconnect(mock_get_model, mock_get_header, mock_client, dummy_request, monkeypatch):
+    from api.singleflight import SingleFlight
+
+    closed = []
+
+    class EndlessStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            while True:
+                await asyncio.sleep(0.01)
+                yield b'data: {"id":"upstream-1","choices":[{"delta":{"content":"x"}}]}\n\n'
+
+        async def aclose(self):
+            closed.append(True)
+
+    mock_client.return_value = streaming_client(
+        lambda request: httpx.Response(200, headers={"content-type": "text/event-stream"}, stream=EndlessStream())
+    )
+    mock_get_header.return_value = ("http://target", {})
+    flight = SingleFlight()
+    monkeypatch.setattr(vertex, "SINGLE_FLIGHT", "deterministic")
+    monkeypatch.setattr(vertex, "single_flight", flight)
+    if "test-model" not in vertex.known_chat_models:
+        vertex.known_chat_models.append("test-model")
+    body = json.dumps({"model": "foo", "stream": True, "temperature": 0}).encode()
+
+    result = await vertex.handle_proxy(dummy_request(body=body), "/v1/chat/completions")
+    await disconnect_before_first_chunk(result)
+    await asyncio.sleep(0.02)
+    assert closed
+    assert flight.collect()["in_flight_streams"] == 0
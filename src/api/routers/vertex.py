@@ -1,17 +1,39 @@
+import hashlib
 import httpx
 import json
 import logging
 import os
 import requests
+import threading
+import time
 import uuid
 
-from fastapi import Request, Response
+from fastapi import HTTPException, Request, Response
 from contextlib import asynccontextmanager
-from api.setting import API_ROUTE_PREFIX, GCP_PROJECT_ID, GCP_REGION, USE_MODEL_MAPPING
+from api.setting import (
+    API_ROUTE_PREFIX,
+    GCP_PROJECT_ID,
+    GCP_REGION,
+    SINGLE_FLIGHT,
+    USE_MODEL_MAPPING,
+    VERTEX_CONNECT_TIMEOUT,
+    VERTEX_HTTP2,
+    VERTEX_KEEPALIVE_EXPIRY,
+    VERTEX_MAX_CONNECTIONS,
+    VERTEX_MAX_KEEPALIVE_CONNECTIONS,
+    VERTEX_POOL_TIMEOUT,
+    VERTEX_READ_TIMEOUT,
+    VERTEX_WRITE_TIMEOUT,
+)
 from google.auth import default
-from google.auth.transport.requests import Request as AuthRequest
 
+from api import admission, metrics
+from api.http_client import PoolStats, create_client
+from api.json_fields import read_fields, replace_field
 from api.modelmapper import get_model
+from api.responses import StreamingResponse
+from api.singleflight import SingleFlight
+from api.token_provider import AccessTokenProvider
 
 known_chat_models = [
     "publishers/mistral-ai/models/mistral-7b-instruct-v0.3",
@@ -31,14 +53,14 @@ known_chat_models = [
 ]
 
 
-# GCP credentials and project details
+# GCP credentials and project details, resolved during app startup or on first use.
 credentials = None
 project_id = None
 location = None
+_project_lock = threading.Lock()
+_project_loaded = False
 
 def get_gcp_project_details():
-    from google.auth import default
-
     # Try metadata server for region
     credentials = None
     project_id = GCP_PROJECT_ID
@@ -62,29 +84,77 @@ def get_gcp_project_details():
 
     return credentials, project_id, location
 
-credentials, project_id, location = get_gcp_project_details()
+def load_gcp_project():
+    """Resolve the GCP credentials, project and location once."""
+    global credentials, project_id, location, _project_loaded
+    if not _project_loaded:
+        with _project_lock:
+            if not _project_loaded:
+                credentials, project_id, location = get_gcp_project_details()
+                _project_loaded = True
+
+# Shared upstream client, opened and closed in the app lifespan.
+http_client = None
+pool_stats = PoolStats()
+metrics.register("vertex_pool", lambda: pool_stats.collect(http_client))
+
+# Identical concurrent requests in flight (see SINGLE_FLIGHT).
+single_flight = SingleFlight()
+metrics.register("vertex_single_flight", single_flight.collect)
+
+def open_http_client():
+    global http_client
+    http_client = create_client(
+        limits=httpx.Limits(
+            max_connections=VERTEX_MAX_CONNECTIONS,
+            max_keepalive_connections=VERTEX_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=VERTEX_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(
+            connect=VERTEX_CONNECT_TIMEOUT,
+            read=VERTEX_READ_TIMEOUT,
+            write=VERTEX_WRITE_TIMEOUT,
+            pool=VERTEX_POOL_TIMEOUT,
+        ),
+        http2=VERTEX_HTTP2,
+    )
+    return http_client
+
+def get_http_client():
+    if http_client is None or http_client.is_closed:
+        return open_http_client()
+    return http_client
 
-# Utility: get service account access token
-def get_access_token():
-    credentials, _ = default(scopes=["https://www.googleapis.com/auth/cloud-platform"])
-    auth_request = AuthRequest()
-    credentials.refresh(auth_request)
-    return credentials.token
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
 
-def get_proxy_target(model, path):
+# Utility: get service account access token, cached and refreshed in the background
+token_provider = AccessTokenProvider()
+metrics.register("gcp_token", token_provider.collect)
+
+async def get_access_token():
+    return await token_provider.get_token()
+
+def get_proxy_target(model, path, stream=False):
     """
     Check if the environment variable is set to use GCP.
     """
     if os.getenv("PROXY_TARGET"):
         return os.getenv("PROXY_TARGET")
-    elif model in known_chat_models and path.endswith("/chat/completions"):
+
+    load_gcp_project()
+    if model in known_chat_models and path.endswith("/chat/completions"):
         return f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/endpoints/openapi/chat/completions"
     else:
-        return f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/{model}:rawPredict"
+        method = "streamRawPredict" if stream else "rawPredict"
+        return f"https://{location}-aiplatform.googleapis.com/v1/projects/{project_id}/locations/{location}/{model}:{method}"
 
-def get_headers(model, request, path):
+async def get_headers(model, request, path, stream=False):
     path_no_prefix = f"/{path.lstrip('/')}".removeprefix(API_ROUTE_PREFIX)
-    target_url = get_proxy_target(model, path_no_prefix)
+    target_url = get_proxy_target(model, path_no_prefix, stream)
 
     # remove hop-by-hop headers
     headers = {
@@ -93,11 +163,11 @@ def get_headers(model, request, path):
     }
 
     # Fetch service account token
-    access_token = get_access_token()
+    access_token = await get_access_token()
     headers["Authorization"] = f"Bearer {access_token}"
     return target_url, headers
 
-def to_vertex_anthropic(openai_messages):
+def to_vertex_anthropic(openai_messages, stream=False):
     message = [
         {
             "role": m["role"],
@@ -106,11 +176,14 @@ def to_vertex_anthropic(openai_messages):
         for m in openai_messages["messages"]
     ]
 
-    return {
+    body = {
         "anthropic_version": "vertex-2023-10-16",
         "max_tokens": 256,
         "messages": message
     }
+    if stream:
+        body["stream"] = True
+    return body
 
 def from_anthropic_to_openai_response(msg, model):
     msg_json = json.loads(msg)
@@ -134,60 +207,259 @@ def from_anthropic_to_openai_response(msg, model):
         "usage": msg_json.get("usage", {})
     })
 
+anthropic_finish_reasons = {
+    "end_turn": "stop",
+    "stop_sequence": "stop",
+    "max_tokens": "length",
+    "tool_use": "tool_calls",
+}
+
+def from_anthropic_stream_event(event, message_id, model, created):
+    """Convert one Anthropic streaming event to OpenAI chat.completion.chunk frames."""
+    def chunk(delta, finish_reason=None):
+        return {
+            "id": message_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+
+    event_type = event.get("type")
+    if event_type == "message_start":
+        return [chunk({"role": "assistant", "content": ""})]
+    if event_type == "content_block_delta" and event["delta"].get("type") == "text_delta":
+        return [chunk({"content": event["delta"]["text"]})]
+    if event_type == "message_delta":
+        stop_reason = event.get("delta", {}).get("stop_reason")
+        return [chunk({}, anthropic_finish_reasons.get(stop_reason, stop_reason or "stop"))]
+    if event_type == "error":
+        return [{"error": event.get("error", {})}]
+    return []
+
+async def from_anthropic_stream_to_openai(lines, model, include_usage=False):
+    """Translate an Anthropic SSE stream into OpenAI SSE frames as the events arrive."""
+    message_id = "chatcmpl-" + str(uuid.uuid4())[:8]
+    created = int(time.time())
+    usage = {}
+    async for line in lines:
+        if not line.startswith("data:"):
+            continue
+        event = json.loads(line[5:])
+        if event.get("type") == "message_start":
+            usage["prompt_tokens"] = event["message"].get("usage", {}).get("input_tokens", 0)
+        elif event.get("type") == "message_delta":
+            usage["completion_tokens"] = event.get("usage", {}).get("output_tokens", 0)
+        for frame in from_anthropic_stream_event(event, message_id, model, created):
+            yield f"data: {json.dumps(frame)}\n\n".encode("utf-8")
+        if event.get("type") == "message_stop":
+            if include_usage:
+                usage["total_tokens"] = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+                frame = {
+                    "id": message_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [],
+                    "usage": usage,
+                }
+                yield f"data: {json.dumps(frame)}\n\n".encode("utf-8")
+            break
+    yield b"data: [DONE]\n\n"
+
 def get_chat_completion_model_name(model_alias):
     if model_alias.startswith("publishers/google/"):
         return f"google/{model_alias.split('/')[-1]}"
 
     return model_alias.split('/')[-1]
 
+def get_response_headers(response):
+    # remove hop-by-hop headers
+    return {
+        k: v for k, v in response.headers.items()
+        if k.lower() not in {"content-encoding", "transfer-encoding", "connection", "content-length"}
+    }
+
+def upstream_error_response(response, content):
+    # Errors are not streamed, return them as is.
+    return Response(
+        content=content,
+        status_code=response.status_code,
+        headers=get_response_headers(response),
+        media_type=response.headers.get("content-type", "application/octet-stream"),
+    )
+
+async def stream_proxy(client, upstream_request, conversion_target, model_alias, include_usage=False):
+    """Relay the upstream response to the client as the chunks arrive."""
+    response = await client.send(upstream_request, stream=True)
+    if response.status_code >= 400:
+        try:
+            content = await response.aread()
+        finally:
+            await response.aclose()
+        return upstream_error_response(response, content)
+
+    if conversion_target == "anthropic":
+        # convert vertex events to openai chunks on the fly
+        chunks = from_anthropic_stream_to_openai(response.aiter_lines(), model_alias, include_usage)
+        media_type = "text/event-stream"
+    else:
+        chunks = response.aiter_bytes()
+        media_type = response.headers.get("content-type", "text/event-stream")
+
+    headers = get_response_headers(response)
+    headers.pop("content-type", None)
+    result = StreamingResponse(chunks, status_code=response.status_code, headers=headers, media_type=media_type)
+    # Also when the client disconnects (even before the first chunk), releasing the upstream connection.
+    result.call_on_close(response.aclose)
+    return result
+
+def get_flight_key(method, url, params, content):
+    """Identical requests: same method, target and body bytes."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (method, url, str(params)):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(content.encode() if isinstance(content, str) else content)
+    return digest.hexdigest()
+
+async def with_own_ids(lines):
+    """Relay OpenAI SSE lines, replacing the upstream completion id of every chunk by a new one."""
+    message_id = "chatcmpl-" + str(uuid.uuid4())[:8]
+    async for line in lines:
+        if line.startswith("data:") and line[5:].strip() != "[DONE]":
+            try:
+                chunk = json.loads(line[5:])
+            except ValueError:
+                chunk = None
+            # Only the id field, the same text may appear in the content.
+            if isinstance(chunk, dict) and "id" in chunk:
+                chunk["id"] = message_id
+                line = f"data: {json.dumps(chunk)}"
+        yield f"{line}\n".encode("utf-8")
+
+async def no_lines():
+    return
+    yield
+
+async def shared_stream_proxy(
+    client, upstream_request, flight_key, conversion_target, model_alias, include_usage=False
+):
+    """As stream_proxy, identical concurrent streams sharing a single upstream stream.
+
+    The upstream lines are relayed to every client, each converted with its own completion id.
+    """
+    async def open_stream():
+        response = await client.send(upstream_request, stream=True)
+        if response.status_code >= 400:
+            try:
+                content = await response.aread()
+            finally:
+                await response.aclose()
+            return (response, content), no_lines()
+
+        async def lines():
+            try:
+                async for line in response.aiter_lines():
+                    yield line
+            finally:
+                # Also runs when all the clients disconnect.
+                await response.aclose()
+
+        return (response, None), lines()
+
+    (response, error_content), lines = await single_flight.stream(flight_key, open_stream)
+    if error_content is not None:
+        return upstream_error_response(response, error_content)
+
+    if conversion_target == "anthropic":
+        chunks = from_anthropic_stream_to_openai(lines, model_alias, include_usage)
+        media_type = "text/event-stream"
+    else:
+        chunks = with_own_ids(lines)
+        media_type = response.headers.get("content-type", "text/event-stream")
+    headers = get_response_headers(response)
+    headers.pop("content-type", None)
+    result = StreamingResponse(chunks, status_code=response.status_code, headers=headers, media_type=media_type)
+    # Leave the shared stream once the response ends, even if the client disconnects before the first chunk.
+    result.call_on_close(lines.aclose)
+    return result
+
 async def handle_proxy(request: Request, path: str):
+    slot = None
     try:
         content = await request.body()
-        content_json = json.loads(content)
-        model_alias = content_json.get("model", "default")
+        # Only the small top-level fields are decoded, the rest of the body is forwarded as is.
+        fields, spans = read_fields(content, ("model", "stream", "stream_options", "temperature"))
+        model_alias = fields.get("model", "default")
         model = get_model("gcp", model_alias)
 
-        if USE_MODEL_MAPPING:
-            if "model" in content_json:
-                content_json["model"]= get_chat_completion_model_name(model)
+        stream = fields.get("stream") is True
+        include_usage = stream and (fields.get("stream_options") or {}).get("include_usage", False)
 
         conversion_target = None
-        if not model in known_chat_models:
-            # openai messages to vertex contents 
-            if "anthropic" in model:
-                content_json = to_vertex_anthropic(content_json)
-                conversion_target = "anthropic"
+        if not model in known_chat_models and "anthropic" in model:
+            # openai messages to vertex contents
+            content = json.dumps(to_vertex_anthropic(json.loads(content), stream))
+            conversion_target = "anthropic"
+        elif USE_MODEL_MAPPING and "model" in spans:
+            target_model = get_chat_completion_model_name(model)
+            if target_model != model_alias:
+                content = replace_field(content, spans["model"], target_model)
+
+        slot = await admission.controller.acquire(model, admission.request_priority(request))
 
         # Build safe target URL
-        target_url, request_headers = get_headers(model, request, path)
-        async with httpx.AsyncClient() as client:
-            response = await client.request(
-                method=request.method,
-                url=target_url,
-                headers=request_headers,
-                content=json.dumps(content_json),
-                params=request.query_params,
-                timeout=5.0,
-            )
+        target_url, request_headers = await get_headers(model, request, path, stream)
+        client = get_http_client()
+        request_args = dict(
+            method=request.method,
+            url=target_url,
+            headers=request_headers,
+            content=content,
+            params=request.query_params,
+            extensions={"trace": pool_stats.trace()},
+        )
+        # identical concurrent requests share their upstream call
+        flight_key = None
+        if SINGLE_FLIGHT == "all" or (SINGLE_FLIGHT == "deterministic" and fields.get("temperature") == 0):
+            flight_key = get_flight_key(request.method, target_url, request.query_params, content)
+        if stream:
+            upstream_request = client.build_request(**request_args)
+            if flight_key is not None:
+                response = await shared_stream_proxy(
+                    client, upstream_request, flight_key, conversion_target, model_alias, include_usage
+                )
+            else:
+                response = await stream_proxy(client, upstream_request, conversion_target, model_alias, include_usage)
+            if isinstance(response, StreamingResponse):
+                # the slot is held until the response ends
+                response.call_on_close(slot.release)
+                slot = None
+            return response
+        if flight_key is not None:
+            response = await single_flight.call(flight_key, lambda: client.request(**request_args))
+        else:
+            response = await client.request(**request_args)
 
         content = response.content
         if conversion_target == "anthropic":
             # convert vertex response to openai format
             content = from_anthropic_to_openai_response(response.content, model_alias)
 
+    except HTTPException as e:
+        # shed by admission control
+        return Response(status_code=e.status_code, content=e.detail, headers=e.headers)
     except httpx.RequestError as e:
         logging.error(f"Proxy request failed: {e}")
         return Response(status_code=502, content=f"Upstream request failed: {e}")
-
-    # remove hop-by-hop headers
-    response_headers = {
-        k: v for k, v in response.headers.items()
-        if k.lower() not in {"content-encoding", "transfer-encoding", "connection"}
-    }
+    finally:
+        if slot is not None:
+            slot.release()
 
     return Response(
         content=content,
         status_code=response.status_code,
-        headers=response_headers,
+        headers=get_response_headers(response),
         media_type=response.headers.get("content-type", "application/octet-stream"),
     )
@@ -83,6 +83,10 @@ class Tool(BaseModel):
 
 class StreamOptions(BaseModel):
     include_usage: bool = True
+    # Not in the OpenAI API: per request override of the coalescing of text deltas
+    # (STREAM_COALESCE_WINDOW_MS and STREAM_COALESCE_MAX_BYTES), 0 ms disables it.
+    coalesce_ms: float | None = Field(default=None, ge=0)
+    coalesce_bytes: int | None = Field(default=None, gt=0)
 
 
 class ChatRequest(BaseModel):
@@ -1,3 +1,4 @@
+import json
 import os
 
 DEFAULT_API_KEYS = "bedrock"
@@ -23,3 +24,128 @@ GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 GCP_REGION = os.getenv("GCP_REGION")
 
 PROVIDER = os.getenv("PROVIDER")
+
+# Worker threads used to read blocking Bedrock event streams off the event loop. Each stream being read
+# holds a worker, so the pool is never smaller than the admission limits (ADMISSION_MAX_CONCURRENCY and
+# ADMISSION_MODEL_CONCURRENCY below): streams beyond the pool size would wait for a worker.
+STREAM_PUMP_WORKERS = int(os.environ.get("STREAM_PUMP_WORKERS", "256"))
+# Maximum number of stream events buffered per stream before the reader thread blocks.
+STREAM_PUMP_QUEUE_SIZE = int(os.environ.get("STREAM_PUMP_QUEUE_SIZE", "64"))
+# A reader blocked this long (seconds) on a client which doesn't consume the stream gives up and closes
+# the upstream stream, so that stalled clients don't hold pump workers forever.
+STREAM_PUMP_STALL_TIMEOUT = float(os.environ.get("STREAM_PUMP_STALL_TIMEOUT", "60"))
+# Write chat stream frames directly from the Bedrock events rather than through the pydantic models.
+STREAM_FAST_SERIALIZER = os.environ.get("STREAM_FAST_SERIALIZER", "true").lower() != "false"
+# Merge consecutive text deltas of a chat stream into one frame for up to this many milliseconds
+# (0 disables), or until the merged text reaches STREAM_COALESCE_MAX_BYTES.
+STREAM_COALESCE_WINDOW_MS = float(os.environ.get("STREAM_COALESCE_WINDOW_MS", "0"))
+STREAM_COALESCE_MAX_BYTES = int(os.environ.get("STREAM_COALESCE_MAX_BYTES", "512"))
+
+# Send Bedrock runtime calls through a native async (httpx) transport instead of boto3 in a thread pool.
+BEDROCK_ASYNC_TRANSPORT = os.environ.get("BEDROCK_ASYNC_TRANSPORT", "false").lower() != "false"
+# Connection pool of the Bedrock runtime client (used by both transports).
+BEDROCK_MAX_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_CONNECTIONS", "100"))
+BEDROCK_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("BEDROCK_MAX_KEEPALIVE_CONNECTIONS", "100"))
+BEDROCK_KEEPALIVE_EXPIRY = float(os.environ.get("BEDROCK_KEEPALIVE_EXPIRY", "60"))
+
+# Seconds before the cached Bedrock model list is refreshed in the background.
+MODEL_CATALOG_TTL = float(os.environ.get("MODEL_CATALOG_TTL", "300"))
+# Random +/- fraction applied to the refresh interval so that workers don't refresh in lockstep.
+MODEL_CATALOG_REFRESH_JITTER = float(os.environ.get("MODEL_CATALOG_REFRESH_JITTER", "0.1"))
+
+# Shared HTTP client used to proxy requests to Vertex AI.
+VERTEX_MAX_CONNECTIONS = int(os.environ.get("VERTEX_MAX_CONNECTIONS", "100"))
+VERTEX_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("VERTEX_MAX_KEEPALIVE_CONNECTIONS", "20"))
+VERTEX_KEEPALIVE_EXPIRY = float(os.environ.get("VERTEX_KEEPALIVE_EXPIRY", "30"))
+# HTTP/2 requires the optional `h2` package (pip install httpx[http2]).
+VERTEX_HTTP2 = os.environ.get("VERTEX_HTTP2", "false").lower() != "false"
+VERTEX_CONNECT_TIMEOUT = float(os.environ.get("VERTEX_CONNECT_TIMEOUT", "5"))
+VERTEX_READ_TIMEOUT = float(os.environ.get("VERTEX_READ_TIMEOUT", "60"))
+VERTEX_WRITE_TIMEOUT = float(os.environ.get("VERTEX_WRITE_TIMEOUT", "10"))
+VERTEX_POOL_TIMEOUT = float(os.environ.get("VERTEX_POOL_TIMEOUT", "5"))
+
+# Fetching of image URLs in multimodal chat requests.
+IMAGE_FETCH_TIMEOUT = float(os.environ.get("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_FETCH_MAX_BYTES = int(os.environ.get("IMAGE_FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_FETCH_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("IMAGE_FETCH_MAX_CONNECTIONS_PER_HOST", "10"))
+# Memory used to cache fetched and decoded images, in bytes.
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+# Seconds a fetched image is reused if its response has no Cache-Control max-age.
+IMAGE_CACHE_DEFAULT_TTL = float(os.environ.get("IMAGE_CACHE_DEFAULT_TTL", "300"))
+
+# Translation of large chat requests to the Bedrock format in a worker pool: "thread", "process" or "none".
+TRANSLATION_EXECUTOR = os.environ.get("TRANSLATION_EXECUTOR", "thread").lower()
+# Approximate payload size (characters of text, image URLs and tool arguments) above which translation is offloaded.
+TRANSLATION_OFFLOAD_THRESHOLD = int(os.environ.get("TRANSLATION_OFFLOAD_THRESHOLD", "262144"))
+# Threads contend for the GIL with the event loop, a single thread keeps loop stalls shortest.
+TRANSLATION_WORKERS = int(os.environ.get("TRANSLATION_WORKERS", "1"))
+
+# Embedding inputs are split into batches the model accepts (one text for Titan, 96 for Cohere),
+# invoked concurrently.
+EMBEDDING_BATCH_CONCURRENCY = int(os.environ.get("EMBEDDING_BATCH_CONCURRENCY", "10"))
+
+# Memory used to cache embeddings by content (model and text), in bytes. 0 disables the cache.
+EMBEDDING_CACHE_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Optional directory of a memory-mapped embedding store that survives restarts (one process per directory).
+EMBEDDING_CACHE_DIR = os.environ.get("EMBEDDING_CACHE_DIR")
+# Disk space used per embedding dimension, the oldest vectors are overwritten once it is full.
+EMBEDDING_CACHE_DISK_MAX_BYTES = int(os.environ.get("EMBEDDING_CACHE_DISK_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Exact-match cache of temperature 0 chat responses (off unless a size or a Redis URL is set).
+# Size of the in-memory cache, in bytes.
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("RESPONSE_CACHE_MAX_BYTES", "0"))
+# Redis URL of a cache shared by the gateway instances (e.g. redis://localhost:6379/0), used instead.
+RESPONSE_CACHE_REDIS_URL = os.environ.get("RESPONSE_CACHE_REDIS_URL")
+# Seconds a response is kept.
+RESPONSE_CACHE_TTL = float(os.environ.get("RESPONSE_CACHE_TTL", "3600"))
+
+# Identical concurrent chat requests share a single upstream call (streams are relayed to every
+# subscriber): "off", "deterministic" (temperature 0 requests only) or "all".
+SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "off").lower()
+
+# Threads used by tiktoken to decode token-array embedding inputs and count the tokens of Cohere inputs.
+TOKENIZER_THREADS = int(os.environ.get("TOKENIZER_THREADS", "4"))
+# Seconds before loading the tokenizer is tried again after a failure (e.g. the BPE ranks download failed).
+TOKENIZER_RETRY_INTERVAL = float(os.environ.get("TOKENIZER_RETRY_INTERVAL", "60"))
+
+# Opt-in coalescing of concurrent embedding requests for the same model into a single upstream call:
+# texts arriving within the window (in milliseconds, 0 disables) are batched, up to the max items
+# (capped by the model limit, 96 texts for Cohere).
+EMBEDDING_COALESCE_WINDOW_MS = float(os.environ.get("EMBEDDING_COALESCE_WINDOW_MS", "0"))
+EMBEDDING_COALESCE_MAX_ITEMS = int(os.environ.get("EMBEDDING_COALESCE_MAX_ITEMS", "96"))
+
+# Gateway-side retries of throttled or unavailable Bedrock calls: "adaptive" (backoff, retry budget and a
+# per-model client-side rate limiter learning from throttling), "standard" (backoff and retry budget) or "off".
+BEDROCK_RETRY_MODE = os.environ.get("BEDROCK_RETRY_MODE", "adaptive").lower()
+BEDROCK_MAX_RETRIES = int(os.environ.get("BEDROCK_MAX_RETRIES", "3"))
+# Exponential backoff with full jitter, in seconds.
+BEDROCK_RETRY_BASE_DELAY = float(os.environ.get("BEDROCK_RETRY_BASE_DELAY", "0.5"))
+BEDROCK_RETRY_MAX_DELAY = float(os.environ.get("BEDROCK_RETRY_MAX_DELAY", "8"))
+# Retries of a model may not exceed this ratio of its calls.
+BEDROCK_RETRY_BUDGET_RATIO = float(os.environ.get("BEDROCK_RETRY_BUDGET_RATIO", "0.1"))
+# Calls which would wait longer (in seconds) for the adaptive rate limiter are rejected with HTTP 429.
+BEDROCK_RATE_LIMIT_MAX_WAIT = float(os.environ.get("BEDROCK_RATE_LIMIT_MAX_WAIT", "10"))
+
+# Regions of the Bedrock runtime, comma separated with optional weights (e.g. "us-west-2:3,us-east-1").
+# Calls are spread across the regions and fail over on throttling or errors. Defaults to AWS_REGION.
+BEDROCK_REGIONS = os.environ.get("BEDROCK_REGIONS", "")
+# "least-outstanding" (fewest calls in flight, relative to the weights) or "weighted" (random).
+BEDROCK_REGION_ROUTING = os.environ.get("BEDROCK_REGION_ROUTING", "least-outstanding").lower()
+# A region is skipped for the reset timeout (seconds) after this many consecutive failures.
+BEDROCK_REGION_FAILURE_THRESHOLD = int(os.environ.get("BEDROCK_REGION_FAILURE_THRESHOLD", "5"))
+BEDROCK_REGION_RESET_TIMEOUT = float(os.environ.get("BEDROCK_REGION_RESET_TIMEOUT", "30"))
+# A region found not to serve a model is skipped for that model for this long (seconds), then tried again.
+BEDROCK_REGION_UNSUPPORTED_TTL = float(os.environ.get("BEDROCK_REGION_UNSUPPORTED_TTL", "3600"))
+
+# Admission control of model calls (Bedrock chat completions and the Vertex proxy): maximum concurrent
+# calls per model (0 for no limit), and a JSON object of per-model limits, e.g. {"model-id": 8}.
+ADMISSION_MAX_CONCURRENCY = int(os.environ.get("ADMISSION_MAX_CONCURRENCY", "0"))
+ADMISSION_MODEL_CONCURRENCY = json.loads(os.environ.get("ADMISSION_MODEL_CONCURRENCY", "{}"))
+# Calls beyond the limit wait for a slot, they are rejected (429 with Retry-After) if the queue of
+# the model is full or if they would wait longer than the timeout (seconds).
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "100"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Priority class of a request ("high", "normal" or "low"), from this header, or else from its API key
+# with a JSON object of API keys to classes. "normal" by default.
+ADMISSION_PRIORITY_HEADER = os.environ.get("ADMISSION_PRIORITY_HEADER", "X-Priority")
+ADMISSION_API_KEY_PRIORITIES = json.loads(os.environ.get("ADMISSION_API_KEY_PRIORITIES", "{}"))
@@ -0,0 +1,169 @@
+import asyncio
+import weakref
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Generic, TypeVar
+
+T = TypeVar("T")
+H = TypeVar("H")
+
+
+class _Broadcast(Generic[H, T]):
+    """One upstream stream, relayed to every subscriber from its first item."""
+
+    def __init__(self, flight: "SingleFlight", key: str, open_stream: Callable[[], Awaitable[tuple[H, AsyncIterable]]]):
+        self.flight = flight
+        self.key = key
+        self.items: list[T] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.subscribers = 0
+        # resolved on the next item (or the end), shared by the waiting subscribers
+        self._waiter: asyncio.Future | None = None
+        self.opened = asyncio.ensure_future(open_stream())
+        self.pump = asyncio.ensure_future(self._pump())
+
+    def _notify(self):
+        waiter, self._waiter = self._waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result(None)
+
+    async def _pump(self):
+        try:
+            _, items = await self.opened
+            async for item in items:
+                self.items.append(item)
+                self._notify()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self.flight._finish(self)
+            self._notify()
+
+    async def wait(self):
+        """Wait for the next item (or the end)."""
+        if self._waiter is None:
+            self._waiter = asyncio.get_running_loop().create_future()
+        # shielded, as cancelling a subscriber must not wake the others
+        await asyncio.shield(self._waiter)
+
+    def leave(self):
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            # nobody is listening anymore
+            self.opened.cancel()
+            self.pump.cancel()
+
+
+class _Subscription(Generic[T]):
+    """A subscriber of a broadcast, iterating its items from the first one.
+
+    It counts as a subscriber from its creation until it is exhausted, fails, is closed,
+    or is garbage collected, so that a subscriber which is never iterated (e.g. its client
+    disconnected before the first item) does not keep the upstream stream going.
+    """
+
+    def __init__(self, broadcast: _Broadcast):
+        self._broadcast = broadcast
+        self._index = 0
+        broadcast.subscribers += 1
+        # leaves the broadcast at most once
+        self._leave = weakref.finalize(self, broadcast.leave)
+        self._leave.atexit = False
+
+    def __aiter__(self) -> "_Subscription[T]":
+        return self
+
+    async def __anext__(self) -> T:
+        broadcast = self._broadcast
+        try:
+            while True:
+                if not self._leave.alive:
+                    # closed
+                    raise StopAsyncIteration
+                if self._index < len(broadcast.items):
+                    self._index += 1
+                    return broadcast.items[self._index - 1]
+                if broadcast.done:
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    raise StopAsyncIteration
+                await broadcast.wait()
+        except BaseException:
+            self._leave()
+            raise
+
+    async def aclose(self):
+        self._leave()
+
+
+class SingleFlight:
+    """Shares concurrent identical upstream calls.
+
+    Calls with the same key, made while a first one is in flight, wait for its result
+    rather than calling upstream again. Streams are opened once and relayed to every
+    subscriber from the start, including the ones joining after the first items; the
+    upstream stream is cancelled once all of its subscribers are gone.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Future] = {}
+        self._streams: dict[str, _Broadcast] = {}
+        # statistics
+        self.calls = 0
+        self.shared_calls = 0
+        self.streams = 0
+        self.shared_streams = 0
+
+    async def call(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        future = self._calls.get(key)
+        if future is None:
+            self.calls += 1
+            future = self._calls[key] = asyncio.ensure_future(func())
+            future.add_done_callback(lambda f: self._done(key, f))
+        else:
+            self.shared_calls += 1
+        # shielded, so that the call goes on for the others if this caller is cancelled
+        return await asyncio.shield(future)
+
+    def _done(self, key: str, future: asyncio.Future):
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if not future.cancelled():
+            # retrieved, even if all the callers are gone
+            future.exception()
+
+    async def stream(
+        self, key: str, open_stream: Callable[[], Awaitable[tuple[H, AsyncIterable[T]]]]
+    ) -> tuple[H, AsyncIterator[T]]:
+        """Return the head returned by `open_stream` (e.g. response status and headers) and
+        an iterator of the items of the shared stream. Errors opening it are raised here.
+
+        The iterator counts as a subscriber until it is exhausted or closed (or garbage collected).
+        """
+        broadcast = self._streams.get(key)
+        if broadcast is None:
+            self.streams += 1
+            broadcast = self._streams[key] = _Broadcast(self, key, open_stream)
+        else:
+            self.shared_streams += 1
+        subscription = _Subscription(broadcast)
+        try:
+            head, _ = await asyncio.shield(broadcast.opened)
+        except BaseException:
+            await subscription.aclose()
+            raise
+        return head, subscription
+
+    def _finish(self, broadcast: _Broadcast):
+        if self._streams.get(broadcast.key) is broadcast:
+            del self._streams[broadcast.key]
+
+    def collect(self) -> dict:
+        return {
+            "calls": self.calls,
+            "shared_calls": self.shared_calls,
+            "streams": self.streams,
+            "shared_streams": self.shared_streams,
+            "in_flight_calls": len(self._calls),
+            "in_flight_streams": len(self._streams),
+        }
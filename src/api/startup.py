@@ -0,0 +1,44 @@
+import asyncio
+import logging
+import time
+from typing import Callable
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class StartupReport:
+    """Time spent in each startup phase, in seconds."""
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float):
+        self.phases[phase] = seconds
+
+    def __str__(self) -> str:
+        return ", ".join(f"{phase}={seconds * 1000:.0f}ms" for phase, seconds in self.phases.items())
+
+
+startup_report = StartupReport()
+
+
+async def run_initializers(initializers: dict[str, Callable[[], object]]) -> StartupReport:
+    """Run the blocking initializers concurrently in worker threads, timing each of them.
+
+    Exceptions are re-raised so that the app fails to start, e.g. if the API key can't be retrieved.
+    """
+
+    async def run(phase: str, initializer: Callable[[], object]):
+        start = time.perf_counter()
+        try:
+            await run_in_threadpool(initializer)
+        finally:
+            startup_report.record(phase, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(phase, initializer) for phase, initializer in initializers.items()))
+    startup_report.record("initialize", time.perf_counter() - start)
+    logger.info(f"Startup time: {startup_report}")
+    return startup_report
@@ -0,0 +1,128 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from api import admission
+from api.admission import AdmissionController
+from api.responses import StreamingResponse
+
+
+@pytest.mark.asyncio
+async def test_unlimited_models_are_not_queued():
+    controller = AdmissionController(max_concurrency=0, model_limits={"limited": 1})
+    slots = [await controller.acquire("other") for _ in range(10)]
+    for slot in slots:
+        slot.release()
+    assert controller.collect() == {}
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_admitted_by_priority():
+    controller = AdmissionController(max_concurrency=1, queue_timeout=5)
+    first = await controller.acquire("m")
+    order = []
+
+    async def call(name: str, priority: str):
+        slot = await controller.acquire("m", priority)
+        order.append(name)
+        await asyncio.sleep(0)
+        slot.release()
+
+    calls = (("a", "low"), ("b", "normal"), ("c", "high"), ("d", "normal"))
+    tasks = [asyncio.ensure_future(call(name, priority)) for name, priority in calls]
+    await asyncio.sleep(0)
+    stats = controller.collect()["m"]
+    assert stats["queue_depth"] == 4
+    assert stats["queue_depth_by_priority"] == {"high": 1, "normal": 2, "low": 1}
+    first.release()
+    await asyncio.gather(*tasks)
+    assert order == ["c", "b", "d", "a"]
+    stats = controller.collect()["m"]
+    assert stats["active"] == 0 and stats["admitted"] == 5 and stats["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_sheds_the_lowest_priority():
+    controller = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+    slot = await controller.acquire("m")
+    low = asyncio.ensure_future(controller.acquire("m", "low"))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException) as e:
+        await controller.acquire("m", "low")
+    assert e.value.status_code == 429
+    assert int(e.value.headers["Retry-After"]) >= 1
+
+    high = asyncio.ensure_future(controller.acquire("m", "high"))
+    await asyncio.sleep(0)
+    with pytest.raises(HTTPException):
+        await low
+    slot.release()
+    (await high).release()
+    stats = controller.collect()["m"]
+    assert stats["evicted"] == 1 and stats["rejected"] == 2 and stats["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_timeouts_and_early_shedding():
+    controller = AdmissionController(max_concurrency=1, queue_timeout=0.02)
+    slot = await controller.acquire("m")
+    with pytest.raises(HTTPException) as e:
+        await controller.acquire("m")
+    assert "timed out" in e.value.detail
+    # calls last longer than the timeout: the next one is shed without waiting
+    controller._queues["m"].service_time = 1.0
+    with pytest.raises(HTTPException) as e:
+        await asyncio.wait_for(controller.acquire("m"), 0.01)
+    assert "estimated wait" in e.value.detail
+    slot.release()
+    assert controller.collect()["m"]["timeouts"] == 1
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_leak_a_slot():
+    controller = AdmissionController(max_concurrency=1, queue_timeout=5)
+    slot = await controller.acquire("m")
+    waiter = asyncio.ensure_future(controller.acquire("m"))
+    await asyncio.sleep(0)
+    waiter.cancel()
+    await asyncio.gather(waiter, return_exceptions=True)
+    slot.release()
+    assert controller.collect()["m"]["active"] == 0
+    (await controller.acquire("m")).release()
+
+
+@pytest.mark.asyncio
+async def test_streams_hold_the_slot():
+    controller = AdmissionController(max_concurrency=1)
+    slot = await controller.acquire("m")
+    active = []
+
+    async def chunks():
+        yield b"a"
+        active.append(controller.collect()["m"]["active"])
+        yield b"b"
+
+    async def receive():
+        await asyncio.sleep(1)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        pass
+
+    response = StreamingResponse(chunks())
+    response.call_on_close(slot.release)
+    await response({"type": "http"}, receive, send)
+    assert active == [1]
+    assert controller.collect()["m"]["active"] == 0
+
+
+def test_request_priority():
+    def request(headers: dict):
+        return MagicMock(headers=headers)
+
+    with patch.object(admission, "ADMISSION_API_KEY_PRIORITIES", {"batch-key": "low"}):
+        assert admission.request_priority(request({"X-Priority": "HIGH"})) == "high"
+        assert admission.request_priority(request({"authorization": "Bearer batch-key"})) == "low"
+        assert admission.request_priority(request({"X-Priority": "urgent"})) == "normal"
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from api.json_fields import read_fields, replace_field, scan_fields
+
+
+def test_scan_fields_skips_nested_values():
+    body = json.dumps(
+        {
+            "messages": [{"role": "user", "content": [{"type": "text", "text": 'a "model": } ] \\ {'}]}],
+            "model": "gpt",
+            "temperature": 0.5,
+            "stream": True,
+        },
+        indent=2,
+    ).encode()
+    fields, spans = read_fields(body, ("model", "stream", "missing"))
+    assert fields == {"model": "gpt", "stream": True}
+    assert "missing" not in spans
+
+
+def test_scan_fields_last_key_wins():
+    body = b'{"model": "a", "model": "b"}'
+    assert read_fields(body, ["model"])[0] == {"model": "b"}
+
+
+@pytest.mark.parametrize("body", [b"[]", b'{"model": "a"', b'{"model" "a"}', b'{"a": [1, 2}', b'{"a": "b'])
+def test_scan_fields_rejects_invalid_documents(body):
+    with pytest.raises(ValueError):
+        scan_fields(body, ["model"])
+
+
+def test_replace_field_keeps_other_bytes():
+    body = b'{"stream":false,  "model" : "old",\n"n": 1}'
+    spans = scan_fields(body, ["model"])
+    result = replace_field(body, spans["model"], "publishers/new")
+    assert result == b'{"stream":false,  "model" : "publishers/new",\n"n": 1}'
+    assert json.loads(result)["model"] == "publishers/new"
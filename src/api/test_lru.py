@@ -0,0 +1,26 @@
+from api.lru import ByteLRUCache
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ByteLRUCache(max_bytes=10)
+    cache.put("a", "a", 4)
+    cache.put("b", "b", 4)
+    assert cache.get("a") == "a"
+    cache.put("c", "c", 4)
+    assert "b" not in cache
+    assert cache.get("a") == "a" and cache.get("c") == "c"
+    assert cache.bytes == 8
+    assert cache.evictions == 1
+
+
+def test_rejects_oversized_and_replaces_entries():
+    cache = ByteLRUCache(max_bytes=10)
+    assert not cache.put("big", "x", 11)
+    cache.put("a", "old", 6)
+    cache.put("a", "new", 3)
+    assert cache.get("a") == "new"
+    assert cache.bytes == 3
+    assert cache.pop("a") == "new"
+    assert cache.get("a") is None
+    stats = cache.collect()
+    assert stats["entries"] == 0 and stats["hits"] == 1 and stats["misses"] == 1
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from api.responses import StreamingResponse
+
+
+async def disconnect(receive_delay: float = 0):
+    await asyncio.sleep(receive_delay)
+    return {"type": "http.disconnect"}
+
+
+@pytest.mark.asyncio
+async def test_callbacks_run_when_the_body_is_never_iterated():
+    started, closed = [], []
+
+    async def body():
+        started.append(True)
+        yield b"a"
+
+    async def slow_send(message):
+        await asyncio.sleep(1)
+
+    async def aclose():
+        closed.append("async")
+
+    response = StreamingResponse(body())
+    response.call_on_close(lambda: closed.append("sync"))
+    response.call_on_close(aclose)
+    # the client is gone before the response starts
+    await response({"type": "http"}, disconnect, slow_send)
+    assert not started
+    assert closed == ["sync", "async"]
+    await response.close()
+    assert closed == ["sync", "async"]
+
+
+@pytest.mark.asyncio
+async def test_body_is_closed_when_the_client_disconnects():
+    closed = []
+
+    async def body():
+        try:
+            while True:
+                yield b"a"
+        finally:
+            closed.append("body")
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+        await asyncio.sleep(0.005)
+
+    response = StreamingResponse(body())
+    response.call_on_close(lambda: closed.append("callback"))
+    await response({"type": "http"}, lambda: disconnect(0.02), send)
+    assert len(sent) > 1
+    assert closed == ["body", "callback"]
+
+
+@pytest.mark.asyncio
+async def test_callback_errors_do_not_skip_the_others():
+    closed = []
+
+    def fail():
+        raise RuntimeError("boom")
+
+    async def send(message):
+        pass
+
+    async def body():
+        yield b"a"
+
+    response = StreamingResponse(body())
+    response.call_on_close(fail)
+    response.call_on_close(lambda: closed.append(True))
+    await response({"type": "http"}, lambda: disconnect(1), send)
+    assert closed
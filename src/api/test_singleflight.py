@@ -0,0 +1,184 @@
+import asyncio
+
+import pytest
+
+from api.singleflight import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def func():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": 1}
+
+    results = await asyncio.gather(*(flight.call("k", func) for _ in range(5)))
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    assert flight.collect() == {
+        "calls": 1,
+        "shared_calls": 4,
+        "streams": 0,
+        "shared_streams": 0,
+        "in_flight_calls": 0,
+        "in_flight_streams": 0,
+    }
+    # done calls are not shared
+    await flight.call("k", func)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_call_errors_reach_every_caller():
+    flight = SingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    results = await asyncio.gather(*(flight.call("k", func) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def func():
+        await asyncio.sleep(0.02)
+        return 1
+
+    first = asyncio.ensure_future(flight.call("k", func))
+    second = asyncio.ensure_future(flight.call("k", func))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == 1
+
+
+def items(*values, delay: float = 0.01):
+    async def gen():
+        for value in values:
+            await asyncio.sleep(delay)
+            yield value
+
+    return gen()
+
+
+@pytest.mark.asyncio
+async def test_stream_is_relayed_to_late_subscribers():
+    flight = SingleFlight()
+    opened = []
+
+    async def open_stream():
+        opened.append(1)
+        return "head", items(1, 2, 3)
+
+    async def consume(wait: float):
+        await asyncio.sleep(wait)
+        head, stream = await flight.stream("k", open_stream)
+        return head, [item async for item in stream]
+
+    results = await asyncio.gather(consume(0), consume(0.015), consume(0.025))
+    assert opened == [1]
+    assert results == [("head", [1, 2, 3])] * 3
+    assert flight.collect()["shared_streams"] == 2
+    assert flight.collect()["in_flight_streams"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_is_cancelled_once_all_subscribers_are_gone():
+    flight = SingleFlight()
+    closed = []
+
+    async def upstream():
+        try:
+            for i in range(100):
+                await asyncio.sleep(0.01)
+                yield i
+        finally:
+            closed.append(True)
+
+    async def open_stream():
+        return None, upstream()
+
+    _, first = await flight.stream("k", open_stream)
+    _, second = await flight.stream("k", open_stream)
+    assert await anext(first) == 0
+    assert await anext(second) == 0
+    await first.aclose()
+    assert await anext(second) == 1
+    assert not closed
+    await second.aclose()
+    await asyncio.sleep(0)
+    assert closed
+    assert flight.collect()["in_flight_streams"] == 0
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("leave", ["close", "drop"])
+async def test_subscribers_never_iterated_do_not_keep_the_stream(leave):
+    flight = SingleFlight()
+    closed = []
+
+    async def upstream():
+        try:
+            for i in range(100):
+                await asyncio.sleep(0.01)
+                yield i
+        finally:
+            closed.append(True)
+
+    async def open_stream():
+        return None, upstream()
+
+    _, first = await flight.stream("k", open_stream)
+    _, second = await flight.stream("k", open_stream)
+    assert await anext(first) == 0
+    await first.aclose()
+    # e.g. the client of the second subscriber disconnected before its first item
+    if leave == "close":
+        await second.aclose()
+    else:
+        del second
+    await asyncio.sleep(0)
+    assert closed
+    assert flight.collect()["in_flight_streams"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_errors_reach_every_subscriber():
+    flight = SingleFlight()
+
+    async def failing():
+        yield 1
+        await asyncio.sleep(0.01)
+        raise ValueError("broken")
+
+    async def open_stream():
+        return None, failing()
+
+    async def consume():
+        received = []
+        _, stream = await flight.stream("k", open_stream)
+        with pytest.raises(ValueError):
+            async for item in stream:
+                received.append(item)
+        return received
+
+    assert await asyncio.gather(consume(), consume()) == [[1], [1]]
+
+
+@pytest.mark.asyncio
+async def test_stream_open_errors_are_raised():
+    flight = SingleFlight()
+
+    async def open_stream():
+        await asyncio.sleep(0.01)
+        raise ValueError("refused")
+
+    results = await asyncio.gather(*(flight.stream("k", open_stream) for _ in range(2)), return_exceptions=True)
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flight.collect()["in_flight_streams"] == 0
@@ -0,0 +1,46 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+SRC_DIR = Path(__file__).resolve().parent.parent
+# Cumulative time allowed for `import api.app`, in milliseconds: measured at 1500-2400ms under
+# -X importtime on a single core, most of it in fastapi.openapi.models.
+IMPORT_BUDGET_MS = int(os.environ.get("IMPORT_BUDGET_MS", "2500"))
+
+
+def import_times(provider: str) -> dict[str, int]:
+    """Import api.app in a fresh interpreter and return the cumulative import time (us) per module."""
+    env = {**os.environ, "PROVIDER": provider, "AWS_ACCESS_KEY_ID": "x", "AWS_SECRET_ACCESS_KEY": "y"}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.app"],
+        cwd=SRC_DIR,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+    assert result.returncode == 0, result.stderr
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+@pytest.mark.parametrize("provider", ["aws", "gcp"])
+def test_import_budget(provider):
+    times = import_times(provider)
+    assert times["api.app"] / 1000 < IMPORT_BUDGET_MS
+
+
+def test_aws_import_is_provider_gated():
+    times = import_times("aws")
+    # Only needed for GCP or for token input, loaded lazily.
+    assert "api.routers.vertex" not in times
+    assert "google.auth" not in times
+    assert "tiktoken" not in times
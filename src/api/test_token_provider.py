@@ -0,0 +1,70 @@
+import asyncio
+import datetime
+import threading
+import time
+
+import pytest
+
+from api.token_provider import AccessTokenProvider
+
+
+class FakeCredentials:
+    def __init__(self, lifetime: float, delay: float = 0.05):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.token = None
+        self.expiry = None
+        self.refresh_count = 0
+        self.threads = set()
+
+    def refresh(self, request):
+        self.threads.add(threading.get_ident())
+        time.sleep(self.delay)
+        self.refresh_count += 1
+        self.token = f"token-{self.refresh_count}"
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        self.expiry = now + datetime.timedelta(seconds=self.lifetime)
+
+
+def make_provider(credentials) -> AccessTokenProvider:
+    provider = AccessTokenProvider(refresh_margin=60, refresh_ahead=300)
+    provider._load_credentials = lambda: credentials
+    return provider
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_refresh():
+    credentials = FakeCredentials(lifetime=3600)
+    provider = make_provider(credentials)
+    tokens = await asyncio.gather(*(provider.get_token() for _ in range(20)))
+    assert set(tokens) == {"token-1"}
+    assert credentials.refresh_count == 1
+    assert threading.get_ident() not in credentials.threads
+
+    # cached until shortly before expiry
+    assert await provider.get_token() == "token-1"
+    assert provider.collect()["refreshes"] == 1
+
+
+@pytest.mark.asyncio
+async def test_refreshes_ahead_of_expiry_in_background():
+    credentials = FakeCredentials(lifetime=120)
+    provider = make_provider(credentials)
+    assert await provider.get_token() == "token-1"
+    # Within refresh_ahead: served from cache while a refresh runs in the background.
+    assert await provider.get_token() == "token-1"
+    await asyncio.sleep(0.2)
+    assert credentials.refresh_count == 2
+    assert await provider.get_token() == "token-2"
+
+
+@pytest.mark.asyncio
+async def test_refresh_failure_is_raised_and_counted():
+    class FailingCredentials(FakeCredentials):
+        def refresh(self, request):
+            raise RuntimeError("metadata server unavailable")
+
+    provider = make_provider(FailingCredentials(lifetime=3600))
+    with pytest.raises(RuntimeError):
+        await provider.get_token()
+    assert provider.collect()["failures"] == 1
@@ -0,0 +1,116 @@
+import asyncio
+import datetime
+import logging
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+CLOUD_PLATFORM_SCOPE = "https://www.googleapis.com/auth/cloud-platform"
+
+
+class AccessTokenProvider:
+    """Cache a GCP access token and refresh it without blocking the event loop.
+
+    - A token is served from memory until `refresh_margin` seconds before it expires.
+    - Within `refresh_ahead` seconds of expiry, the cached token is still served and a
+      refresh is started in the background.
+    - Concurrent refreshes are coalesced into a single in-flight call, which runs the
+      blocking `credentials.refresh()` in a worker thread.
+    """
+
+    def __init__(self, scopes: list[str] | None = None, refresh_margin: float = 60, refresh_ahead: float = 300):
+        self.scopes = scopes or [CLOUD_PLATFORM_SCOPE]
+        self.refresh_margin = refresh_margin
+        self.refresh_ahead = refresh_ahead
+        self._credentials = None
+        self._refreshing: asyncio.Future | None = None
+        # statistics
+        self.refreshes = 0
+        self.failures = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def _load_credentials(self):
+        from google.auth import default
+
+        credentials, _ = default(scopes=self.scopes)
+        return credentials
+
+    def _refresh(self):
+        from google.auth.transport.requests import Request as AuthRequest
+
+        if self._credentials is None:
+            self._credentials = self._load_credentials()
+        self._credentials.refresh(AuthRequest())
+        return self._credentials.token
+
+    def prefetch(self):
+        """Fetch a first token synchronously, e.g. during app startup."""
+        start = time.perf_counter()
+        try:
+            self._refresh()
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Unable to fetch GCP access token: {e}")
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def _record(self, latency: float):
+        self.refreshes += 1
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+
+    def _expires_in(self) -> float:
+        """Seconds until the cached token expires, -1 if there is no token."""
+        if self._credentials is None or not self._credentials.token:
+            return -1
+        expiry = self._credentials.expiry
+        if expiry is None:
+            # No expiry reported, assume the token stays valid.
+            return float("inf")
+        # google-auth uses naive UTC datetimes.
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (expiry - now).total_seconds()
+
+    async def _run_refresh(self) -> str:
+        start = time.perf_counter()
+        try:
+            return await run_in_threadpool(self._refresh)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self._record(time.perf_counter() - start)
+
+    def refresh(self) -> asyncio.Future:
+        """Start a refresh, or join the one already in flight."""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._run_refresh())
+            # Background refresh errors are logged, waiters get them raised.
+            self._refreshing.add_done_callback(self._log_failure)
+        return self._refreshing
+
+    @staticmethod
+    def _log_failure(future: asyncio.Future):
+        if not future.cancelled() and future.exception():
+            logger.error(f"Unable to refresh GCP access token: {future.exception()}")
+
+    async def get_token(self) -> str:
+        expires_in = self._expires_in()
+        if expires_in > self.refresh_margin:
+            if expires_in < self.refresh_ahead:
+                self.refresh()
+            return self._credentials.token
+        return await asyncio.shield(self.refresh())
+
+    def collect(self) -> dict:
+        expires_in = self._expires_in()
+        return {
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "latency_avg_ms": self.latency_total / self.refreshes * 1000 if self.refreshes else 0.0,
+            "latency_max_ms": self.latency_max * 1000,
+            "expires_in_s": expires_in if expires_in != float("inf") else None,
+        }
@@ -0,0 +1,107 @@
+"""Throughput of Bedrock Converse calls: boto3 in a thread pool vs. the async httpx transport.
+
+A local stub endpoint (in a separate process) answers every Converse request after
+LATENCY seconds. With the thread pool, throughput is capped at roughly
+40 / LATENCY requests per second by Starlette's thread limiter; the async transport
+keeps scaling with the number of in-flight requests until the CPU saturates.
+
+Usage (from src/):
+    python -m benchmarks.bench_bedrock_transport [in-flight ...]
+"""
+
+import asyncio
+import json
+import multiprocessing
+import sys
+import time
+
+import boto3
+from botocore.config import Config
+
+from api.models.runtime import AsyncBedrockRuntime, BedrockRuntime
+
+LATENCY = 0.5
+REQUESTS_PER_CALLER = 4
+
+RESPONSE = json.dumps(
+    {
+        "output": {"message": {"role": "assistant", "content": [{"text": "pong"}]}},
+        "stopReason": "end_turn",
+        "usage": {"inputTokens": 1, "outputTokens": 1, "totalTokens": 2},
+        "metrics": {"latencyMs": int(LATENCY * 1000)},
+    }
+).encode()
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            await asyncio.sleep(LATENCY)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(RESPONSE)}\r\n\r\n".encode()
+                + RESPONSE
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve(port_queue: multiprocessing.Queue):
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def start_stub() -> int:
+    # Run the stub in its own process so that it does not compete for the GIL.
+    port_queue = multiprocessing.Queue()
+    multiprocessing.Process(target=serve, args=(port_queue,), daemon=True).start()
+    return port_queue.get()
+
+
+async def run(runtime: BedrockRuntime, in_flight: int) -> float:
+    async def caller():
+        for _ in range(REQUESTS_PER_CALLER):
+            await runtime.converse(modelId="stub", messages=[{"role": "user", "content": [{"text": "ping"}]}])
+
+    # warm up the connection pools
+    await asyncio.gather(*(runtime.converse(modelId="stub", messages=[]) for _ in range(in_flight)))
+    start = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(in_flight)))
+    elapsed = time.perf_counter() - start
+    await runtime.aclose()
+    return in_flight * REQUESTS_PER_CALLER / elapsed
+
+
+def main():
+    levels = [int(c) for c in sys.argv[1:]] or [10, 40, 100, 200]
+    port = start_stub()
+    client = boto3.client(
+        "bedrock-runtime",
+        region_name="us-west-2",
+        endpoint_url=f"http://127.0.0.1:{port}",
+        aws_access_key_id="AKID",
+        aws_secret_access_key="SECRET",
+        config=Config(retries={"max_attempts": 1}, max_pool_connections=max(levels)),
+    )
+    print(f"{'in-flight':>9} | {'threadpool req/s':>16} | {'async req/s':>11}")
+    for in_flight in levels:
+        threaded = asyncio.run(run(BedrockRuntime(client), in_flight))
+        native = asyncio.run(run(AsyncBedrockRuntime(client, max_connections=max(levels)), in_flight))
+        print(f"{in_flight:>9} | {threaded:>16.0f} | {native:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
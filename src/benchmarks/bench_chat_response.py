@@ -0,0 +1,79 @@
+"""CPU time per request of rendering non-streaming chat responses, FastAPI's path vs ORJSONResponse.
+
+The legacy path is what FastAPI does with a ChatResponse returned by the route: validate
+it again against the route's response_model (ChatResponse | ChatStreamResponse | Error)
+and encode it with JSONResponse (stdlib json). The new path, used by the route now,
+dumps the model once and renders it with orjson. Both produce the same bytes.
+
+(Embeddings responses are already written directly as bytes, see bench_embedding_encoding.)
+
+Usage (from src/):
+    python -m benchmarks.bench_chat_response
+"""
+
+import asyncio
+import time
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+
+from api.models.bedrock import BedrockModel
+from api.routers import chat
+from api.schema import ChatResponse
+
+ROUNDS = 200
+MODEL = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+MESSAGE_ID = "chatcmpl-5d5c3b8a"
+
+
+def responses(model: BedrockModel) -> dict[str, ChatResponse]:
+    # about 4 characters per token
+    long_text = "The quick brown fox jumps over the lazy dog, again. " * 650
+    tool_calls = [
+        {"toolUse": {"toolUseId": f"tooluse_{i}", "name": "search", "input": {"query": "fox " * 50, "page": i}}}
+        for i in range(64)
+    ]
+    return {
+        "small": model._create_response(MODEL, MESSAGE_ID, [{"text": "Hello! How can I help?"}], "end_turn", 12, 8),
+        "8k tokens": model._create_response(
+            MODEL,
+            MESSAGE_ID,
+            [{"reasoningContent": {"reasoningText": {"text": long_text[:4000]}}}, {"text": long_text}],
+            "end_turn",
+            1000,
+            8000,
+        ),
+        "64 tool calls": model._create_response(MODEL, MESSAGE_ID, tool_calls, "tool_use", 1000, 4000),
+    }
+
+
+async def legacy(chat_response: ChatResponse) -> bytes:
+    route = next(r for r in chat.router.routes if r.path == "/chat/completions")
+    content = await serialize_response(
+        field=route.response_field, response_content=chat_response, exclude_unset=True, is_coroutine=True
+    )
+    return JSONResponse(content).body
+
+
+async def fast(chat_response: ChatResponse) -> bytes:
+    return ORJSONResponse(chat_response.model_dump(exclude_unset=True)).body
+
+
+async def main():
+    print(f"CPU time per request, mean of {ROUNDS}")
+    print(f"{'response':>13} | {'bytes':>7} | {'legacy (us)':>11} | {'orjson (us)':>11} | {'speedup':>7}")
+    for name, chat_response in responses(BedrockModel()).items():
+        body = await legacy(chat_response)
+        assert body == await fast(chat_response)
+        timings = []
+        for render in (legacy, fast):
+            start = time.process_time()
+            for _ in range(ROUNDS):
+                await render(chat_response)
+            timings.append((time.process_time() - start) / ROUNDS * 1e6)
+        legacy_us, fast_us = timings
+        print(f"{name:>13} | {len(body):>7} | {legacy_us:>11.1f} | {fast_us:>11.1f} | {legacy_us / fast_us:>6.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""Wall time of a 10k-text Cohere embedding job versus the batch concurrency level.
+
+The texts are split into batches of at most 96 texts, and each InvokeModel call is
+answered by a simulated runtime after BASE_LATENCY + PER_TEXT_LATENCY * texts seconds,
+with DIMENSIONS-dimension vectors.
+
+Usage (from src/):
+    python -m benchmarks.bench_embedding_batches [concurrency ...]
+"""
+
+import asyncio
+import json
+import sys
+import time
+from unittest.mock import patch
+
+from api.models import bedrock
+from api.schema import EmbeddingsRequest
+
+TEXTS = 10_000
+BASE_LATENCY = 0.15
+PER_TEXT_LATENCY = 0.002
+DIMENSIONS = 256
+
+
+class SimulatedRuntime:
+    exceptions = None
+
+    async def invoke_model(self, body: str, **kwargs) -> dict:
+        texts = json.loads(body)["texts"]
+        await asyncio.sleep(BASE_LATENCY + PER_TEXT_LATENCY * len(texts))
+        return {"body": json.dumps({"embeddings": [[0.0123456789] * DIMENSIONS] * len(texts)}).encode()}
+
+
+async def run(concurrency: int) -> float:
+    request = EmbeddingsRequest(
+        model="cohere.embed-multilingual-v3",
+        input=[f"document {i}: lorem ipsum dolor sit amet" for i in range(TEXTS)],
+    )
+    with (
+        patch.object(bedrock, "get_runtime", return_value=SimulatedRuntime()),
+        patch.object(bedrock, "EMBEDDING_BATCH_CONCURRENCY", concurrency),
+        patch.object(bedrock, "get_embedding_cache", return_value=None),
+    ):
+        start = time.perf_counter()
+        response = await bedrock.CohereEmbeddingsModel().embed(request)
+        elapsed = time.perf_counter() - start
+    assert len(json.loads(response.body)["data"]) == TEXTS
+    return elapsed
+
+
+def main():
+    levels = [int(c) for c in sys.argv[1:]] or [1, 2, 4, 8, 16, 32, 64]
+    print(f"{TEXTS} texts in {-(-TEXTS // 96)} batches")
+    print(f"{'concurrency':>11} | {'wall time (s)':>13} | {'texts/s':>8}")
+    for concurrency in levels:
+        elapsed = asyncio.run(run(concurrency))
+        print(f"{concurrency:>11} | {elapsed:>13.2f} | {TEXTS / elapsed:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
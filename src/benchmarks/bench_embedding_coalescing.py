@@ -0,0 +1,88 @@
+"""Upstream calls and latency of many small concurrent embedding requests, with coalescing windows.
+
+CLIENTS clients each send Cohere embedding requests of 1 to 5 texts back to back for
+DURATION seconds. Each InvokeModel call is answered by a simulated runtime after
+BASE_LATENCY + PER_TEXT_LATENCY * texts seconds, with at most CONNECTIONS calls in flight
+(as the connection pool of a worker).
+
+Usage (from src/):
+    python -m benchmarks.bench_embedding_coalescing [window_ms ...]
+"""
+
+import asyncio
+import json
+import random
+import sys
+import time
+from unittest.mock import patch
+
+from api.models import bedrock
+from api.models.coalescing import EmbeddingCoalescer
+from api.schema import EmbeddingsRequest
+
+CLIENTS = 100
+DURATION = 5
+BASE_LATENCY = 0.05
+PER_TEXT_LATENCY = 0.0005
+CONNECTIONS = 20
+DIMENSIONS = 256
+
+
+class SimulatedRuntime:
+    exceptions = None
+
+    def __init__(self):
+        self.calls = 0
+        self.connections = asyncio.Semaphore(CONNECTIONS)
+
+    async def invoke_model(self, body: str, **kwargs) -> dict:
+        texts = json.loads(body)["texts"]
+        async with self.connections:
+            self.calls += 1
+            await asyncio.sleep(BASE_LATENCY + PER_TEXT_LATENCY * len(texts))
+        return {"body": json.dumps({"embeddings": [[0.0123456789] * DIMENSIONS] * len(texts)}).encode()}
+
+
+async def run(window_ms: float) -> tuple[int, list[float]]:
+    runtime = SimulatedRuntime()
+    coalescer = EmbeddingCoalescer(window=window_ms / 1000, max_items=96) if window_ms > 0 else None
+    model = bedrock.CohereEmbeddingsModel()
+    latencies = []
+    deadline = time.perf_counter() + DURATION
+
+    async def client(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            texts = [f"query {rng.random()}" for _ in range(rng.randint(1, 5))]
+            start = time.perf_counter()
+            await model.embed(EmbeddingsRequest(model="cohere.embed-english-v3", input=texts))
+            latencies.append(time.perf_counter() - start)
+
+    with (
+        patch.object(bedrock, "get_runtime", return_value=runtime),
+        patch.object(bedrock, "get_embedding_cache", return_value=None),
+        patch.object(bedrock, "embedding_coalescer", coalescer),
+        # isolate the upstream calls from the tokenizer (which may not be available offline)
+        patch.object(bedrock.CohereEmbeddingsModel, "_count_tokens", staticmethod(lambda texts: [0] * len(texts))),
+    ):
+        await asyncio.gather(*(client(i) for i in range(CLIENTS)))
+    return runtime.calls, latencies
+
+
+def main():
+    windows = [float(w) for w in sys.argv[1:]] or [0, 1, 2, 5, 10]
+    print(f"{CLIENTS} clients, {CONNECTIONS} upstream connections, {DURATION}s per window")
+    print(f"{'window (ms)':>11} | {'requests/s':>10} | {'upstream calls/s':>16} | {'p50 (ms)':>8} | {'p99 (ms)':>8}")
+    for window in windows:
+        calls, latencies = asyncio.run(run(window))
+        latencies = sorted(latency * 1000 for latency in latencies)
+        p50 = latencies[len(latencies) // 2]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        name = f"{window:g}" if window else "off"
+        print(
+            f"{name:>11} | {len(latencies) / DURATION:>10.0f} | {calls / DURATION:>16.0f} | {p50:>8.1f} | {p99:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Cost of serializing embedding responses, from the decoded model output to the HTTP body.
+
+The legacy path is the previous one: float32 round trip of every vector to Python lists,
+an Embedding pydantic model per vector (base64-encoding a fresh copy of each), then the
+serialization FastAPI applies to a response_model (model_dump + json.dumps). The new path
+stacks the vectors in one float32 matrix and writes the JSON directly from it.
+
+Usage (from src/):
+    python -m benchmarks.bench_embedding_encoding
+"""
+
+import base64
+import json
+import time
+
+import numpy as np
+
+from api.models.bedrock import BedrockEmbeddingsModel
+from api.schema import Embedding, EmbeddingsResponse, EmbeddingsUsage
+
+DIMENSIONS = 1024
+ROUNDS = 5
+MODEL = "cohere.embed-multilingual-v3"
+
+
+def legacy(results: list[tuple[list[float], int]], encoding_format: str) -> bytes:
+    embeddings = [np.asarray(embedding, dtype=np.float32).tolist() for embedding, _ in results]
+    data = []
+    for i, embedding in enumerate(embeddings):
+        if encoding_format == "base64":
+            encoded_embedding = base64.b64encode(np.array(embedding, dtype=np.float32).tobytes())
+            data.append(Embedding(index=i, embedding=encoded_embedding))
+        else:
+            data.append(Embedding(index=i, embedding=embedding))
+    response = EmbeddingsResponse(data=data, model=MODEL, usage=EmbeddingsUsage(prompt_tokens=0, total_tokens=0))
+    # as fastapi.responses.JSONResponse.render
+    return json.dumps(
+        response.model_dump(mode="json"), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def direct(results: list[tuple[list[float], int]], encoding_format: str) -> bytes:
+    model = BedrockEmbeddingsModel()
+    return model._create_response(model._to_matrix(results), MODEL, encoding_format=encoding_format).body
+
+
+def timed(func, results, encoding_format: str) -> tuple[float, int]:
+    total = 0.0
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        body = func(results, encoding_format)
+        total += time.perf_counter() - start
+    return total / ROUNDS, len(body)
+
+
+def main():
+    rng = np.random.default_rng(0)
+    print(
+        f"{'vectors':>7} | {'format':>6} | {'legacy (ms)':>11} | {'direct (ms)':>11} | {'speedup':>7} | {'body (KB)':>9}"
+    )
+    for vectors in (96, 1000):
+        results = [(row.tolist(), 0) for row in rng.standard_normal((vectors, DIMENSIONS))]
+        for encoding_format in ("float", "base64"):
+            legacy_time, _ = timed(legacy, results, encoding_format)
+            direct_time, size = timed(direct, results, encoding_format)
+            print(
+                f"{vectors:>7} | {encoding_format:>6} | {legacy_time * 1000:>11.1f} | {direct_time * 1000:>11.1f}"
+                f" | {legacy_time / direct_time:>6.1f}x | {size / 1024:>9.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Chat time-to-first-token while the same worker serves bulk embedding traffic.
+
+Chat streams are simulated on the event loop: each one starts every CHAT_INTERVAL seconds
+and its first token arrives FIRST_TOKEN_LATENCY seconds later, so any extra delay comes
+from the event loop being blocked. Meanwhile EMBEDDING_CALLERS callers send Cohere
+embedding requests of BATCH texts to a local stub endpoint (in a separate process) that
+answers after EMBEDDING_LATENCY seconds with 1024-dimension vectors.
+
+The legacy path is the previous synchronous embed(): invoke_model, body read and JSON
+decoding on the event loop.
+
+Usage (from src/):
+    python -m benchmarks.bench_embeddings_mixed
+"""
+
+import asyncio
+import json
+import multiprocessing
+import statistics
+import time
+from unittest.mock import patch
+
+import boto3
+from botocore.config import Config
+
+from api.models import bedrock
+from api.models.runtime import AsyncBedrockRuntime, BedrockRuntime
+from api.schema import EmbeddingsRequest
+
+CHAT_STREAMS = 100
+CHAT_INTERVAL = 0.02
+FIRST_TOKEN_LATENCY = 0.05
+EMBEDDING_CALLERS = 8
+EMBEDDING_LATENCY = 0.2
+BATCH = 32
+
+RESPONSE = json.dumps({"embeddings": [[0.0123456789] * 1024 for _ in range(BATCH)]}).encode()
+
+
+async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            length = 0
+            for line in head.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            await reader.readexactly(length)
+            await asyncio.sleep(EMBEDDING_LATENCY)
+            writer.write(
+                b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                + f"Content-Length: {len(RESPONSE)}\r\n\r\n".encode()
+                + RESPONSE
+            )
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve(port_queue: multiprocessing.Queue):
+    async def main():
+        server = await asyncio.start_server(handle, "127.0.0.1", 0, backlog=1024)
+        port_queue.put(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(main())
+
+
+def start_stub() -> int:
+    port_queue = multiprocessing.Queue()
+    multiprocessing.Process(target=serve, args=(port_queue,), daemon=True).start()
+    return port_queue.get()
+
+
+class LegacyCohereEmbeddingsModel(bedrock.CohereEmbeddingsModel):
+    """The previous implementation, blocking the event loop for the whole call."""
+
+    def __init__(self, client):
+        self.client = client
+
+    async def embed(self, embeddings_request: EmbeddingsRequest):
+        args = self._parse_args(embeddings_request, embeddings_request.input)
+        response = self.client.invoke_model(
+            body=json.dumps(args), modelId=embeddings_request.model, accept=self.accept, contentType=self.content_type
+        )
+        response_body = json.loads(response.get("body").read())
+        return self._create_response(embeddings=response_body["embeddings"], model=embeddings_request.model)
+
+
+async def chat_stream() -> float:
+    start = time.perf_counter()
+    await asyncio.sleep(FIRST_TOKEN_LATENCY)
+    return time.perf_counter() - start
+
+
+async def run(model) -> tuple[list[float], int]:
+    request = EmbeddingsRequest(model="cohere.embed-multilingual-v3", input=["lorem ipsum"] * BATCH)
+    running = True
+    embeddings = 0
+
+    async def embedder():
+        nonlocal embeddings
+        while running:
+            await model.embed(request)
+            embeddings += 1
+            # as between two HTTP requests, the legacy embed() never yields otherwise
+            await asyncio.sleep(0)
+
+    async def chats():
+        tasks = []
+        for _ in range(CHAT_STREAMS):
+            tasks.append(asyncio.create_task(chat_stream()))
+            await asyncio.sleep(CHAT_INTERVAL)
+        return await asyncio.gather(*tasks)
+
+    embedders = [asyncio.create_task(embedder()) for _ in range(EMBEDDING_CALLERS if model else 0)]
+    ttfts = await chats()
+    running = False
+    await asyncio.gather(*embedders)
+    return ttfts, embeddings
+
+
+def report(name: str, ttfts: list[float], embeddings: int):
+    ttfts = sorted(t * 1000 for t in ttfts)
+    p99 = ttfts[int(len(ttfts) * 0.99) - 1]
+    print(f"{name:>18} | {statistics.median(ttfts):>13.1f} | {p99:>13.1f} | {ttfts[-1]:>13.1f} | {embeddings:>10}")
+
+
+def main():
+    port = start_stub()
+    client = boto3.client(
+        "bedrock-runtime",
+        region_name="us-west-2",
+        endpoint_url=f"http://127.0.0.1:{port}",
+        aws_access_key_id="AKID",
+        aws_secret_access_key="SECRET",
+        config=Config(retries={"max_attempts": 1}, max_pool_connections=EMBEDDING_CALLERS),
+    )
+    print(
+        f"{'embeddings':>18} | {'TTFT p50 (ms)':>13} | {'TTFT p99 (ms)':>13} | {'TTFT max (ms)':>13} | {'embed calls':>10}"
+    )
+    report("none", *asyncio.run(run(None)))
+    report("legacy (blocking)", *asyncio.run(run(LegacyCohereEmbeddingsModel(client))))
+    for name, runtime in (
+        ("async (threadpool)", BedrockRuntime(client)),
+        ("async (httpx)", AsyncBedrockRuntime(client)),
+    ):
+        with (
+            patch.object(bedrock, "get_runtime", return_value=runtime),
+            patch.object(bedrock, "get_embedding_cache", return_value=None),
+        ):
+            report(name, *asyncio.run(run(bedrock.CohereEmbeddingsModel())))
+
+
+if __name__ == "__main__":
+    main()
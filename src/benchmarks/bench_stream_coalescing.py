@@ -0,0 +1,96 @@
+"""Socket writes and CPU per generated token of chat streams, with text delta coalescing windows.
+
+STREAMS concurrent chat streams each receive TOKENS text deltas of a few characters from a
+simulated ConverseStream, one every TOKEN_INTERVAL seconds, then a stop and usage metadata.
+Every frame of BedrockModel.chat_stream is written to a socket with its own send() call,
+as an ASGI server does for each `http.response.body` message, and a thread drains the
+other end.
+
+Usage (from src/):
+    python -m benchmarks.bench_stream_coalescing [window_ms ...]
+"""
+
+import asyncio
+import random
+import socket
+import sys
+import threading
+import time
+from unittest.mock import patch
+
+from api.models.bedrock import BedrockModel
+from api.schema import ChatRequest
+
+STREAMS = 20
+TOKENS = 500
+TOKEN_INTERVAL = 0.002
+MAX_BYTES = 512
+WORDS = ["The", " quick", " brown", " fox", " jump", "s", " over", " the", " la", "zy", " dog", ".", "\n"]
+
+
+async def converse_stream(seed: int):
+    rng = random.Random(seed)
+    yield {"messageStart": {"role": "assistant"}}
+    for _ in range(TOKENS):
+        await asyncio.sleep(TOKEN_INTERVAL)
+        yield {"contentBlockDelta": {"delta": {"text": rng.choice(WORDS)}, "contentBlockIndex": 0}}
+    yield {"contentBlockStop": {"contentBlockIndex": 0}}
+    yield {"messageStop": {"stopReason": "end_turn"}}
+    yield {"metadata": {"usage": {"inputTokens": 10, "outputTokens": TOKENS, "totalTokens": TOKENS + 10}}}
+
+
+def drain(sock: socket.socket):
+    while sock.recv(1 << 16):
+        pass
+
+
+async def run(window_ms: float) -> tuple[int, float, float]:
+    writer, reader = socket.socketpair()
+    writer.setblocking(False)
+    drainer = threading.Thread(target=drain, args=(reader,), daemon=True)
+    drainer.start()
+    sends = 0
+
+    async def stream(seed: int):
+        nonlocal sends
+        request = ChatRequest(
+            model="model-x",
+            messages=[{"role": "user", "content": "Hi"}],
+            stream=True,
+            stream_options={"include_usage": True, "coalesce_ms": window_ms, "coalesce_bytes": MAX_BYTES},
+        )
+        async for frame in BedrockModel().chat_stream(request):
+            while True:
+                try:
+                    writer.send(frame)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(0)
+            sends += 1
+
+    async def invoke(self, chat_request, stream=False):
+        return {"stream": converse_stream(random.random())}
+
+    with patch.object(BedrockModel, "_invoke_bedrock", invoke):
+        start, cpu_start = time.perf_counter(), time.process_time()
+        await asyncio.gather(*(stream(i) for i in range(STREAMS)))
+        elapsed, cpu = time.perf_counter() - start, time.process_time() - cpu_start
+    writer.close()
+    drainer.join()
+    reader.close()
+    return sends, cpu, elapsed
+
+
+def main():
+    windows = [float(w) for w in sys.argv[1:]] or [0, 5, 20, 50]
+    tokens = STREAMS * TOKENS
+    print(f"{STREAMS} streams of {TOKENS} deltas every {TOKEN_INTERVAL * 1000:g}ms, {MAX_BYTES} bytes budget")
+    print(f"{'window (ms)':>11} | {'send()/token':>12} | {'CPU/token (us)':>14} | {'wall (s)':>8}")
+    for window in windows:
+        sends, cpu, elapsed = asyncio.run(run(window))
+        name = f"{window:g}" if window else "off"
+        print(f"{name:>11} | {sends / tokens:>12.3f} | {cpu / tokens * 1e6:>14.1f} | {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Per-worker concurrent stream capacity: legacy on-loop iteration vs. the stream pump.
+
+Each simulated Bedrock stream yields CHUNKS events, each taking READ_DELAY seconds of
+blocking network read, as a botocore EventStream would.
+
+Usage (from src/):
+    python -m benchmarks.bench_stream_pump [concurrency ...]
+"""
+
+import asyncio
+import sys
+import time
+
+from starlette.concurrency import run_in_threadpool
+
+from api.models.stream import pump_stream
+
+CHUNKS = 20
+READ_DELAY = 0.005
+
+
+def blocking_stream():
+    for i in range(CHUNKS):
+        time.sleep(READ_DELAY)
+        yield {"contentBlockDelta": {"delta": {"text": str(i)}}}
+
+
+async def legacy_iterate(stream):
+    # The previous BedrockModel._async_iterate implementation.
+    for chunk in stream:
+        await run_in_threadpool(lambda: chunk)
+        yield chunk
+
+
+async def consume(iterate) -> float:
+    start = time.perf_counter()
+    ttft = None
+    async for _ in iterate(blocking_stream()):
+        if ttft is None:
+            ttft = time.perf_counter() - start
+    return ttft
+
+
+async def run(iterate, concurrency: int) -> tuple[float, float]:
+    start = time.perf_counter()
+    ttfts = await asyncio.gather(*(consume(iterate) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return concurrency / elapsed, sum(ttfts) / len(ttfts)
+
+
+def main():
+    levels = [int(c) for c in sys.argv[1:]] or [10, 50, 200]
+    print(f"{'concurrency':>11} | {'impl':>6} | {'streams/s':>10} | {'mean TTFT (ms)':>14}")
+    for concurrency in levels:
+        for name, iterate in (("legacy", legacy_iterate), ("pump", pump_stream)):
+            rate, ttft = asyncio.run(run(iterate, concurrency))
+            print(f"{concurrency:>11} | {name:>6} | {rate:>10.1f} | {ttft * 1000:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Chat stream frames serialized per second on one core, pydantic path vs ChunkSerializer.
+
+Serializes a stream of TOKENS text deltas (a few characters each, as Bedrock sends them)
+into SSE frames, REPEAT times, on a single thread.
+
+Usage (from src/):
+    python -m benchmarks.bench_stream_serializer
+"""
+
+import random
+import time
+
+from api.models.bedrock import BedrockModel
+from api.models.sse import ChunkSerializer
+
+TOKENS = 10_000
+REPEAT = 5
+MODEL = "anthropic.claude-3-5-sonnet-20241022-v2:0"
+MESSAGE_ID = "chatcmpl-5d5c3b8a"
+
+
+def events() -> list[dict]:
+    rng = random.Random(0)
+    words = ["the", " model", " answer", "s", " quickly", ",", " é", "\n", ' "quoted"', " 42"]
+    return [
+        {"contentBlockDelta": {"delta": {"text": rng.choice(words)}, "contentBlockIndex": 0}} for _ in range(TOKENS)
+    ]
+
+
+def pydantic_path(model: BedrockModel, chunks: list[dict]) -> int:
+    size = 0
+    for chunk in chunks:
+        stream_response = model._create_response_stream(model_id=MODEL, message_id=MESSAGE_ID, chunk=chunk)
+        size += len(model.stream_response_to_bytes(stream_response))
+    return size
+
+
+def fast_path(model: BedrockModel, chunks: list[dict]) -> int:
+    serializer = ChunkSerializer(MESSAGE_ID, MODEL, model._convert_finish_reason)
+    size = 0
+    for chunk in chunks:
+        size += len(serializer.serialize(chunk))
+    return size
+
+
+def main():
+    model = BedrockModel()
+    chunks = events()
+    print(f"{TOKENS} text deltas, best of {REPEAT}, one core")
+    print(f"{'path':>8} | {'tokens/s':>10} | {'us/token':>8} | {'bytes':>9}")
+    for name, path in [("pydantic", pydantic_path), ("fast", fast_path)]:
+        best = float("inf")
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            size = path(model, chunks)
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:>8} | {TOKENS / best:>10.0f} | {best / TOKENS * 1e6:>8.2f} | {size:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Cost of translating chat requests to the Bedrock Converse format.
+
+Part 1 times BedrockModel._build_request against the transcript length (turns, each with a
+tool call) and the number of inline data-URL images (IMAGE_SIZE bytes each, cold cache).
+
+Part 2 runs CONCURRENCY translations of a large transcript alongside a ticker task and
+reports the worst event loop stall, translating inline vs. in the thread or process pool.
+
+Usage (from src/):
+    python -m benchmarks.bench_translation
+"""
+
+import asyncio
+import base64
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from api.models import translation
+from api.models.bedrock import BedrockModel, image_fetcher
+from api.schema import ChatRequest
+
+IMAGE_SIZE = 256 * 1024
+CONCURRENCY = 8
+ROUNDS = 5
+
+
+def make_request(turns: int, images: int) -> ChatRequest:
+    image_url = "data:image/png;base64," + base64.b64encode(os.urandom(IMAGE_SIZE)).decode()
+    messages = [{"role": "system", "content": "You are a helpful agent."}]
+    for i in range(turns):
+        content = [{"type": "text", "text": f"Step {i}: " + "lorem ipsum " * 40}]
+        if i < images:
+            # a distinct image per turn
+            content.append({"type": "image_url", "image_url": {"url": image_url + "A" * 4 * (i + 1)}})
+        messages.append({"role": "user", "content": content})
+        arguments = json.dumps({"query": "lorem ipsum " * 20, "step": i})
+        messages.append(
+            {
+                "role": "assistant",
+                "content": "",
+                "tool_calls": [
+                    {"id": f"call_{i}", "type": "function", "function": {"name": "search", "arguments": arguments}}
+                ],
+            }
+        )
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": "result " * 50})
+    messages.append({"role": "user", "content": "Summarize."})
+    return ChatRequest(model="anthropic.claude-3-sonnet-20240229-v1:0", messages=messages)
+
+
+def build(chat_request: ChatRequest) -> dict:
+    return BedrockModel()._build_request(chat_request, {})
+
+
+def time_build(chat_request: ChatRequest) -> float:
+    total = 0.0
+    for _ in range(ROUNDS):
+        image_fetcher.data_urls.clear()
+        start = time.perf_counter()
+        build(chat_request)
+        total += time.perf_counter() - start
+    return total / ROUNDS
+
+
+async def max_stall(chat_request: ChatRequest, executor) -> tuple[float, float]:
+    stall = 0.0
+    running = True
+
+    async def ticker():
+        nonlocal stall
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            stall = max(stall, time.perf_counter() - start - 0.001)
+
+    async def translate():
+        if executor is None:
+            return build(chat_request)
+        return await asyncio.get_running_loop().run_in_executor(executor, build, chat_request)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    start = time.perf_counter()
+    await asyncio.gather(*(translate() for _ in range(CONCURRENCY)))
+    elapsed = time.perf_counter() - start
+    running = False
+    await task
+    return stall, elapsed
+
+
+def main():
+    print(f"{'turns':>5} | {'images':>6} | {'payload (KB)':>12} | {'translate (ms)':>14}")
+    for turns, images in ((10, 0), (100, 0), (500, 0), (10, 4), (10, 16), (100, 16)):
+        chat_request = make_request(turns, images)
+        size = translation.estimate_size(chat_request)
+        print(f"{turns:>5} | {images:>6} | {size / 1024:>12.0f} | {time_build(chat_request) * 1000:>14.2f}")
+
+    chat_request = make_request(500, 0)
+    print(f"\n{CONCURRENCY} concurrent translations of 500 turns")
+    print(f"{'executor':>9} | {'max loop stall (ms)':>19} | {'total (ms)':>10}")
+    executors = (
+        ("inline", None),
+        ("thread x1", ThreadPoolExecutor(max_workers=1)),
+        ("thread x4", ThreadPoolExecutor(max_workers=4)),
+        ("process", ProcessPoolExecutor(max_workers=4)),
+    )
+    for name, executor in executors:
+        if executor is not None:
+            # warm the workers up
+            list(executor.map(build, [chat_request] * 4))
+        stall, elapsed = asyncio.run(max_stall(chat_request, executor))
+        print(f"{name:>9} | {stall * 1000:>19.1f} | {elapsed * 1000:>10.1f}")
+        if executor is not None:
+            executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""CPU time and peak memory of preparing a Vertex proxy request body.
+
+Compares the previous full round trip (`json.loads` + `json.dumps`) with forwarding the
+original bytes and with the targeted `model` rewrite, on multimodal request bodies made
+of a base64 image.
+
+Usage (from src/):
+    python -m benchmarks.bench_vertex_body [size_mb ...]
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+from api.json_fields import read_fields, replace_field
+
+ROUNDS = 5
+MODEL = "publishers/google/models/gemini-2.0-flash"
+
+
+def make_body(size: int) -> bytes:
+    image = base64.b64encode(os.urandom(size * 3 // 4)).decode()
+    return json.dumps(
+        {
+            "model": MODEL,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Describe the image."},
+                        {"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}},
+                    ],
+                }
+            ],
+            "stream": True,
+        }
+    ).encode()
+
+
+def round_trip(body: bytes) -> bytes:
+    content_json = json.loads(body)
+    content_json["model"] = "google/gemini-2.0-flash"
+    return json.dumps(content_json).encode()
+
+
+def forward(body: bytes) -> bytes:
+    read_fields(body, ("model", "stream", "stream_options"))
+    return body
+
+
+def rewrite(body: bytes) -> bytes:
+    _, spans = read_fields(body, ("model", "stream", "stream_options"))
+    return replace_field(body, spans["model"], "google/gemini-2.0-flash")
+
+
+def measure(prepare, body: bytes) -> tuple[float, float]:
+    start = time.process_time()
+    for _ in range(ROUNDS):
+        prepare(body)
+    cpu = (time.process_time() - start) / ROUNDS
+
+    tracemalloc.start()
+    prepare(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def main():
+    sizes = [float(s) for s in sys.argv[1:]] or [1, 10]
+    print(f"{'body':>6} | {'impl':>10} | {'CPU (ms)':>9} | {'peak extra (MB)':>15}")
+    for size_mb in sizes:
+        body = make_body(int(size_mb * 1024 * 1024))
+        for name, prepare in (("round-trip", round_trip), ("forward", forward), ("rewrite", rewrite)):
+            cpu, peak = measure(prepare, body)
+            print(f"{size_mb:>4g}MB | {name:>10} | {cpu * 1000:>9.2f} | {peak / 1024 / 1024:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()